@@ -22,6 +22,7 @@ import collections
 import itertools
 import urlparse
 
+from oslo.config import cfg
 from stevedore import extension
 
 from ceilometer.openstack.common import context
@@ -135,11 +136,50 @@ class AgentManager(os_service.Service):
 
     def start(self):
         self.pipeline_manager = pipeline.setup_pipeline()
-
-        for interval, task in self.setup_polling_tasks().iteritems():
+        self.polling_tasks = {}
+        self.polling_timers = {}
+        self.update_polling_tasks(self.setup_polling_tasks())
+
+        if cfg.CONF.refresh_pipeline_cfg:
+            self.tg.add_timer(cfg.CONF.pipeline_polling_interval,
+                              self.refresh_pipeline)
+        if cfg.CONF.pipeline_stats_interval > 0:
+            self.tg.add_timer(cfg.CONF.pipeline_stats_interval,
+                              self.log_pipeline_stats)
+
+    def update_polling_tasks(self, polling_tasks):
+        """Switch to new polling tasks.
+
+        The timers of the intervals which are still polled are kept and
+        pick up the new task on their next run, so only the timers of
+        the intervals added or removed are re-created.
+        """
+        for interval in set(self.polling_timers) - set(polling_tasks):
+            timer = self.polling_timers.pop(interval)
+            timer.stop()
+            if timer in self.tg.timers:
+                self.tg.timers.remove(timer)
+        self.polling_tasks = polling_tasks
+        for interval in set(polling_tasks) - set(self.polling_timers):
             self.tg.add_timer(interval,
-                              self.interval_task,
-                              task=task)
+                              self.polling_task_for,
+                              interval=interval)
+            self.polling_timers[interval] = self.tg.timers[-1]
+
+    def polling_task_for(self, interval):
+        task = self.polling_tasks.get(interval)
+        if task:
+            self.interval_task(task)
+
+    def refresh_pipeline(self):
+        """Swap in the pipeline config file if it changed."""
+        pipeline_manager = pipeline.reload_pipeline(self.pipeline_manager)
+        if pipeline_manager:
+            self.pipeline_manager = pipeline_manager
+            self.update_polling_tasks(self.setup_polling_tasks())
+
+    def log_pipeline_stats(self):
+        self.pipeline_manager.log_stats()
 
     @staticmethod
     def interval_task(task):
@@ -42,6 +42,7 @@ from ceilometer.openstack.common import importutils
 from ceilometer.openstack.common import service as os_service
 from ceilometer.openstack.common import timeutils
 from ceilometer import pipeline
+from ceilometer.publisher import file as file_publisher
 from ceilometer import sample
 from ceilometer import service
 from ceilometer import storage
@@ -108,6 +109,37 @@ def collector_service():
     launcher.wait()
 
 
+def import_samples():
+    cfg.CONF.register_cli_opts([
+        cfg.MultiStrOpt('file',
+                        short='f',
+                        help='File written by the file publisher with the '
+                        'json or msgpack format, can be repeated.',
+                        required=True),
+        cfg.IntOpt('batch-size',
+                   help='Number of samples dispatched at once.',
+                   default=1000),
+    ])
+
+    service.prepare_service()
+    dispatcher_manager = service.load_dispatcher_manager()
+
+    for path in cfg.CONF.file:
+        count = 0
+        batch = []
+        for message in file_publisher.read_meter_messages(path):
+            batch.append(message)
+            if len(batch) >= cfg.CONF.batch_size:
+                dispatcher_manager.map_method('record_metering_data', batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            dispatcher_manager.map_method('record_metering_data', batch)
+            count += len(batch)
+        LOG.info(_("Imported %(count)d samples from %(path)s") %
+                 {'count': count, 'path': path})
+
+
 def storage_dbsync():
     service.prepare_service()
     storage.get_connection(cfg.CONF).upgrade()
@@ -17,7 +17,11 @@
 # under the License.
 
 import socket
+import sys
 
+import eventlet
+from eventlet import greenpool
+from eventlet import queue
 import msgpack
 from oslo.config import cfg
 
@@ -26,6 +30,7 @@ from ceilometer.openstack.common import log
 from ceilometer.openstack.common.rpc import dispatcher as rpc_dispatcher
 from ceilometer.openstack.common.rpc import service as rpc_service
 from ceilometer.openstack.common import units
+from ceilometer.publisher import utils as publisher_utils
 from ceilometer import service
 
 OPTS = [
@@ -36,6 +41,38 @@ OPTS = [
     cfg.IntOpt('udp_port',
                default=4952,
                help='Port to which the UDP socket is bound.'),
+    cfg.BoolOpt('udp_reuse_port',
+                default=False,
+                help='Bind the UDP socket with SO_REUSEPORT, so that each '
+                'collector worker receives its share of the datagrams.'),
+    cfg.IntOpt('udp_burst_size',
+               default=64,
+               help='Number of datagrams received in a row before letting '
+               'the received samples be dispatched.'),
+    cfg.IntOpt('udp_queue_size',
+               default=10000,
+               help='Maximum number of samples received over UDP waiting '
+               'to be dispatched, the samples received while it is full '
+               'are dropped. 0 means no limit.'),
+    cfg.IntOpt('udp_batch_size',
+               default=100,
+               help='Maximum number of samples received over UDP '
+               'dispatched at once.'),
+    cfg.IntOpt('dispatch_buffer_size',
+               default=0,
+               help='Number of samples received over RPC accumulated '
+               'before being dispatched as one batch, in the background. '
+               'The messages are then acknowledged before their samples '
+               'are stored. 0 dispatches each message as it is received.'),
+    cfg.IntOpt('dispatch_buffer_timeout',
+               default=1000,
+               help='Maximum number of milliseconds the samples received '
+               'over RPC are buffered for before being dispatched.'),
+    cfg.IntOpt('dispatch_max_in_flight',
+               default=4,
+               help='Maximum number of buffered batches of samples '
+               'dispatched concurrently, the RPC messages are not consumed '
+               'while that many are being dispatched.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="collector")
@@ -46,46 +83,175 @@ cfg.CONF.import_opt('metering_topic', 'ceilometer.publisher.rpc',
 
 LOG = log.getLogger(__name__)
 
+# Python 2 doesn't define it on Linux, where it is available since 3.9
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT',
+                       15 if sys.platform.startswith('linux') else None)
+
+
+class DispatchBuffer(object):
+    """Write-behind buffer of the samples to dispatch.
+
+    The samples are accumulated across the calls to add() and handed to
+    the dispatchers in the background, by batches of max_samples, or with
+    whatever is pending when flush() is called. Up to max_in_flight
+    batches are dispatched concurrently, add() and flush() wait while
+    that many are being dispatched.
+    """
+
+    def __init__(self, dispatch, max_samples, max_in_flight):
+        self.dispatch = dispatch
+        self.max_samples = max_samples
+        self.pool = greenpool.GreenPool(max_in_flight)
+        self.pending = []
+
+    def add(self, samples):
+        self.pending.extend(samples)
+        while len(self.pending) >= self.max_samples:
+            batch = self.pending[:self.max_samples]
+            del self.pending[:self.max_samples]
+            self._spawn(batch)
+
+    def flush(self):
+        if self.pending:
+            batch, self.pending = self.pending, []
+            self._spawn(batch)
+
+    def drain(self):
+        """Dispatch the pending samples and wait for all the batches."""
+        self.flush()
+        self.pool.waitall()
+
+    def _spawn(self, batch):
+        # the batch is set aside before waiting for a free slot, as other
+        # green threads keep adding samples in the meantime
+        try:
+            self.pool.spawn_n(self._dispatch, batch)
+        except BaseException:
+            # killed while waiting, such as on shutdown, keep the samples
+            # for drain()
+            self.pending[:0] = batch
+            raise
+
+    def _dispatch(self, batch):
+        try:
+            self.dispatch(batch)
+        except Exception:
+            LOG.exception(_("Unable to dispatch %d samples"), len(batch))
+
 
 class CollectorService(service.DispatchedService, rpc_service.Service):
     """Listener for the collector service."""
 
+    dispatch_buffer = None
+    udp_queue = None
+
     def start(self):
         """Bind the UDP socket and handle incoming data."""
-        if cfg.CONF.collector.udp_address:
+        conf = cfg.CONF.collector
+        if conf.dispatch_buffer_size > 0:
+            self.dispatch_buffer = DispatchBuffer(
+                self._dispatch_samples, conf.dispatch_buffer_size,
+                conf.dispatch_max_in_flight)
+            self.tg.add_timer(conf.dispatch_buffer_timeout / 1000.0,
+                              self.dispatch_buffer.flush)
+        if conf.udp_address:
             self.tg.add_thread(self.start_udp)
         if cfg.CONF.rpc_backend:
             super(CollectorService, self).start()
-            if not cfg.CONF.collector.udp_address:
+            if not conf.udp_address:
                 # Add a dummy thread to have wait() working
                 self.tg.add_timer(604800, lambda: None)
 
     def start_udp(self):
+        conf = cfg.CONF.collector
         udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        udp.bind((cfg.CONF.collector.udp_address,
-                  cfg.CONF.collector.udp_port))
+        if conf.udp_reuse_port:
+            if SO_REUSEPORT is None:
+                LOG.warn(_("UDP: SO_REUSEPORT is not supported"))
+            else:
+                udp.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        udp.bind((conf.udp_address, conf.udp_port))
+
+        # The samples are dispatched by another thread, so that the
+        # socket keeps being drained while they are stored
+        self.udp_queue = queue.LightQueue(conf.udp_queue_size or None)
+        self.tg.add_thread(self._dispatch_udp)
 
         self.udp_run = True
+        received = 0
         while self.udp_run:
             # NOTE(jd) Arbitrary limit of 64K because that ought to be
             # enough for anybody.
             data, source = udp.recvfrom(64 * units.Ki)
+            self._queue_udp(data, source)
+            # The green socket only yields when there is nothing left to
+            # receive, let the samples be dispatched during long bursts
+            received += 1
+            if received >= conf.udp_burst_size:
+                received = 0
+                eventlet.sleep(0)
+
+        # Store the samples of a datagram received while stopping
+        self._dispatch_udp(block=False)
+
+    def _queue_udp(self, data, source):
+        try:
+            sample = msgpack.loads(data)
+        except Exception:
+            LOG.warn(_("UDP: Cannot decode data sent by %s"), str(source))
+            return
+        # A datagram holds either a single sample or, when the publisher
+        # packs them, a list of samples
+        if isinstance(sample, dict):
+            samples = [sample]
+        elif (isinstance(sample, list) and
+              all(isinstance(s, dict) for s in sample)):
+            samples = sample
+        else:
+            LOG.warn(_("UDP: Cannot decode data sent by %s"), str(source))
+            return
+        for i, sample in enumerate(samples):
             try:
-                sample = msgpack.loads(data)
-            except Exception:
-                LOG.warn(_("UDP: Cannot decode data sent by %s"), str(source))
-            else:
+                self.udp_queue.put_nowait(sample)
+            except queue.Full:
+                LOG.warn(_("UDP: Queue is full, dropping %(count)d samples "
+                           "sent by %(source)s") %
+                         {'count': len(samples) - i, 'source': str(source)})
+                return
+
+    def _dispatch_udp(self, block=True):
+        """Dispatch the samples received over UDP, in batches.
+
+        :param block: wait for samples to be received, otherwise return
+                      once the queue is empty.
+        """
+        batch_size = cfg.CONF.collector.udp_batch_size
+        while True:
+            try:
+                samples = [self.udp_queue.get(block)]
+            except queue.Empty:
+                return
+            while len(samples) < batch_size:
                 try:
-                    LOG.debug(_("UDP: Storing %s"), str(sample))
-                    self.dispatcher_manager.map_method('record_metering_data',
-                                                       sample)
-                except Exception:
-                    LOG.exception(_("UDP: Unable to store meter"))
+                    samples.append(self.udp_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                LOG.debug(_("UDP: Storing %d samples"), len(samples))
+                self.dispatcher_manager.map_method('record_metering_data',
+                                                   samples)
+            except Exception:
+                LOG.exception(_("UDP: Unable to store meter"))
 
     def stop(self):
         self.udp_run = False
         super(CollectorService, self).stop()
+        # Nothing is received anymore, store what was
+        if self.udp_queue is not None:
+            self._dispatch_udp(block=False)
+        if self.dispatch_buffer is not None:
+            self.dispatch_buffer.drain()
 
     def initialize_service_hook(self, service):
         '''Consumers must be declared before consume_thread start.'''
@@ -101,7 +267,20 @@ class CollectorService(service.DispatchedService, rpc_service.Service):
         """RPC endpoint for messages we send to ourselves.
 
         When the notification messages are re-published through the
-        RPC publisher, this method receives them for processing.
+        RPC publisher, this method receives them for processing. The
+        data is either a list of samples, or a batch of them packed by
+        the publisher.
         """
+        data = publisher_utils.unpack_meter_messages(data)
+        if self.dispatch_buffer is None:
+            self.dispatcher_manager.map_method('record_metering_data',
+                                               data=data)
+        elif isinstance(data, dict):
+            self.dispatch_buffer.add([data])
+        else:
+            self.dispatch_buffer.add(data)
+
+    def _dispatch_samples(self, samples):
+        LOG.debug(_("Storing %d buffered samples"), len(samples))
         self.dispatcher_manager.map_method('record_metering_data',
-                                           data=data)
+                                           data=samples)
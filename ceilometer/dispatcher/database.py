@@ -16,15 +16,33 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from oslo.config import cfg
+
 from ceilometer import dispatcher
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import timeutils
 from ceilometer.publisher import utils as publisher_utils
 from ceilometer import storage
+from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+database_dispatcher_opts = [
+    cfg.IntOpt('duplicate_window',
+               default=0,
+               help='Number of seconds during which the messages whose '
+                    'message_id was already recorded are discarded without '
+                    'being verified again, such as when a publisher replays '
+                    'its queue. 0 disables it.'),
+]
+
+cfg.CONF.register_opts(database_dispatcher_opts,
+                       group="dispatcher_database")
+
+# Upper bound on the number of message ids remembered as recorded
+RECORDED_CACHE_SIZE = 100000
+
 
 class DatabaseDispatcher(dispatcher.Base):
     '''Dispatcher class for recording metering data into database.
@@ -40,13 +58,40 @@ class DatabaseDispatcher(dispatcher.Base):
     def __init__(self, conf):
         super(DatabaseDispatcher, self).__init__(conf)
         self.storage_conn = storage.get_connection(conf)
+        # message_id -> time it was recorded at, oldest first
+        self.recorded = utils.LRUCache(RECORDED_CACHE_SIZE)
+
+    def _forget_recorded(self, since):
+        oldest = self.recorded.oldest()
+        while oldest and oldest[1] < since:
+            del self.recorded[oldest[0]]
+            oldest = self.recorded.oldest()
 
     def record_metering_data(self, data):
         # We may have receive only one counter on the wire
-        if not isinstance(data, list):
+        if isinstance(data, dict):
             data = [data]
+        # The messages of a columnar batch are built each time they are
+        # iterated over, only build them once
+        data = list(data)
+
+        window = self.conf.dispatcher_database.duplicate_window
+        now = timeutils.utcnow_ts()
+        if window:
+            self._forget_recorded(now - window)
+            fresh = []
+            for meter in data:
+                if meter.get('message_id') in self.recorded:
+                    LOG.debug(_('discarding already recorded message %s'),
+                              meter['message_id'])
+                else:
+                    fresh.append(meter)
+            data = fresh
 
-        for meter in data:
+        valid = publisher_utils.verify_signatures(
+            data, self.conf.publisher.metering_secret)
+        meters = []
+        for meter, is_valid in zip(data, valid):
             LOG.debug(_(
                 'metering data %(counter_name)s '
                 'for %(resource_id)s @ %(timestamp)s: %(counter_volume)s')
@@ -54,9 +99,7 @@ class DatabaseDispatcher(dispatcher.Base):
                     'resource_id': meter['resource_id'],
                     'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
                     'counter_volume': meter['counter_volume']}))
-            if publisher_utils.verify_signature(
-                    meter,
-                    self.conf.publisher.metering_secret):
+            if is_valid:
                 try:
                     # Convert the timestamp to a datetime instance.
                     # Storage engines are responsible for converting
@@ -64,15 +107,43 @@ class DatabaseDispatcher(dispatcher.Base):
                     if meter.get('timestamp'):
                         ts = timeutils.parse_isotime(meter['timestamp'])
                         meter['timestamp'] = timeutils.normalize_time(ts)
-                    self.storage_conn.record_metering_data(meter)
                 except Exception as err:
                     LOG.exception(_('Failed to record metering data: %s'),
                                   err)
+                else:
+                    meters.append(meter)
             else:
                 LOG.warning(_(
                     'message signature invalid, discarding message: %r'),
                     meter)
 
+        if not meters:
+            return
+        try:
+            self.storage_conn.record_metering_data_batch(meters)
+        except Exception as err:
+            # record what can be, without losing the whole batch because
+            # of a single sample the storage rejects
+            LOG.warning(_('Failed to record a batch of %(count)d samples, '
+                          'recording them one by one: %(err)s') %
+                        {'count': len(meters), 'err': err})
+            recorded = []
+            for meter in meters:
+                try:
+                    self.storage_conn.record_metering_data(meter)
+                except Exception as err:
+                    LOG.exception(_('Failed to record metering data: %s'),
+                                  err)
+                else:
+                    recorded.append(meter)
+        else:
+            recorded = meters
+
+        if window:
+            for meter in recorded:
+                if meter.get('message_id'):
+                    self.recorded[meter['message_id']] = now
+
     def record_events(self, events):
         if not isinstance(events, list):
             events = [events]
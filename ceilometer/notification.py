@@ -41,6 +41,11 @@ OPTS = [
                 deprecated_group='collector',
                 default=False,
                 help='Save event details.'),
+    cfg.IntOpt('pipeline_flush_interval',
+               default=10,
+               help='Interval in seconds between periodic flushes of the '
+               'pipeline transformers, releasing the samples held back '
+               'by accumulating transformers. Set to 0 to disable.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="notification")
@@ -62,6 +67,30 @@ class NotificationService(service.DispatchedService, rpc_service.Service):
         super(NotificationService, self).start()
         # Add a dummy thread to have wait() working
         self.tg.add_timer(604800, lambda: None)
+        if cfg.CONF.notification.pipeline_flush_interval > 0:
+            self.tg.add_timer(cfg.CONF.notification.pipeline_flush_interval,
+                              self._flush_pipelines)
+        if cfg.CONF.refresh_pipeline_cfg:
+            self.tg.add_timer(cfg.CONF.pipeline_polling_interval,
+                              self._refresh_pipeline)
+        if cfg.CONF.pipeline_stats_interval > 0:
+            self.tg.add_timer(cfg.CONF.pipeline_stats_interval,
+                              self._log_pipeline_stats)
+
+    def _flush_pipelines(self):
+        """Periodically flush the pipelines, so that samples held back by
+        transformers are published even when no notification arrives.
+        """
+        self.pipeline_manager.flush(context.get_admin_context())
+
+    def _log_pipeline_stats(self):
+        self.pipeline_manager.log_stats()
+
+    def _refresh_pipeline(self):
+        """Swap in the pipeline config file if it changed."""
+        pipeline_manager = pipeline.reload_pipeline(self.pipeline_manager)
+        if pipeline_manager:
+            self.pipeline_manager = pipeline_manager
 
     def initialize_service_hook(self, service):
         '''Consumers must be declared before consume_thread start.'''
@@ -18,18 +18,32 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import copy
 import fnmatch
+import functools
+import hashlib
 import itertools
+import logging
 import operator
 import os
+import re
+import threading
+import time
 
 from oslo.config import cfg
+import six
+from six.moves import queue
 import yaml
 
+from ceilometer.openstack.common import context as req_context
 from ceilometer.openstack.common.gettextutils import _  # noqa
+from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import log
 from ceilometer import publisher
+from ceilometer import stats
 from ceilometer import transformer as xformer
+from ceilometer import utils
 
 
 OPTS = [
@@ -37,12 +51,50 @@ OPTS = [
                default="pipeline.yaml",
                help="Configuration file for pipeline definition."
                ),
+    cfg.BoolOpt('refresh_pipeline_cfg',
+                default=False,
+                help="Reload the pipeline configuration file on-the-fly "
+                "when it changes."
+                ),
+    cfg.IntOpt('pipeline_polling_interval',
+               default=20,
+               help="Interval in seconds between checks for changes to "
+               "the pipeline configuration file."
+               ),
+    cfg.IntOpt('pipeline_stats_interval',
+               default=0,
+               help="Interval in seconds between two logs of the pipeline "
+               "sources, sinks, transformers and publishers statistics, "
+               "0 disables them."
+               ),
+    cfg.IntOpt('publisher_queue_size',
+               default=0,
+               help="Maximum number of batches of samples queued for each "
+               "publisher, which then publishes them from a thread of its "
+               "own so that a slow publisher doesn't hold up the others. "
+               "0 publishes the samples synchronously."
+               ),
+    cfg.StrOpt('publisher_queue_policy',
+               default='block',
+               help="What to do with the samples to publish when the queue "
+               "of a publisher is full: block, drop-oldest or drop-newest."
+               ),
+    cfg.IntOpt('publisher_queue_stop_timeout',
+               default=10,
+               help="Maximum number of seconds to wait for the publishers "
+               "of a sink removed from the pipeline configuration to "
+               "publish their queued samples."
+               ),
 ]
 
 cfg.CONF.register_opts(OPTS)
 
 LOG = log.getLogger(__name__)
 
+# Upper bound on the number of memoized meter name decisions per source,
+# and on the number of meter names remembered by a routing table
+METER_DECISION_CACHE_SIZE = 4096
+
 
 class PipelineException(Exception):
     def __init__(self, message, pipeline_cfg):
@@ -53,20 +105,71 @@ class PipelineException(Exception):
         return 'Pipeline %s: %s' % (self.pipeline_cfg, self.msg)
 
 
+class RoutingTable(object):
+    """Routes samples to the pipelines whose source supports their meter.
+
+    A batch of samples is grouped by meter name, so that each source
+    decides once per meter name rather than once per sample, and is then
+    handed to the pipelines of the sources supporting the meter.
+    """
+
+    def __init__(self, pipelines):
+        self.pipelines = list(pipelines)
+        # A source feeding several sinks is shared by their pipelines
+        self.sources = collections.OrderedDict()
+        for p in self.pipelines:
+            self.sources.setdefault(p.source, []).append(p)
+        self._routes = utils.LRUCache(METER_DECISION_CACHE_SIZE)
+
+    def route(self, meter_name):
+        """Return the pipelines interested in the named meter."""
+        pipelines = self._routes.get(meter_name)
+        if pipelines is None:
+            pipelines = [p for p in self.pipelines
+                         if p.support_meter(meter_name)]
+            self._routes[meter_name] = pipelines
+        return pipelines
+
+    def partition(self, samples):
+        """Split samples into (pipeline, samples) pairs.
+
+        The statistics of each source are recorded along the way: the
+        samples offered to it, those it accepted and the time it spent
+        matching their meters.
+        """
+        meters = collections.OrderedDict()
+        count = 0
+        for s in samples:
+            meters.setdefault(s.name, []).append(s)
+            count += 1
+        partitions = []
+        for source, pipelines in self.sources.items():
+            started = time.time()
+            supported = [s for meter_name, meter_samples in meters.items()
+                         if source.support_meter(meter_name)
+                         for s in meter_samples]
+            source.stats.record(count, len(supported),
+                                time.time() - started)
+            if supported:
+                partitions.extend((p, supported) for p in pipelines)
+        return partitions
+
+
 class PublishContext(object):
 
-    def __init__(self, context, pipelines=[]):
+    def __init__(self, context, pipelines=[], routing_table=None):
         self.pipelines = set(pipelines)
         self.context = context
+        self.routing_table = routing_table or RoutingTable(self.pipelines)
 
     def add_pipelines(self, pipelines):
         self.pipelines.update(pipelines)
+        self.routing_table = RoutingTable(self.pipelines)
 
     def __enter__(self):
         def p(samples):
-            for p in self.pipelines:
-                p.publish_samples(self.context,
-                                  samples)
+            for pipe, supported in self.routing_table.partition(samples):
+                pipe.publish_supported_samples(self.context, supported)
         return p
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -113,6 +216,8 @@ class Source(object):
             raise PipelineException("Discovery should be a list", cfg)
 
         self._check_meters()
+        self._compile_meters()
+        self.stats = stats.ComponentStats()
 
     def __str__(self):
         return self.name
@@ -152,26 +257,56 @@ class Source(object):
         else:
             return name
 
-    def support_meter(self, meter_name):
-        meter_name = self._variable_meter_name(meter_name)
+    @staticmethod
+    def _is_pattern(meter):
+        return any(c in meter for c in '*?[')
 
+    @classmethod
+    def _compile_patterns(cls, meters):
+        """Split meter rules into a set of exact names and a single regex
+        matching any of the wildcard rules (None if there are none).
+        """
+        exact = set(m for m in meters if not cls._is_pattern(m))
+        wildcards = [m for m in meters if cls._is_pattern(m)]
+        regex = (re.compile('|'.join('(?:%s)' % fnmatch.translate(m)
+                                     for m in wildcards))
+                 if wildcards else None)
+        return exact, regex
+
+    def _compile_meters(self):
+        """Precompile the meter rules so that matching a sample doesn't
+        need to fnmatch every rule in turn.
+        """
         # Special case: if we only have negation, we suppose the default is
         # allow
-        default = all(meter.startswith('!') for meter in self.meters)
+        self._default = all(meter.startswith('!') for meter in self.meters)
+        self._excluded, self._excluded_re = self._compile_patterns(
+            [meter[1:] for meter in self.meters if meter[0] == '!'])
+        self._included, self._included_re = self._compile_patterns(
+            [meter for meter in self.meters if meter[0] != '!'])
+        self._decisions = utils.LRUCache(METER_DECISION_CACHE_SIZE)
+
+    def _match_meter(self, meter_name):
+        meter_name = self._variable_meter_name(meter_name)
 
         # Support wildcard like storage.* and !disk.*
         # Start with negation, we consider that the order is deny, allow
-        if any(fnmatch.fnmatch(meter_name, meter[1:])
-               for meter in self.meters
-               if meter[0] == '!'):
+        if (meter_name in self._excluded or
+                (self._excluded_re and self._excluded_re.match(meter_name))):
             return False
 
-        if any(fnmatch.fnmatch(meter_name, meter)
-               for meter in self.meters
-               if meter[0] != '!'):
+        if (meter_name in self._included or
+                (self._included_re and self._included_re.match(meter_name))):
             return True
 
-        return default
+        return self._default
+
+    def support_meter(self, meter_name):
+        decision = self._decisions.get(meter_name)
+        if decision is None:
+            decision = self._match_meter(meter_name)
+            self._decisions[meter_name] = decision
+        return decision
 
     def check_sinks(self, sinks):
         if not self.sinks:
@@ -185,6 +320,99 @@ class Source(object):
                     self.cfg)
 
 
+class PublisherQueue(object):
+    """Bounded queue of batches of samples published by a worker thread.
+
+    The thread is a green thread once eventlet has monkey patched the
+    threading module, as it does in the agents and services.
+    """
+
+    POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+    def __init__(self, publish, max_length, policy):
+        """Initialize the queue, without starting its worker.
+
+        :param publish: callable publishing a batch of samples, called
+                        with a context and a list of samples.
+        :param max_length: the maximum number of queued batches.
+        :param policy: one of POLICIES, what to do when the queue is
+                       full: wait for the worker to make room, or drop
+                       the oldest queued batch or the new one.
+        """
+        self.publish = publish
+        self.policy = policy
+        self.queue = queue.Queue(max_length)
+        self.max_depth = 0
+        self.dropped = 0
+        self.worker = None
+
+    def start(self):
+        self.worker = threading.Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def stop(self):
+        """Let the worker publish the queued batches, then exit."""
+        if self.worker is not None:
+            self.queue.put(None)
+
+    def wait(self, timeout=None):
+        """Wait for the worker to exit once stopped.
+
+        :param timeout: the maximum number of seconds to wait for.
+        :returns: whether the worker exited.
+        """
+        if self.worker is not None:
+            self.worker.join(timeout)
+            if self.worker.is_alive():
+                return False
+            self.worker = None
+        return True
+
+    def join(self):
+        """Wait until all the queued batches are published."""
+        self.queue.join()
+
+    def put(self, ctxt, samples):
+        if self.policy == 'block':
+            self.queue.put((ctxt, samples))
+        elif self.policy == 'drop-newest':
+            try:
+                self.queue.put_nowait((ctxt, samples))
+            except queue.Full:
+                self.dropped += len(samples)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait((ctxt, samples))
+                    break
+                except queue.Full:
+                    try:
+                        self.dropped += len(self.queue.get_nowait()[1])
+                        self.queue.task_done()
+                    except queue.Empty:
+                        pass
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.publish(*item)
+            except Exception:
+                LOG.exception(_("Unable to publish samples"))
+            finally:
+                self.queue.task_done()
+
+    def snapshot(self):
+        return {'depth': self.queue.qsize(),
+                'max_depth': self.max_depth,
+                'dropped': self.dropped,
+                'policy': self.policy}
+
+
 class Sink(object):
     """Represents a sink for the transformation and publication of
     samples emitted from a related source.
@@ -210,10 +438,18 @@ class Sink(object):
     If no transformers are included in the chain, the publishers are
     passed samples directly from the sink which are published unchanged.
 
+    When publisher_queue_size is set, each publisher is given the samples
+    through a PublisherQueue, so that it publishes them in the background.
+
     """
 
+    # The configuration fields a sink is built from
+    CFG_FIELDS = ('name', 'transformers', 'publishers')
+
     def __init__(self, cfg, transformer_manager):
-        self.cfg = cfg
+        # A copy, for same_cfg() to spot the changes of a config mutated
+        # in place
+        self.cfg = copy.deepcopy(cfg)
 
         try:
             self.name = cfg['name']
@@ -227,20 +463,65 @@ class Sink(object):
             raise PipelineException("No publisher specified", cfg)
 
         self.publishers = []
+        self.publisher_stats = []
         for p in cfg['publishers']:
             if '://' not in p:
                 # Support old format without URL
                 p = p + "://"
             try:
                 self.publishers.append(publisher.get_publisher(p))
+                self.publisher_stats.append((p, stats.ComponentStats()))
             except Exception:
                 LOG.exception(_("Unable to load publisher %s"), p)
 
+        self.publisher_queues = self._setup_publisher_queues()
+
         self.transformers = self._setup_transformers(cfg, transformer_manager)
+        self.transformer_stats = [(t['name'], stats.ComponentStats())
+                                  for t in self.transformer_cfg]
+        self.stats = stats.ComponentStats()
 
     def __str__(self):
         return self.name
 
+    def _setup_publisher_queues(self):
+        max_length = cfg.CONF.publisher_queue_size
+        if not max_length:
+            return [None] * len(self.publishers)
+        policy = cfg.CONF.publisher_queue_policy
+        if policy not in PublisherQueue.POLICIES:
+            LOG.warning(_('Publisher queue policy is unknown (%s), '
+                          'force to block') % policy)
+            policy = 'block'
+        queues = []
+        for p, (url, publisher_stats) in zip(self.publishers,
+                                             self.publisher_stats):
+            publisher_queue = PublisherQueue(
+                functools.partial(self._publish_to, p, publisher_stats),
+                max_length, policy)
+            publisher_queue.start()
+            queues.append(publisher_queue)
+        return queues
+
+    def stop(self):
+        """Stop the workers of the publisher queues, if any, and wait for
+        them to publish the queued samples, for up to
+        publisher_queue_stop_timeout seconds.
+        """
+        publisher_queues = [q for q in self.publisher_queues if q is not None]
+        for publisher_queue in publisher_queues:
+            publisher_queue.stop()
+        deadline = time.time() + cfg.CONF.publisher_queue_stop_timeout
+        for publisher_queue in publisher_queues:
+            if not publisher_queue.wait(max(deadline - time.time(), 0)):
+                LOG.warning(_("Pipeline %s: Publisher queue still not "
+                              "published after being stopped") % self)
+
+    @classmethod
+    def same_cfg(cls, cfg, other_cfg):
+        """Check whether two configs define the same sink."""
+        return all(cfg.get(f) == other_cfg.get(f) for f in cls.CFG_FIELDS)
+
     def _setup_transformers(self, cfg, transformer_manager):
         transformer_cfg = cfg['transformers'] or []
         transformers = []
@@ -261,18 +542,13 @@ class Sink(object):
 
         return transformers
 
-    def _transform_sample(self, start, ctxt, sample):
+    def _transform_sample(self, transformer, ctxt, sample,
+                          transformer_stats=None):
         try:
-            for transformer in self.transformers[start:]:
-                sample = transformer.handle_sample(ctxt, sample)
-                if not sample:
-                    LOG.debug(_(
-                        "Pipeline %(pipeline)s: Sample dropped by "
-                        "transformer %(trans)s") % ({'pipeline': self,
-                                                     'trans': transformer}))
-                    return
-            return sample
+            return transformer.handle_sample(ctxt, sample)
         except Exception as err:
+            if transformer_stats:
+                transformer_stats.errors += 1
             LOG.warning(_("Pipeline %(pipeline)s: "
                           "Exit after error from transformer "
                           "%(trans)s for %(smp)s") % ({'pipeline': self,
@@ -280,6 +556,58 @@ class Sink(object):
                                                        'smp': sample}))
             LOG.exception(err)
 
+    def _transform_samples(self, start, ctxt, samples):
+        """Pass a batch of samples through the transformer chain.
+
+        Each transformer handles the whole batch before the next one in
+        the chain is invoked, using the transformer's handle_samples()
+        batch method when it has one. The samples a batch method drops
+        after an error are counted in the errors of the transformer.
+        """
+        debug = LOG.logger.isEnabledFor(logging.DEBUG)
+        for i, transformer in enumerate(self.transformers[start:], start):
+            if not samples:
+                break
+            transformer_stats = self.transformer_stats[i][1]
+            started = time.time()
+            handle_samples = getattr(transformer, 'handle_samples', None)
+            if handle_samples:
+                errors = getattr(transformer, 'errors', 0)
+                try:
+                    transformed = handle_samples(ctxt, samples)
+                except Exception as err:
+                    transformer_stats.record(len(samples), 0,
+                                             time.time() - started,
+                                             error=True)
+                    LOG.warning(_(
+                        "Pipeline %(pipeline)s: Exit after error from "
+                        "transformer %(trans)s for %(count)d samples")
+                        % ({'pipeline': self,
+                            'trans': transformer,
+                            'count': len(samples)}))
+                    LOG.exception(err)
+                    return []
+                transformer_stats.errors += (getattr(transformer, 'errors', 0)
+                                             - errors)
+            else:
+                transformed = []
+                for sample in samples:
+                    sample = self._transform_sample(transformer, ctxt, sample,
+                                                    transformer_stats)
+                    if sample:
+                        transformed.append(sample)
+            transformer_stats.record(len(samples), len(transformed),
+                                     time.time() - started)
+            if debug and len(transformed) < len(samples):
+                LOG.debug(_(
+                    "Pipeline %(pipeline)s: %(count)d samples dropped by "
+                    "transformer %(trans)s") % ({
+                        'pipeline': self,
+                        'count': len(samples) - len(transformed),
+                        'trans': transformer}))
+            samples = transformed
+        return samples
+
     def _publish_samples(self, start, ctxt, samples):
         """Push samples into pipeline for publishing.
 
@@ -291,48 +619,81 @@ class Sink(object):
 
         """
 
-        transformed_samples = []
-        for sample in samples:
+        started = time.time()
+        samples = list(samples)
+        if LOG.logger.isEnabledFor(logging.DEBUG):
             LOG.debug(_(
-                "Pipeline %(pipeline)s: Transform sample "
-                "%(smp)s from %(trans)s transformer") % ({'pipeline': self,
-                                                          'smp': sample,
-                                                          'trans': start}))
-            sample = self._transform_sample(start, ctxt, sample)
-            if sample:
-                transformed_samples.append(sample)
+                "Pipeline %(pipeline)s: Transform %(count)d samples "
+                "from %(trans)s transformer") % ({'pipeline': self,
+                                                  'count': len(samples),
+                                                  'trans': start}))
+        transformed_samples = self._transform_samples(start, ctxt, samples)
 
         if transformed_samples:
             LOG.audit(_("Pipeline %s: Publishing samples"), self)
-            for p in self.publishers:
-                try:
-                    p.publish_samples(ctxt, transformed_samples)
-                except Exception:
-                    LOG.exception(_(
-                        "Pipeline %(pipeline)s: Continue after error "
-                        "from publisher %(pub)s") % ({'pipeline': self,
-                                                      'pub': p}))
+            for p, (url, publisher_stats), publisher_queue in zip(
+                    self.publishers, self.publisher_stats,
+                    self.publisher_queues):
+                if publisher_queue is None:
+                    self._publish_to(p, publisher_stats, ctxt,
+                                     transformed_samples)
+                else:
+                    publisher_queue.put(ctxt, transformed_samples)
             LOG.audit(_("Pipeline %s: Published samples") % self)
 
+        # Samples emitted by a flush were already counted in by the sink
+        self.stats.record(len(samples) if start == 0 else 0,
+                          len(transformed_samples),
+                          time.time() - started)
+
+    def _publish_to(self, p, publisher_stats, ctxt, samples):
+        count = len(samples)
+        started = time.time()
+        try:
+            p.publish_samples(ctxt, samples)
+        except Exception:
+            publisher_stats.record(count, 0, time.time() - started,
+                                   error=True)
+            LOG.exception(_(
+                "Pipeline %(pipeline)s: Continue after error "
+                "from publisher %(pub)s") % ({'pipeline': self,
+                                              'pub': p}))
+        else:
+            publisher_stats.record(count, count, time.time() - started)
+
     def publish_samples(self, ctxt, samples):
         for meter_name, samples in itertools.groupby(
                 sorted(samples, key=operator.attrgetter('name')),
                 operator.attrgetter('name')):
             self._publish_samples(0, ctxt, samples)
 
-    def flush(self, ctxt):
-        """Flush data after all samples have been injected to pipeline."""
+    def flush(self, ctxt, final=False):
+        """Flush data after all samples have been injected to pipeline.
+
+        :param ctxt: Execution context from the manager or service.
+        :param final: The sink is about to be dropped, flush all the
+                      samples the transformers hold, through their
+                      release() method when they have one.
+        """
 
         for (i, transformer) in enumerate(self.transformers):
+            transformer_stats = self.transformer_stats[i][1]
+            flush = transformer.flush
+            if final:
+                flush = getattr(transformer, 'release', flush)
             try:
-                self._publish_samples(i + 1, ctxt,
-                                      list(transformer.flush(ctxt)))
+                flushed = list(flush(ctxt))
             except Exception as err:
+                transformer_stats.errors += 1
                 LOG.warning(_(
                     "Pipeline %(pipeline)s: Error flushing "
                     "transformer %(trans)s") % ({'pipeline': self,
                                                  'trans': transformer}))
                 LOG.exception(err)
+                continue
+            if flushed:
+                transformer_stats.samples_out += len(flushed)
+                self._publish_samples(i + 1, ctxt, flushed)
 
 
 class Pipeline(object):
@@ -371,7 +732,11 @@ class Pipeline(object):
 
     def publish_samples(self, ctxt, samples):
         supported = [s for s in samples if self.source.support_meter(s.name)]
-        self.sink.publish_samples(ctxt, supported)
+        self.publish_supported_samples(ctxt, supported)
+
+    def publish_supported_samples(self, ctxt, samples):
+        """Publish samples already known to be supported by the source."""
+        self.sink.publish_samples(ctxt, samples)
 
     def flush(self, ctxt):
         self.sink.flush(ctxt)
@@ -386,7 +751,7 @@ class PipelineManager(object):
 
     """
 
-    def __init__(self, cfg, transformer_manager):
+    def __init__(self, cfg, transformer_manager, previous=None):
         """Setup the pipelines according to config.
 
         The configuration is supported in one of two forms:
@@ -483,52 +848,160 @@ class PipelineManager(object):
 
         Publisher's name is plugin name in setup.cfg
 
+        When a previous pipeline manager is given, its sinks are reused
+        for the sinks whose configuration didn't change, the others are
+        flushed and stopped.
+
         """
         self.pipelines = []
+        self.sinks = {}
+        self.transformer_manager = transformer_manager
+        self.cfg_digest = None
         if 'sources' in cfg or 'sinks' in cfg:
             if not ('sources' in cfg and 'sinks' in cfg):
                 raise PipelineException("Both sources & sinks are required",
                                         cfg)
             LOG.info(_('detected decoupled pipeline config format'))
             sources = [Source(s) for s in cfg.get('sources', [])]
-            sinks = dict((s['name'], Sink(s, transformer_manager))
-                         for s in cfg.get('sinks', []))
+            for s in cfg.get('sinks', []):
+                self.sinks[s['name']] = self._get_sink(s, transformer_manager,
+                                                       previous)
             for source in sources:
-                source.check_sinks(sinks)
+                source.check_sinks(self.sinks)
                 for target in source.sinks:
                     self.pipelines.append(Pipeline(source,
-                                                   sinks[target]))
+                                                   self.sinks[target]))
         else:
             LOG.warning(_('detected deprecated pipeline config format'))
             for pipedef in cfg:
                 source = Source(pipedef)
-                sink = Sink(pipedef, transformer_manager)
+                sink = self._get_sink(pipedef, transformer_manager, previous)
+                self.sinks[sink.name] = sink
                 self.pipelines.append(Pipeline(source, sink))
 
+        self.routing_table = RoutingTable(self.pipelines)
+
+        if previous is not None:
+            for sink in previous.sinks.values():
+                if self.sinks.get(sink.name) is not sink:
+                    # Publish what its transformers hold back before
+                    # dropping it
+                    sink.flush(req_context.get_admin_context(), final=True)
+                    sink.stop()
+
+    @staticmethod
+    def _get_sink(sink_cfg, transformer_manager, previous):
+        """Build a sink, or reuse the sink of the same name of the previous
+        pipeline manager when its config is unchanged, so that the state
+        of its transformers carries over.
+        """
+        sink = previous and previous.sinks.get(sink_cfg.get('name'))
+        if sink and Sink.same_cfg(sink.cfg, sink_cfg):
+            LOG.debug(_('Reusing unchanged sink %s'), sink)
+            return sink
+        return Sink(sink_cfg, transformer_manager)
+
     def publisher(self, context):
         """Build a new Publisher for these manager pipelines.
 
         :param context: The context.
         """
-        return PublishContext(context, self.pipelines)
+        return PublishContext(context, self.pipelines, self.routing_table)
+
+    def flush(self, context):
+        """Flush the transformers of all the pipelines.
+
+        :param context: The context.
+        """
+        for p in self.pipelines:
+            p.flush(context)
 
+    def stats(self):
+        """Return a snapshot of the statistics of the pipelines.
 
-def setup_pipeline(transformer_manager=None):
-    """Setup pipeline manager according to yaml config file."""
+        The sources and sinks are keyed by name, the transformers and
+        publishers of each sink are listed in their chain order.
+        """
+        sources = dict((p.source.name, p.source.stats.snapshot())
+                       for p in self.pipelines)
+        sinks = {}
+        for name, sink in self.sinks.items():
+            snapshot = sink.stats.snapshot()
+            snapshot['transformers'] = [
+                dict(s.snapshot(), name=n) for n, s in sink.transformer_stats]
+            snapshot['publishers'] = []
+            for (url, publisher_stats), publisher_queue in zip(
+                    sink.publisher_stats, sink.publisher_queues):
+                publisher_snapshot = dict(publisher_stats.snapshot(),
+                                          url=url)
+                if publisher_queue is not None:
+                    publisher_snapshot['queue'] = publisher_queue.snapshot()
+                snapshot['publishers'].append(publisher_snapshot)
+            sinks[name] = snapshot
+        return {'sources': sources, 'sinks': sinks}
+
+    def log_stats(self):
+        LOG.info(_("Pipeline statistics: %s"), jsonutils.dumps(self.stats()))
+
+
+def _pipeline_cfg_file():
     cfg_file = cfg.CONF.pipeline_cfg_file
     if not os.path.exists(cfg_file):
         cfg_file = cfg.CONF.find_file(cfg_file)
+    return cfg_file
+
+
+def _read_pipeline_cfg_file():
+    cfg_file = _pipeline_cfg_file()
 
     LOG.debug(_("Pipeline config file: %s"), cfg_file)
 
     with open(cfg_file) as fap:
-        data = fap.read()
+        return fap.read()
+
+
+def _cfg_digest(data):
+    """Return the digest of the content of a pipeline config file."""
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    return hashlib.md5(data).hexdigest()
+
+
+def setup_pipeline(transformer_manager=None, previous=None):
+    """Setup pipeline manager according to yaml config file.
+
+    :param transformer_manager: The transformer extension manager.
+    :param previous: The pipeline manager being replaced, if any.
+    """
+    data = _read_pipeline_cfg_file()
 
     pipeline_cfg = yaml.safe_load(data)
     LOG.info(_("Pipeline config: %s"), pipeline_cfg)
 
-    return PipelineManager(pipeline_cfg,
-                           transformer_manager or
-                           xformer.TransformerExtensionManager(
-                               'ceilometer.transformer',
-                           ))
+    manager = PipelineManager(pipeline_cfg,
+                              transformer_manager or
+                              (previous and previous.transformer_manager) or
+                              xformer.TransformerExtensionManager(
+                                  'ceilometer.transformer',
+                              ),
+                              previous)
+    manager.cfg_digest = _cfg_digest(data)
+    return manager
+
+
+def reload_pipeline(pipeline_manager):
+    """Reload the pipeline config file if it changed.
+
+    :param pipeline_manager: The pipeline manager currently in use.
+    :returns: A new pipeline manager, or None if the config file is
+              unchanged or the new configuration can't be loaded.
+    """
+    try:
+        data = _read_pipeline_cfg_file()
+        if _cfg_digest(data) == pipeline_manager.cfg_digest:
+            return None
+        LOG.info(_("Pipeline config file changed, reloading it"))
+        return setup_pipeline(previous=pipeline_manager)
+    except Exception:
+        LOG.exception(_("Unable to reload the pipeline config file, "
+                        "keeping the current pipelines"))
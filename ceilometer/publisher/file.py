@@ -16,16 +16,145 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import glob
+import io
 import logging
 import logging.handlers
+import os
 import six.moves.urllib.parse as urlparse
+import time
+
+import msgpack
+from oslo.config import cfg
 
 from ceilometer.openstack.common.gettextutils import _  # noqa
+from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import log
 from ceilometer import publisher
+from ceilometer.publisher import utils
 
 LOG = log.getLogger(__name__)
 
+# Size of the write buffer, a batch of samples is written at once
+BUFFER_SIZE = 64 * 1024
+
+
+class MeterFileWriter(object):
+    """Buffered writer of meter messages to a file.
+
+    The messages of a batch are encoded and written at once, either as
+    newline-delimited JSON documents or as consecutive msgpack maps.
+    The file is rotated once it would grow beyond max_bytes, or once it
+    has been written to for rotate_interval seconds. Rotated files are
+    named after the time of their rotation, so that their names don't
+    change while they are read, and only the backup_count most recent
+    ones are kept when it is set.
+    """
+
+    FORMATS = ('json', 'msgpack')
+
+    def __init__(self, path, format='json', max_bytes=0, backup_count=0,
+                 rotate_interval=0, fsync_interval=0):
+        """Open the file, appending to it if it exists.
+
+        :param fsync_interval: the minimum number of seconds between two
+                               fsync of the file, 0 leaves it to the OS.
+        """
+        if format not in self.FORMATS:
+            raise ValueError(_('Unknown format %s') % format)
+        self.path = path
+        self.format = format
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_interval = rotate_interval
+        self.fsync_interval = fsync_interval
+        self.stream = None
+        self._open()
+
+    def _open(self):
+        self.stream = io.open(self.path, 'ab', BUFFER_SIZE)
+        self.size = os.fstat(self.stream.fileno()).st_size
+        self.opened_at = self.synced_at = time.time()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.flush()
+            if self.fsync_interval:
+                os.fsync(self.stream.fileno())
+            self.stream.close()
+            self.stream = None
+
+    def encode(self, messages):
+        if self.format == 'json':
+            return ''.join(jsonutils.dumps(m) + '\n'
+                           for m in messages).encode('utf-8')
+        return b''.join(msgpack.dumps(jsonutils.to_primitive(m))
+                        for m in messages)
+
+    def write(self, messages):
+        data = self.encode(messages)
+        now = time.time()
+        if self.size and (
+                (self.max_bytes and self.size + len(data) > self.max_bytes)
+                or (self.rotate_interval and
+                    now - self.opened_at >= self.rotate_interval)):
+            self.rotate(now)
+        self.stream.write(data)
+        self.stream.flush()
+        self.size += len(data)
+        if self.fsync_interval and now - self.synced_at >= self.fsync_interval:
+            os.fsync(self.stream.fileno())
+            self.synced_at = now
+
+    def rotate(self, now=None):
+        self.close()
+        stamp = int(time.strftime('%Y%m%d%H%M%S',
+                                  time.gmtime(now or time.time())))
+        # The files rotated within the same second are numbered after
+        # the last one, even once the older ones have been removed
+        numbers = [rotation[1] if len(rotation) > 1 else 0
+                   for rotation in map(self._rotation, self.rotated_files())
+                   if rotation[0] == stamp]
+        if numbers:
+            name = '%s.%d.%d' % (self.path, stamp, max(numbers) + 1)
+        else:
+            name = '%s.%d' % (self.path, stamp)
+        os.rename(self.path, name)
+        if self.backup_count:
+            for old in self.rotated_files()[:-self.backup_count]:
+                os.unlink(old)
+        self._open()
+
+    def _rotation(self, name):
+        return [int(part) for part in name[len(self.path) + 1:].split('.')
+                if part.isdigit()]
+
+    def rotated_files(self):
+        """Return the rotated files, oldest first."""
+        return sorted(glob.glob(self.path + '.[0-9]*'), key=self._rotation)
+
+
+def read_meter_messages(path):
+    """Read the meter messages of a file written by a MeterFileWriter.
+
+    The format is guessed from the first byte, JSON documents are
+    objects while the msgpack maps of the meter messages never start
+    with an opening curly bracket.
+    """
+    with open(path, 'rb') as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == b'{':
+            for line in f:
+                try:
+                    yield jsonutils.loads(line.decode('utf-8'))
+                except ValueError:
+                    # a partial line, written while the publisher died
+                    LOG.warn(_('Skipping a corrupted message in %s') % path)
+        elif first:
+            for message in msgpack.Unpacker(f):
+                yield message
+
 
 class FilePublisher(publisher.PublisherBase):
     """Publisher metering data to file.
@@ -51,31 +180,57 @@ class FilePublisher(publisher.PublisherBase):
     or backup_count is missing, FileHandler will be used to save the metering
     data. If max_bytes and backup_count are present, RotatingFileHandler will
     be used to save the metering data.
+
+    When the format option is set to json or msgpack, the signed meter
+    messages are written by a MeterFileWriter instead, which batches the
+    writes of each publication, as newline-delimited JSON documents or
+    msgpack maps. These files can be loaded back into storage with the
+    ceilometer-import-samples command. The following options then apply:
+
+    - max_bytes and rotate_interval: rotate the file once it reaches
+      this size, or once it has been written to for this many seconds
+    - backup_count: how many rotated files are kept, all of them are
+      kept by default so that none is removed before it is imported
+    - fsync_interval: the minimum number of seconds between two fsync
+      of the file, it isn't synced explicitly by default
+
+        -
+            name: meter_spool
+            interval: 600
+            counters:
+                - "*"
+            transformers:
+            publishers:
+                - file:///var/spool/meters?format=msgpack&fsync_interval=1
     """
 
     def __init__(self, parsed_url):
         super(FilePublisher, self).__init__(parsed_url)
 
         self.publisher_logger = None
+        self.writer = None
         path = parsed_url.path
         if not path or path.lower() == 'file':
             LOG.error(_('The path for the file publisher is required'))
             return
 
+        params = urlparse.parse_qs(parsed_url.query)
+        if params.get('format'):
+            self.writer = self._setup_writer(path, params)
+            return
+
         rfh = None
         max_bytes = 0
         backup_count = 0
         # Handling other configuration options in the query string
-        if parsed_url.query:
-            params = urlparse.parse_qs(parsed_url.query)
-            if params.get('max_bytes') and params.get('backup_count'):
-                try:
-                    max_bytes = int(params.get('max_bytes')[0])
-                    backup_count = int(params.get('backup_count')[0])
-                except ValueError:
-                    LOG.error(_('max_bytes and backup_count should be '
-                              'numbers.'))
-                    return
+        if params.get('max_bytes') and params.get('backup_count'):
+            try:
+                max_bytes = int(params.get('max_bytes')[0])
+                backup_count = int(params.get('backup_count')[0])
+            except ValueError:
+                LOG.error(_('max_bytes and backup_count should be '
+                          'numbers.'))
+                return
         # create rotating file handler
         rfh = logging.handlers.RotatingFileHandler(
             path, encoding='utf8', maxBytes=max_bytes,
@@ -87,12 +242,35 @@ class FilePublisher(publisher.PublisherBase):
         rfh.setLevel(logging.INFO)
         self.publisher_logger.addHandler(rfh)
 
+    @staticmethod
+    def _setup_writer(path, params):
+        options = {}
+        for name in ('max_bytes', 'backup_count', 'rotate_interval',
+                     'fsync_interval'):
+            try:
+                options[name] = int(params.get(name, [0])[-1])
+            except ValueError:
+                LOG.error(_('%s should be a number.') % name)
+                return
+        try:
+            return MeterFileWriter(path, params['format'][-1], **options)
+        except ValueError as e:
+            LOG.error(e)
+        except (IOError, OSError) as e:
+            LOG.error(_('Unable to open %(path)s: %(error)s') %
+                      {'path': path, 'error': e})
+
     def publish_samples(self, context, samples):
         """Send a metering message for publishing
 
         :param context: Execution context from the service or RPC call
         :param samples: Samples from pipeline after transformation
         """
-        if self.publisher_logger:
+        if self.writer:
+            self.writer.write([
+                utils.meter_message_from_counter(
+                    sample, cfg.CONF.publisher.metering_secret)
+                for sample in samples])
+        elif self.publisher_logger:
             for sample in samples:
                 self.publisher_logger.info(sample.as_dict())
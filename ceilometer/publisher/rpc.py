@@ -19,13 +19,17 @@
 """
 
 
+import collections
 import itertools
 import operator
+import os
 import six.moves.urllib.parse as urlparse
 
 from oslo.config import cfg
 
+from ceilometer.openstack.common import context as req_context
 from ceilometer.openstack.common.gettextutils import _  # noqa
+from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import rpc
 from ceilometer import publisher
@@ -84,7 +88,118 @@ def override_backend_retry_config(value):
             cfg.CONF.set_override('rabbit_max_retries', value)
 
 
+class SpillFile(object):
+    """Append-only file of the messages the local queue overflowed with.
+
+    Each message is stored as a JSON document on a line of its own,
+    oldest first. The position of the first message left to replay is
+    kept in a companion .offset file, so that a restarted agent resumes
+    the replay where it stopped instead of starting it over.
+    """
+
+    def __init__(self, path, max_size=0):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.max_size = max_size
+        self.size = 0
+        self.offset = 0
+        self.count = 0
+        if os.path.exists(self.path):
+            self.size = os.path.getsize(self.path)
+            if os.path.exists(self.offset_path):
+                with open(self.offset_path) as f:
+                    self.offset = int(f.read() or 0)
+            with open(self.path) as f:
+                f.seek(self.offset)
+                self.count = sum(1 for line in f)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, entries):
+        """Append entries to the file.
+
+        The entries that don't fit in the file once it is full, the
+        last ones, are dropped.
+
+        :return: the number of entries dropped.
+        """
+        written = 0
+        with open(self.path, 'a') as f:
+            for entry in entries:
+                line = jsonutils.dumps(entry) + '\n'
+                if self.max_size and self.size + len(line) > self.max_size:
+                    break
+                f.write(line)
+                self.size += len(line)
+                written += 1
+        self.count += written
+        return len(entries) - written
+
+    def replay(self, send):
+        """Call send with each entry of the file, in order.
+
+        The replay stops at the first exception raised by send, which
+        is propagated; that entry is replayed again on the next call.
+        """
+        if not self.count:
+            return
+        try:
+            with open(self.path) as f:
+                f.seek(self.offset)
+                for line in iter(f.readline, ''):
+                    try:
+                        entry = jsonutils.loads(line)
+                    except ValueError:
+                        # a partial line, written while the agent died
+                        LOG.warn(_('Skipping a corrupted message in %s')
+                                 % self.path)
+                    else:
+                        send(entry)
+                    self.offset += len(line)
+                    self.count -= 1
+        finally:
+            if self.count:
+                with open(self.offset_path, 'w') as f:
+                    f.write(str(self.offset))
+            else:
+                self.clear()
+
+    def clear(self):
+        for path in (self.path, self.offset_path):
+            if os.path.exists(path):
+                os.unlink(path)
+        self.size = self.offset = self.count = 0
+
+
 class RPCPublisher(publisher.PublisherBase):
+    """Publisher casting the samples on the message bus.
+
+    The following options can be set in the publisher URL:
+
+    - per_meter_topic: also cast the samples of each meter on a topic
+      of their own
+    - target: the method called on the collector
+    - policy: what to do when the bus is unreachable: default, drop or
+      queue up to max_queue_length messages
+    - spill_file: with the queue policy, the file the oldest messages
+      are moved to instead of being dropped when the queue is full, up
+      to max_spill_size bytes, beyond which they are dropped. They are
+      sent back in order before the queued ones once the bus is
+      reachable again, even after a restart
+    - max_batch_samples, max_batch_bytes: the maximum number of samples
+      and bytes of a message, the samples are split in as many messages
+      as needed
+    - compression: compress the messages, only zlib is supported
+    - dedup_metadata: send the resource metadata shared by several
+      samples of a message only once
+    - columnar: send the samples of a message as a list per field, the
+      values repeated across samples, such as their meter name, project
+      or resource metadata, being sent only once
+
+    Collectors older than this release only understand messages sent
+    without compression, metadata deduplication or columnar layout.
+    """
 
     def __init__(self, parsed_url):
         options = urlparse.parse_qs(parsed_url.query)
@@ -99,13 +214,40 @@ class RPCPublisher(publisher.PublisherBase):
         self.policy = options.get('policy', ['default'])[-1]
         self.max_queue_length = int(options.get(
             'max_queue_length', [1024])[-1])
-
-        self.local_queue = []
+        spill_file = options.get('spill_file', [None])[-1]
+        max_spill_size = int(options.get(
+            'max_spill_size', [100 * 1024 * 1024])[-1])
+
+        # Batching, all disabled by default as older collectors only
+        # understand plain lists of samples
+        self.max_batch_samples = int(options.get(
+            'max_batch_samples', [0])[-1])
+        self.max_batch_bytes = int(options.get(
+            'max_batch_bytes', [0])[-1])
+        self.dedup_metadata = bool(int(
+            options.get('dedup_metadata', [0])[-1]))
+        self.columnar = bool(int(options.get('columnar', [0])[-1]))
+        self.compression = options.get('compression', [None])[-1]
+        if (self.compression is not None and
+                self.compression not in utils.BATCH_COMPRESSIONS):
+            LOG.warn(_('Publishing compression is unknown (%s), '
+                       'disabling it') % self.compression)
+            self.compression = None
+
+        self.local_queue = collections.deque()
+        self.spill = None
+        self._replaying = False
 
         if self.policy in ['queue', 'drop']:
             LOG.info(_('Publishing policy set to %s, '
                        'override backend retry config to 1') % self.policy)
             override_backend_retry_config(1)
+            if self.policy == 'queue' and spill_file:
+                self.spill = SpillFile(spill_file, max_spill_size)
+                if len(self.spill):
+                    LOG.info(_('%(count)d messages left in %(path)s will '
+                               'be published first') %
+                             {'count': len(self.spill), 'path': spill_file})
 
         elif self.policy == 'default':
             LOG.info(_('Publishing policy set to %s') % self.policy)
@@ -130,31 +272,67 @@ class RPCPublisher(publisher.PublisherBase):
         ]
 
         topic = cfg.CONF.publisher_rpc.metering_topic
-        msg = {
-            'method': self.target,
-            'version': '1.0',
-            'args': {'data': meters},
-        }
-        LOG.audit(_('Publishing %(m)d samples on %(t)s') % (
-                  {'m': len(msg['args']['data']), 't': topic}))
-        self.local_queue.append((context, topic, msg))
+        self._queue_meters(context, topic, meters)
 
         if self.per_meter_topic:
             for meter_name, meter_list in itertools.groupby(
                     sorted(meters, key=operator.itemgetter('counter_name')),
                     operator.itemgetter('counter_name')):
-                msg = {
-                    'method': self.target,
-                    'version': '1.0',
-                    'args': {'data': list(meter_list)},
-                }
-                topic_name = topic + '.' + meter_name
-                LOG.audit(_('Publishing %(m)d samples on %(n)s') % (
-                          {'m': len(msg['args']['data']), 'n': topic_name}))
-                self.local_queue.append((context, topic_name, msg))
+                self._queue_meters(context, topic + '.' + meter_name,
+                                   list(meter_list))
 
         self.flush()
 
+    def _batches(self, meters):
+        """Split meters in lists of at most max_batch_samples messages
+        and max_batch_bytes bytes, as encoded before any compression or
+        metadata deduplication.
+        """
+        if not (self.max_batch_samples or self.max_batch_bytes):
+            yield meters
+            return
+        batch = []
+        batch_bytes = 0
+        for meter in meters:
+            meter_bytes = (len(jsonutils.dumps(meter))
+                           if self.max_batch_bytes else 0)
+            if batch and (
+                    (self.max_batch_samples and
+                     len(batch) >= self.max_batch_samples) or
+                    (self.max_batch_bytes and
+                     batch_bytes + meter_bytes > self.max_batch_bytes)):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(meter)
+            batch_bytes += meter_bytes
+        if batch:
+            yield batch
+
+    def _queue_meters(self, context, topic, meters):
+        for batch in self._batches(meters):
+            if self.compression or self.dedup_metadata or self.columnar:
+                data = utils.pack_meter_messages(batch, self.compression,
+                                                 self.dedup_metadata,
+                                                 self.columnar)
+            else:
+                data = batch
+            msg = {
+                'method': self.target,
+                'version': '1.0',
+                'args': {'data': data},
+            }
+            LOG.audit(_('Publishing %(m)d samples on %(t)s') % (
+                      {'m': len(batch), 't': topic}))
+            self.local_queue.append((context, topic, msg))
+
+    @staticmethod
+    def _count_samples(msg):
+        data = msg['args']['data']
+        if isinstance(data, dict):
+            return data['count']
+        return len(data)
+
     def flush(self):
         #note(sileht):
         # IO of the rpc stuff in handled by eventlet,
@@ -163,9 +341,13 @@ class RPCPublisher(publisher.PublisherBase):
         # self.local_queue after in case of a other call have already added
         # something in the self.local_queue
         queue = self.local_queue
-        self.local_queue = []
-        self.local_queue = self._process_queue(queue, self.policy) + \
-            self.local_queue
+        self.local_queue = collections.deque()
+        # the spilled messages are older than the queued ones, these
+        # stay queued until all the spilled ones are published
+        if self.spill is None or self._replay_spill():
+            queue = self._process_queue(queue, self.policy)
+        queue.extend(self.local_queue)
+        self.local_queue = queue
         if self.policy == 'queue':
             self._check_queue_length()
 
@@ -173,9 +355,56 @@ class RPCPublisher(publisher.PublisherBase):
         queue_length = len(self.local_queue)
         if queue_length > self.max_queue_length > 0:
             count = queue_length - self.max_queue_length
-            self.local_queue = self.local_queue[count:]
-            LOG.warn(_("Publisher max local_queue length is exceeded, "
-                     "dropping %d oldest samples") % count)
+            overflow = [self.local_queue.popleft() for i in range(count)]
+            if self.spill is None:
+                LOG.warn(_("Publisher max local_queue length is exceeded, "
+                         "dropping %d oldest samples") % count)
+                return
+            dropped = self.spill.append([self._spill_entry(*m)
+                                         for m in overflow])
+            if dropped:
+                LOG.warn(_("Publisher spill file %(path)s is full, "
+                           "dropping %(count)d messages overflowing the "
+                           "queue") %
+                         {'path': self.spill.path, 'count': dropped})
+
+    @staticmethod
+    def _spill_entry(context, topic, msg):
+        if context is not None:
+            context = context.to_dict()
+            # neither needed to publish nor worth storing on disk
+            context.pop('auth_token', None)
+            context.pop('user_identity', None)
+        return {'context': context, 'topic': topic, 'msg': msg}
+
+    def _replay_spill(self):
+        """Publish the spilled messages.
+
+        :return: whether all of them have been published.
+        """
+        if not len(self.spill):
+            return True
+        if self._replaying:
+            # another green thread is already publishing them
+            return False
+
+        def send(entry):
+            context = entry['context']
+            if context is not None:
+                context = req_context.RequestContext(**context)
+            rpc.cast(context, entry['topic'], entry['msg'])
+
+        self._replaying = True
+        try:
+            self.spill.replay(send)
+        except (SystemExit, rpc.common.RPCException):
+            LOG.warn(_("Failed to publish the %(count)d messages spilled "
+                       "to %(path)s, keep them") %
+                     {'count': len(self.spill), 'path': self.spill.path})
+            return False
+        finally:
+            self._replaying = False
+        return True
 
     @staticmethod
     def _process_queue(queue, policy):
@@ -198,7 +427,8 @@ class RPCPublisher(publisher.PublisherBase):
             try:
                 rpc.cast(context, topic, msg)
             except (SystemExit, rpc.common.RPCException):
-                samples = sum([len(m['args']['data']) for n, n, m in queue])
+                samples = sum([RPCPublisher._count_samples(m)
+                               for n, n, m in queue])
                 if policy == 'queue':
                     LOG.warn(_("Failed to publish %d samples, queue them"),
                              samples)
@@ -206,9 +436,9 @@ class RPCPublisher(publisher.PublisherBase):
                 elif policy == 'drop':
                     LOG.warn(_("Failed to publish %d samples, dropping them"),
                              samples)
-                    return []
+                    return collections.deque()
                 # default, occur only if rabbit_max_retries > 0
                 raise
             else:
-                queue.pop(0)
-        return []
+                queue.popleft()
+        return collections.deque()
@@ -20,9 +20,11 @@
 """
 
 import socket
+import struct
 
 import msgpack
 from oslo.config import cfg
+import six.moves.urllib.parse as urlparse
 
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log
@@ -35,15 +37,66 @@ cfg.CONF.import_opt('udp_port', 'ceilometer.collector',
 
 LOG = log.getLogger(__name__)
 
+# Size of the msgpack header of an array of up to 65535 elements
+ARRAY_HEADER_SIZE = 3
+
+
+def _array_header(count):
+    """Return the msgpack header of an array of count elements."""
+    if count < 16:
+        return struct.pack('B', 0x90 | count)
+    return struct.pack('>BH', 0xdc, count)
+
 
 class UDPPublisher(publisher.PublisherBase):
+    """Publisher sending the samples to the collector over UDP.
+
+    The following option can be set in the publisher URL:
+
+    - max_datagram_size: pack as many samples as fit in datagrams of
+      this many bytes, the samples are sent one per datagram by default.
+      Use a value below the path MTU, such as 1400, to avoid IP
+      fragmentation.
+    """
+
     def __init__(self, parsed_url):
         self.host, self.port = network_utils.parse_host_port(
             parsed_url.netloc,
             default_port=cfg.CONF.collector.udp_port)
+        options = urlparse.parse_qs(parsed_url.query)
+        self.max_datagram_size = int(options.get(
+            'max_datagram_size', [0])[-1])
         self.socket = socket.socket(socket.AF_INET,
                                     socket.SOCK_DGRAM)
 
+    def _datagrams(self, samples):
+        """Encode samples in datagrams.
+
+        Each sample is encoded on its own, then the encoded samples are
+        concatenated behind an array header, which makes the datagram a
+        msgpack list without encoding the samples a second time.
+
+        :return: an iterator of (number of samples, datagram) tuples.
+        """
+        frame = []
+        frame_size = ARRAY_HEADER_SIZE
+        for sample in samples:
+            msg = utils.meter_message_from_counter(
+                sample,
+                cfg.CONF.publisher.metering_secret)
+            data = msgpack.dumps(msg)
+            if not self.max_datagram_size:
+                yield 1, data
+                continue
+            if frame and frame_size + len(data) > self.max_datagram_size:
+                yield len(frame), _array_header(len(frame)) + b''.join(frame)
+                frame = []
+                frame_size = ARRAY_HEADER_SIZE
+            frame.append(data)
+            frame_size += len(data)
+        if frame:
+            yield len(frame), _array_header(len(frame)) + b''.join(frame)
+
     def publish_samples(self, context, samples):
         """Send a metering message for publishing
 
@@ -51,18 +104,13 @@ class UDPPublisher(publisher.PublisherBase):
         :param samples: Samples from pipeline after transformation
         """
 
-        for sample in samples:
-            msg = utils.meter_message_from_counter(
-                sample,
-                cfg.CONF.publisher.metering_secret)
-            host = self.host
-            port = self.port
-            LOG.debug(_("Publishing sample %(msg)s over UDP to "
-                        "%(host)s:%(port)d") % {'msg': msg, 'host': host,
-                                                'port': port})
+        for count, data in self._datagrams(samples):
+            LOG.debug(_("Publishing %(count)d samples over UDP to "
+                        "%(host)s:%(port)d") % {'count': count,
+                                                'host': self.host,
+                                                'port': self.port})
             try:
-                self.socket.sendto(msgpack.dumps(msg),
-                                   (self.host, self.port))
+                self.socket.sendto(data, (self.host, self.port))
             except Exception as e:
                 LOG.warn(_("Unable to send sample over UDP"))
                 LOG.exception(e)
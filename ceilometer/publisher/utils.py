@@ -19,11 +19,17 @@
 """Utils for publishers
 """
 
+import base64
+import collections
 import hashlib
 import hmac
+import json
+import zlib
 
 from oslo.config import cfg
+import six
 
+from ceilometer.openstack.common import jsonutils
 from ceilometer import utils
 
 METER_PUBLISH_OPTS = [
@@ -36,8 +42,18 @@ METER_PUBLISH_OPTS = [
                                 cfg.DeprecatedOpt("metering_secret",
                                                   "publisher_rpc")]
                ),
+    cfg.IntOpt('signature_version',
+               default=1,
+               help='Version of the scheme used to sign metering messages. '
+               'Version 2 is faster to compute and verify, but is only '
+               'understood by collectors of this release or later. '
+               'Messages signed with any version are verified.'),
 ]
 
+# Prefix of the signatures computed with the version 2 scheme, the
+# signatures of the original scheme have none
+SIGNATURE_V2_PREFIX = 'v2:'
+
 
 def register_opts(config):
     """Register the options for publishing metering messages.
@@ -48,10 +64,8 @@ def register_opts(config):
 register_opts(cfg.CONF)
 
 
-def compute_signature(message, secret):
-    """Return the signature for a message dictionary.
-    """
-    digest_maker = hmac.new(secret, '', hashlib.sha256)
+def _compute_signature_v1(message, key):
+    digest_maker = key.copy()
     for name, value in utils.recursive_keypairs(message):
         if name == 'message_signature':
             # Skip any existing signature value, which would not have
@@ -62,13 +76,116 @@ def compute_signature(message, secret):
     return digest_maker.hexdigest()
 
 
+# The keys are sorted by _canonical(), as json only uses its C encoder
+# when it doesn't sort them itself
+_SIGNATURE_ENCODER = json.JSONEncoder(separators=(',', ':'),
+                                      default=jsonutils.to_primitive)
+
+
+def _canonical_key(key):
+    # Transports turn non string keys into their JSON representation
+    if isinstance(key, six.string_types):
+        return key
+    return json.dumps(key)
+
+
+def _canonical(value):
+    """Return a form of value whose JSON encoding is deterministic.
+
+    Dictionaries become an object whose only member holds the sorted
+    list of their items, which can't be mistaken for a list of pairs.
+    """
+    if isinstance(value, dict):
+        return {'': sorted((_canonical_key(k), _canonical(v))
+                           for k, v in value.iteritems())}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def _compute_signature_v2(message, key):
+    # The message is hashed as a single compact JSON document, which is
+    # the same whatever the transport turned tuples or strings into.
+    unsigned = {'': sorted((_canonical_key(k), _canonical(v))
+                           for k, v in message.iteritems()
+                           if k != 'message_signature')}
+    digest_maker = key.copy()
+    digest_maker.update(_SIGNATURE_ENCODER.encode(unsigned))
+    return SIGNATURE_V2_PREFIX + digest_maker.hexdigest()
+
+
+_SIGNATURE_SCHEMES = {
+    1: _compute_signature_v1,
+    2: _compute_signature_v2,
+}
+
+
+def signature_version(signature):
+    """Return the version of the scheme a signature was computed with.
+    """
+    if (isinstance(signature, six.string_types) and
+            signature.startswith(SIGNATURE_V2_PREFIX)):
+        return 2
+    return 1
+
+
+def compute_signature(message, secret, version=None):
+    """Return the signature for a message dictionary.
+
+    :param version: The signature scheme version, defaults to the
+                    configured one.
+    """
+    if version is None:
+        version = cfg.CONF.publisher.signature_version
+    try:
+        scheme = _SIGNATURE_SCHEMES[version]
+    except KeyError:
+        raise ValueError('Unknown signature version %s' % version)
+    return scheme(message, hmac.new(secret, '', hashlib.sha256))
+
+
+def _constant_time_compare(first, second):
+    """Return whether two strings are equal, in a time which doesn't
+    depend on the position of their first difference.
+    """
+    if first is None or second is None:
+        return False
+    if isinstance(first, six.text_type):
+        first = first.encode('utf-8')
+    if isinstance(second, six.text_type):
+        second = second.encode('utf-8')
+    if len(first) != len(second):
+        return False
+    if hasattr(hmac, 'compare_digest'):
+        return hmac.compare_digest(first, second)
+    result = 0
+    for x, y in zip(first, second):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def verify_signatures(messages, secret):
+    """Check the signatures of a batch of messages.
+
+    The HMAC key is only set up once for the whole batch.
+
+    :returns: A list telling for each message whether its signature is
+              valid.
+    """
+    key = hmac.new(secret, '', hashlib.sha256)
+    results = []
+    for message in messages:
+        old_sig = message.get('message_signature')
+        scheme = _SIGNATURE_SCHEMES[signature_version(old_sig)]
+        results.append(_constant_time_compare(scheme(message, key), old_sig))
+    return results
+
+
 def verify_signature(message, secret):
     """Check the signature in the message against the value computed
     from the rest of the contents.
     """
-    old_sig = message.get('message_signature')
-    new_sig = compute_signature(message, secret)
-    return new_sig == old_sig
+    return verify_signatures([message], secret)[0]
 
 
 def meter_message_from_counter(sample, secret):
@@ -91,3 +208,180 @@ def meter_message_from_counter(sample, secret):
            }
     msg['message_signature'] = compute_signature(msg, secret)
     return msg
+
+
+# Identifies the payloads holding a batch of metering messages packed by
+# pack_meter_messages(), rather than a plain list of messages
+BATCH_FORMAT = 'ceilometer.meter_batch'
+BATCH_COMPRESSIONS = ('zlib',)
+
+# The batch versions, by payload layout
+BATCH_ROWS_VERSION = 1
+BATCH_COLUMNS_VERSION = 2
+
+# The fields of a columnar batch whose distinct values are only sent once,
+# the column holding the index of the value of each message
+DICTIONARY_FIELDS = frozenset(['source', 'counter_name', 'counter_type',
+                               'counter_unit', 'user_id', 'project_id',
+                               'resource_id', 'timestamp',
+                               'resource_metadata'])
+
+
+class MeterBatch(collections.Sequence):
+    """The metering messages of a columnar batch.
+
+    The messages are only built as dictionaries when they are accessed,
+    from the columns of the batch.
+    """
+
+    def __init__(self, count, columns, dictionaries):
+        self.count = count
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    def __len__(self):
+        return self.count
+
+    def column(self, field):
+        """Return the values of a field, in the order of the messages."""
+        values = self.columns[field]
+        dictionary = self.dictionaries.get(field)
+        if dictionary is None:
+            return values
+        return [dictionary[i] for i in values]
+
+    def __iter__(self):
+        fields = list(self.columns)
+        for row in zip(*[self.column(f) for f in fields]):
+            yield dict(zip(fields, row))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        meter = {}
+        for field, values in six.iteritems(self.columns):
+            dictionary = self.dictionaries.get(field)
+            meter[field] = (values[index] if dictionary is None
+                            else dictionary[values[index]])
+        return meter
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def _pack_columns(meters):
+    """Return the columns and dictionaries of a columnar payload."""
+    columns = {}
+    dictionaries = {}
+    for field in meters[0]:
+        values = [meter[field] for meter in meters]
+        if field not in DICTIONARY_FIELDS:
+            columns[field] = values
+            continue
+        index = {}
+        dictionary = []
+        codes = []
+        for value in values:
+            # Keys aren't sorted so that json uses its C encoder, equal
+            # metadata built in a different order are just sent twice
+            key = (jsonutils.dumps(value) if field == 'resource_metadata'
+                   else value)
+            code = index.get(key)
+            if code is None:
+                code = index[key] = len(dictionary)
+                dictionary.append(value)
+            codes.append(code)
+        columns[field] = codes
+        dictionaries[field] = dictionary
+    return {'columns': columns, 'dictionaries': dictionaries}
+
+
+def _same_fields(meters):
+    fields = set(meters[0])
+    return all(len(meter) == len(fields) and fields.issuperset(meter)
+               for meter in meters)
+
+
+def pack_meter_messages(meters, compression=None, dedup_metadata=False,
+                        columnar=False):
+    """Pack a list of metering messages into a single batch payload.
+
+    :param meters: The metering messages.
+    :param compression: None, or one of BATCH_COMPRESSIONS.
+    :param dedup_metadata: Whether the resource metadata shared by
+                           several messages is only sent once.
+    :param columnar: Whether the payload holds a list per field rather
+                     than a dictionary per message, the repeated values
+                     of the DICTIONARY_FIELDS, including the resource
+                     metadata, being sent once. Only the messages which
+                     all have the same fields can be packed this way.
+    """
+    version = BATCH_ROWS_VERSION
+    payload = {'samples': meters}
+    if columnar and meters and _same_fields(meters):
+        version = BATCH_COLUMNS_VERSION
+        payload = _pack_columns(meters)
+    elif dedup_metadata:
+        metadata = []
+        refs = {}
+        samples = []
+        for meter in meters:
+            if 'resource_metadata' not in meter:
+                samples.append(meter)
+                continue
+            # Keys aren't sorted so that json uses its C encoder, equal
+            # metadata built in a different order are just sent twice
+            key = jsonutils.dumps(meter['resource_metadata'])
+            ref = refs.get(key)
+            if ref is None:
+                ref = refs[key] = len(metadata)
+                metadata.append(meter['resource_metadata'])
+            sample = dict(meter)
+            del sample['resource_metadata']
+            sample['resource_metadata_ref'] = ref
+            samples.append(sample)
+        payload = {'samples': samples, 'metadata': metadata}
+
+    batch = {'format': BATCH_FORMAT,
+             'version': version,
+             'count': len(meters)}
+    if compression is None:
+        batch['payload'] = payload
+    elif compression == 'zlib':
+        batch['compression'] = compression
+        batch['payload'] = base64.b64encode(
+            zlib.compress(jsonutils.dumps(payload)))
+    else:
+        raise ValueError('Unknown compression %s' % compression)
+    return batch
+
+
+def unpack_meter_messages(data):
+    """Return the metering messages held by data.
+
+    :param data: A metering message, a list of them, or a batch packed
+                 by pack_meter_messages(). The messages of a columnar
+                 batch are returned as a MeterBatch.
+    """
+    if not (isinstance(data, dict) and data.get('format') == BATCH_FORMAT):
+        return data
+    version = data.get('version', BATCH_ROWS_VERSION)
+    if version not in (BATCH_ROWS_VERSION, BATCH_COLUMNS_VERSION):
+        raise ValueError('Unknown batch version %s' % version)
+    payload = data['payload']
+    compression = data.get('compression')
+    if compression == 'zlib':
+        payload = jsonutils.loads(zlib.decompress(base64.b64decode(payload)))
+    elif compression is not None:
+        raise ValueError('Unknown compression %s' % compression)
+    if version == BATCH_COLUMNS_VERSION:
+        return MeterBatch(data['count'], payload['columns'],
+                          payload['dictionaries'])
+    meters = payload['samples']
+    metadata = payload.get('metadata')
+    if metadata is not None:
+        for meter in meters:
+            if 'resource_metadata_ref' in meter:
+                meter['resource_metadata'] = metadata[
+                    meter.pop('resource_metadata_ref')]
+    return meters
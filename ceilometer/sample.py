@@ -55,8 +55,18 @@ cfg.CONF.register_opts(OPTS)
 # Resource ID: the resource ID
 # Timestamp: when the sample has been read
 # Resource metadata: various metadata
+FIELDS = ('source', 'name', 'type', 'unit', 'volume', 'user_id',
+          'project_id', 'resource_id', 'timestamp', 'resource_metadata',
+          'id')
+
+
 class Sample(object):
 
+    # Samples are created by the hundreds of thousands at each polling
+    # cycle, so they don't carry a __dict__. The id is generated lazily,
+    # and stored in _id.
+    __slots__ = tuple(f if f != 'id' else '_id' for f in FIELDS)
+
     def __init__(self, name, type, unit, volume, user_id, project_id,
                  resource_id, timestamp, resource_metadata, source=None):
         self.name = name
@@ -69,10 +79,32 @@ class Sample(object):
         self.timestamp = timestamp
         self.resource_metadata = resource_metadata
         self.source = source or cfg.CONF.sample_source
-        self.id = str(uuid.uuid1())
+        self._id = None
+
+    @property
+    def id(self):
+        # The id is only generated when needed, samples dropped or
+        # aggregated by the pipeline transformers never need one.
+        if self._id is None:
+            self._id = str(uuid.uuid1())
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
 
     def as_dict(self):
-        return copy.copy(self.__dict__)
+        return {'source': self.source,
+                'name': self.name,
+                'type': self.type,
+                'unit': self.unit,
+                'volume': self.volume,
+                'user_id': self.user_id,
+                'project_id': self.project_id,
+                'resource_id': self.resource_id,
+                'timestamp': self.timestamp,
+                'resource_metadata': self.resource_metadata,
+                'id': self.id}
 
     @classmethod
     def from_notification(cls, name, type, volume, unit,
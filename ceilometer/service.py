@@ -102,21 +102,25 @@ class WorkerException(Exception):
     """
 
 
+def load_dispatcher_manager(namespace='ceilometer.dispatcher'):
+    LOG.debug(_('loading dispatchers from %s'), namespace)
+    dispatcher_manager = named.NamedExtensionManager(
+        namespace=namespace,
+        names=cfg.CONF.dispatcher,
+        invoke_on_load=True,
+        invoke_args=[cfg.CONF])
+    if not list(dispatcher_manager):
+        LOG.warning(_('Failed to load any dispatchers for %s'), namespace)
+    return dispatcher_manager
+
+
 class DispatchedService(object):
 
     DISPATCHER_NAMESPACE = 'ceilometer.dispatcher'
 
     def start(self):
-        LOG.debug(_('loading dispatchers from %s'),
-                  self.DISPATCHER_NAMESPACE)
-        self.dispatcher_manager = named.NamedExtensionManager(
-            namespace=self.DISPATCHER_NAMESPACE,
-            names=cfg.CONF.dispatcher,
-            invoke_on_load=True,
-            invoke_args=[cfg.CONF])
-        if not list(self.dispatcher_manager):
-            LOG.warning(_('Failed to load any dispatchers for %s'),
-                        self.DISPATCHER_NAMESPACE)
+        self.dispatcher_manager = load_dispatcher_manager(
+            self.DISPATCHER_NAMESPACE)
         # ensure dispatcher is configured before starting other services
         super(DispatchedService, self).start()
 
@@ -0,0 +1,95 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Counters and latency histograms for the pipeline components."""
+
+import bisect
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+                   0.1, 0.5, 1, 5, 10)
+
+
+class Histogram(object):
+    """Histogram of durations with fixed, roughly logarithmic buckets.
+
+    Percentiles are approximated by the upper bound of the bucket they
+    fall in, which is precise enough to spot a slow component while
+    keeping the cost of recording a duration constant.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+        if i < len(self.buckets):
+            return min(self.buckets[i], self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': self.max}
+
+
+class ComponentStats(object):
+    """Sample counters and latency of a pipeline component.
+
+    The samples dropped are the samples a component received but didn't
+    pass on, either because it discarded them or because it holds them
+    back until a later flush.
+    """
+
+    def __init__(self):
+        self.samples_in = 0
+        self.samples_out = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    def record(self, samples_in, samples_out, elapsed, error=False):
+        self.samples_in += samples_in
+        self.samples_out += samples_out
+        if samples_out < samples_in:
+            self.dropped += samples_in - samples_out
+        if error:
+            self.errors += 1
+        self.latency.add(elapsed)
+
+    def snapshot(self):
+        return {'samples_in': self.samples_in,
+                'samples_out': self.samples_out,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'latency': self.latency.snapshot()}
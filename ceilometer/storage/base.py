@@ -175,6 +175,17 @@ class Connection(object):
         """
         raise NotImplementedError('Projects not implemented')
 
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+
+        Drivers without a bulk implementation record them one by one.
+        """
+        for data in samples:
+            self.record_metering_data(data)
+
     @staticmethod
     def clear_expired_metering_data(ttl):
         """Clear expired data from the backend storage system according to the
@@ -42,6 +42,9 @@ from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+# Upper bound on the number of resources remembered as recorded
+RESOURCE_CACHE_SIZE = 10000
+
 
 class DB2Storage(base.StorageEngine):
     """The db2 storage for Ceilometer
@@ -150,6 +153,10 @@ class Connection(pymongo_base.Connection):
             self.db.authenticate(connection_options['username'],
                                  connection_options['password'])
 
+        # resource id -> (the fields, metadata digest and set of meters
+        # last written to the resource document)
+        self._resources = utils.LRUCache(RESOURCE_CACHE_SIZE)
+
         self.CAPABILITIES = utils.update_nested(self.DEFAULT_CAPABILITIES,
                                                 AVAILABLE_CAPABILITIES)
 
@@ -224,6 +231,7 @@ class Connection(pymongo_base.Connection):
             self.db.project.remove({'_id': project_id})
 
     def clear(self):
+        self._resources = utils.LRUCache(RESOURCE_CACHE_SIZE)
         # db2 does not support drop_database, remove all collections
         for col in ['user', 'project', 'resource', 'meter']:
             self.db[col].drop()
@@ -240,30 +248,96 @@ class Connection(pymongo_base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
-        # Make sure we know about the user and project
-        self.db.user.update(
-            {'_id': data['user_id'] or 'null'},
-            {'$addToSet': {'source': data['source'],
-                           },
-             },
-            upsert=True,
-        )
-        self.db.project.update(
-            {'_id': data['project_id']},
-            {'$addToSet': {'source': data['source'],
-                           },
-             },
-            upsert=True,
-        )
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Each user and project document is updated once per batch, each
+        resource document once per meter, and the samples are inserted
+        with a single request.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+
+        # Make sure we know about the users and projects
+        for _id, source in set((data['user_id'] or 'null', data['source'])
+                               for data in samples):
+            self.db.user.update(
+                {'_id': _id},
+                {'$addToSet': {'source': source,
+                               },
+                 },
+                upsert=True,
+            )
+        for _id, source in set((data['project_id'], data['source'])
+                               for data in samples):
+            self.db.project.update(
+                {'_id': _id},
+                {'$addToSet': {'source': source,
+                               },
+                 },
+                upsert=True,
+            )
+
+        # Record the updated resource metadata. Only the last sample of
+        # each resource and meter is needed, they are applied in the
+        # order they were received so that the last sample of a resource
+        # sets its metadata.
+        latest = {}
+        for i, data in enumerate(samples):
+            latest[(data['resource_id'], data['counter_name'],
+                    data['counter_type'], data['counter_unit'])] = i
+        for i in sorted(latest.itervalues()):
+            self._update_resource(samples[i])
+
+        # Record the raw data for the meters. Use copies so we do not
+        # modify the data structures owned by our caller (the driver adds
+        # a new key '_id').
+        recorded_at = timeutils.utcnow()
+        records = []
+        for data in samples:
+            record = copy.copy(data)
+            record['recorded_at'] = recorded_at
+            # Make sure that the data does have field _id which db2 wont
+            # add automatically.
+            if record.get('_id') is None:
+                record['_id'] = (data.get('message_id') or
+                                 str(bson.objectid.ObjectId()))
+            records.append(record)
+        self._insert_meter_records(records)
+
+    def _update_resource(self, data):
+        resource_id = data['resource_id']
+        fields = {'project_id': data['project_id'],
+                  'user_id': data['user_id'] or 'null',
+                  'source': data['source'],
+                  }
+        digest = utils.metadata_digest(data['resource_metadata'])
+        meter = (data['counter_name'], data['counter_type'],
+                 data['counter_unit'])
+
+        # Skip the write when the resource document is already up to
+        # date, and only write the metadata when it changed
+        known = self._resources.get(resource_id)
+        if known is not None:
+            known_fields, known_digest, meters = known
+            if (known_fields == fields and known_digest == digest and
+                    meter in meters):
+                return
+        else:
+            known_digest, meters = None, set()
+        update = dict(fields)
+        if known_digest != digest:
+            update['metadata'] = data['resource_metadata']
+            update['metadata_hash'] = digest
 
-        # Record the updated resource metadata
         self.db.resource.update(
-            {'_id': data['resource_id']},
-            {'$set': {'project_id': data['project_id'],
-                      'user_id': data['user_id'] or 'null',
-                      'metadata': data['resource_metadata'],
-                      'source': data['source'],
-                      },
+            {'_id': resource_id},
+            {'$set': update,
              '$addToSet': {'meter': {'counter_name': data['counter_name'],
                                      'counter_type': data['counter_type'],
                                      'counter_unit': data['counter_unit'],
@@ -272,17 +346,7 @@ class Connection(pymongo_base.Connection):
              },
             upsert=True,
         )
-
-        # Record the raw data for the meter. Use a copy so we do not
-        # modify a data structure owned by our caller (the driver adds
-        # a new key '_id').
-        record = copy.copy(data)
-        record['recorded_at'] = timeutils.utcnow()
-        # Make sure that the data does have field _id which db2 wont add
-        # automatically.
-        if record.get('_id') is None:
-            record['_id'] = str(bson.objectid.ObjectId())
-        self.db.meter.insert(record)
+        self._resources[resource_id] = (fields, digest, meters | set([meter]))
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
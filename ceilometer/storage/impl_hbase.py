@@ -41,6 +41,9 @@ from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+# Upper bound on the number of resources remembered as recorded
+RESOURCE_CACHE_SIZE = 10000
+
 
 class HBaseStorage(base.StorageEngine):
     """Put the data into a HBase database
@@ -140,6 +143,10 @@ class Connection(base.Connection):
         else:
             self.conn_pool = self._get_connection_pool(opts)
 
+        # resource id -> (metadata digest, sources, meters) of the resource
+        # rows read, so that they are only read again once they changed
+        self._resources = utils.LRUCache(RESOURCE_CACHE_SIZE)
+
         self.CAPABILITIES = utils.update_nested(self.DEFAULT_CAPABILITIES,
                                                 AVAILABLE_CAPABILITIES)
 
@@ -154,6 +161,7 @@ class Connection(base.Connection):
 
     def clear(self):
         LOG.debug(_('Dropping HBase schema...'))
+        self._resources = utils.LRUCache(RESOURCE_CACHE_SIZE)
         with self.conn_pool.connection() as conn:
             for table in [self.PROJECT_TABLE,
                           self.USER_TABLE,
@@ -280,57 +288,88 @@ class Connection(base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        The sources of each user and project are checked once per batch,
+        and the sample rows are sent with a single batch mutation.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
         with self.conn_pool.connection() as conn:
             project_table = conn.table(self.PROJECT_TABLE)
             user_table = conn.table(self.USER_TABLE)
             resource_table = conn.table(self.RESOURCE_TABLE)
             meter_table = conn.table(self.METER_TABLE)
 
-            # Make sure we know about the user and project
-            if data['user_id']:
-                self._update_sources(user_table, data['user_id'],
-                                     data['source'])
-            self._update_sources(project_table, data['project_id'],
-                                 data['source'])
-
-            # Get metadata from user's data
-            resource_metadata = data.get('resource_metadata', {})
-            # Determine the name of new meter
-            new_meter = _format_meter_reference(
-                data['counter_name'], data['counter_type'],
-                data['counter_unit'])
+            # Make sure we know about the users and projects
+            for user_id, source in set((data['user_id'], data['source'])
+                                       for data in samples):
+                if user_id:
+                    self._update_sources(user_table, user_id, source)
+            for project_id, source in set((data['project_id'],
+                                           data['source'])
+                                          for data in samples):
+                self._update_sources(project_table, project_id, source)
+
+            # the rows are only sent if all the samples could be built
+            with meter_table.batch(transaction=True) as meter_batch:
+                for data in samples:
+                    self._record_sample(resource_table, meter_batch, data)
+
+    def _record_sample(self, resource_table, meter_table, data):
+        # Get metadata from user's data
+        resource_metadata = data.get('resource_metadata', {})
+        digest = utils.metadata_digest(resource_metadata)
+        # Determine the name of new meter
+        new_meter = _format_meter_reference(
+            data['counter_name'], data['counter_type'],
+            data['counter_unit'])
+        resource = self._resources.get(data['resource_id'])
+        if resource is None:
             flatten_result, sources, meters, metadata = \
                 deserialize_entry(resource_table.row(data['resource_id']))
-
-            # Update if resource has new information
-            if (data['source'] not in sources) or (
-                    new_meter not in meters) or (
-                    metadata != resource_metadata):
-                resource_table.put(data['resource_id'],
-                                   serialize_entry(
-                                       **{'sources': [data['source']],
-                                          'meters': [new_meter],
-                                          'metadata': resource_metadata,
-                                          'resource_id': data['resource_id'],
-                                          'project_id': data['project_id'],
-                                          'user_id': data['user_id']}))
-
-            # Rowkey consists of reversed timestamp, meter and an md5 of
-            # user+resource+project for purposes of uniqueness
-            m = hashlib.md5()
-            m.update("%s%s%s" % (data['user_id'], data['resource_id'],
-                                 data['project_id']))
-
-            # We use reverse timestamps in rowkeys as they are sorted
-            # alphabetically.
-            rts = reverse_timestamp(data['timestamp'])
-            row = "%s_%d_%s" % (data['counter_name'], rts, m.hexdigest())
-            record = serialize_entry(data, **{'metadata': resource_metadata,
-                                              'rts': rts,
-                                              'message': data,
-                                              'recorded_at': timeutils.utcnow(
-                                              )})
-            meter_table.put(row, record)
+            resource = (flatten_result.get('metadata_hash'),
+                        set(sources), set(meters))
+            self._resources[data['resource_id']] = resource
+        known_digest, sources, meters = resource
+
+        # Update if resource has new information
+        if (data['source'] not in sources) or (
+                new_meter not in meters) or (
+                known_digest != digest):
+            resource_table.put(data['resource_id'],
+                               serialize_entry(
+                                   **{'sources': [data['source']],
+                                      'meters': [new_meter],
+                                      'metadata': resource_metadata,
+                                      'metadata_hash': digest,
+                                      'resource_id': data['resource_id'],
+                                      'project_id': data['project_id'],
+                                      'user_id': data['user_id']}))
+            # read the row again the next time, as it is known to HBase
+            # only whether the new columns were merged into it
+            self._resources.pop(data['resource_id'])
+
+        # Rowkey consists of reversed timestamp, meter and an md5 of
+        # user+resource+project for purposes of uniqueness
+        m = hashlib.md5()
+        m.update("%s%s%s" % (data['user_id'], data['resource_id'],
+                             data['project_id']))
+
+        # We use reverse timestamps in rowkeys as they are sorted
+        # alphabetically.
+        rts = reverse_timestamp(data['timestamp'])
+        row = "%s_%d_%s" % (data['counter_name'], rts, m.hexdigest())
+        record = serialize_entry(data, **{'metadata': resource_metadata,
+                                          'rts': rts,
+                                          'message': data,
+                                          'recorded_at': timeutils.utcnow(
+                                          )})
+        meter_table.put(row, record)
 
     def _update_sources(self, table, id, source):
         user, sources, _, _ = deserialize_entry(table.row(id))
@@ -621,6 +660,9 @@ class MTable(object):
     def delete(self, key):
         del self._rows[key]
 
+    def batch(self, transaction=False):
+        return MBatch(self, transaction)
+
     def scan(self, filter=None, columns=[], row_start=None, row_stop=None):
         sorted_keys = sorted(self._rows)
         # copy data between row_start and row_stop into a dict
@@ -691,6 +733,33 @@ class MTable(object):
         return r
 
 
+class MBatch(object):
+    """HappyBase.Batch mock
+    """
+    def __init__(self, table, transaction=False):
+        self.table = table
+        self.transaction = transaction
+        self._mutations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None or not self.transaction:
+            self.send()
+
+    def put(self, key, data):
+        self._mutations.append((self.table.put, key, data))
+
+    def delete(self, key):
+        self._mutations.append((self.table.delete, key))
+
+    def send(self):
+        for mutation in self._mutations:
+            mutation[0](*mutation[1:])
+        self._mutations = []
+
+
 class MConnectionPool(object):
     def __init__(self):
         self.conn = MConnection()
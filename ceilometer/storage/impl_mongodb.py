@@ -513,56 +513,109 @@ class Connection(pymongo_base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
-        # Make sure we know about the user and project
-        self.db.user.update(
-            {'_id': data['user_id']},
-            {'$addToSet': {'source': data['source'],
-                           },
-             },
-            upsert=True,
-        )
-        self.db.project.update(
-            {'_id': data['project_id']},
-            {'$addToSet': {'source': data['source'],
-                           },
-             },
-            upsert=True,
-        )
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Each user, project and resource document is updated once per
+        batch, and the samples are inserted with a single request.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+
+        # Make sure we know about the users and projects
+        for collection, key in ((self.db.user, 'user_id'),
+                                (self.db.project, 'project_id')):
+            for _id, source in set((data[key], data['source'])
+                                   for data in samples):
+                collection.update(
+                    {'_id': _id},
+                    {'$addToSet': {'source': source,
+                                   },
+                     },
+                    upsert=True,
+                )
+
+        resources = {}
+        for data in samples:
+            resources.setdefault(data['resource_id'], []).append(data)
+        for resource_id, resource_samples in resources.iteritems():
+            self._update_resource(resource_id, resource_samples)
+
+        # Record the raw data for the meters. Use copies so we do not
+        # modify the data structures owned by our caller (the driver adds
+        # a new key '_id').
+        recorded_at = timeutils.utcnow()
+        records = []
+        for data in samples:
+            record = copy.copy(data)
+            record['recorded_at'] = recorded_at
+            if data.get('message_id'):
+                record['_id'] = data['message_id']
+            records.append(record)
+        self._insert_meter_records(records)
+
+    def _update_resource(self, resource_id, samples):
+        # The samples of the resource, in the order they were received.
+        # The latest one holds the current resource metadata, the last
+        # received one on a tie, as when the samples are recorded one
+        # at a time.
+        last = samples[-1]
+        newest = max(reversed(samples), key=operator.itemgetter('timestamp'))
+        oldest = min(samples, key=operator.itemgetter('timestamp'))
+        digest = utils.metadata_digest(newest['resource_metadata'])
+        meters = []
+        for data in samples:
+            meter = {'counter_name': data['counter_name'],
+                     'counter_type': data['counter_type'],
+                     'counter_unit': data['counter_unit'],
+                     }
+            if meter not in meters:
+                meters.append(meter)
 
         # Record the updated resource metadata - we use $setOnInsert to
         # unconditionally insert sample timestamps and resource metadata
-        # (in the update case, this must be conditional on the sample not
+        # (in the update case, this must be conditional on the samples not
         # being out-of-order)
         resource = self.db.resource.find_and_modify(
-            {'_id': data['resource_id']},
-            {'$set': {'project_id': data['project_id'],
-                      'user_id': data['user_id'],
-                      'source': data['source'],
+            {'_id': resource_id},
+            {'$set': {'project_id': last['project_id'],
+                      'user_id': last['user_id'],
+                      'source': last['source'],
                       },
-             '$setOnInsert': {'metadata': data['resource_metadata'],
-                              'first_sample_timestamp': data['timestamp'],
-                              'last_sample_timestamp': data['timestamp'],
+             '$setOnInsert': {'metadata': newest['resource_metadata'],
+                              'metadata_hash': digest,
+                              'first_sample_timestamp': oldest['timestamp'],
+                              'last_sample_timestamp': newest['timestamp'],
                               },
-             '$addToSet': {'meter': {'counter_name': data['counter_name'],
-                                     'counter_type': data['counter_type'],
-                                     'counter_unit': data['counter_unit'],
-                                     },
-                           },
+             '$addToSet': {'meter': {'$each': meters}},
              },
             upsert=True,
             new=True,
+            # the digest tells whether the metadata changed
+            fields={'metadata': False},
         )
 
         # only update last sample timestamp if actually later (the usual
-        # in-order case)
+        # in-order case), and the metadata if it actually changed
         last_sample_timestamp = resource.get('last_sample_timestamp')
         if (last_sample_timestamp is None or
-                last_sample_timestamp <= data['timestamp']):
-            self.db.resource.update(
-                {'_id': data['resource_id']},
-                {'$set': {'metadata': data['resource_metadata'],
-                          'last_sample_timestamp': data['timestamp']}}
-            )
+                last_sample_timestamp <= newest['timestamp']):
+            update = {}
+            if last_sample_timestamp != newest['timestamp']:
+                update['last_sample_timestamp'] = newest['timestamp']
+            if resource.get('metadata_hash') != digest:
+                update['metadata'] = newest['resource_metadata']
+                update['metadata_hash'] = digest
+            if update:
+                self.db.resource.update(
+                    {'_id': resource_id},
+                    {'$set': update}
+                )
 
         # only update first sample timestamp if actually earlier (the unusual
         # out-of-order case)
@@ -571,19 +624,12 @@ class Connection(pymongo_base.Connection):
         # recording these timestamps in the resource collection
         first_sample_timestamp = resource.get('first_sample_timestamp')
         if (first_sample_timestamp is not None and
-                first_sample_timestamp > data['timestamp']):
+                first_sample_timestamp > oldest['timestamp']):
             self.db.resource.update(
-                {'_id': data['resource_id']},
-                {'$set': {'first_sample_timestamp': data['timestamp']}}
+                {'_id': resource_id},
+                {'$set': {'first_sample_timestamp': oldest['timestamp']}}
             )
 
-        # Record the raw data for the meter. Use a copy so we do not
-        # modify a data structure owned by our caller (the driver adds
-        # a new key '_id').
-        record = copy.copy(data)
-        record['recorded_at'] = timeutils.utcnow()
-        self.db.meter.insert(record)
-
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system according to the
         time-to-live.
@@ -31,6 +31,7 @@ from sqlalchemy import func
 from sqlalchemy import not_
 from sqlalchemy import or_
 from sqlalchemy.orm import aliased
+from sqlalchemy.orm import joinedload
 
 from ceilometer.openstack.common.db import exception as dbexc
 import ceilometer.openstack.common.db.sqlalchemy.session as sqlalchemy_session
@@ -72,7 +73,7 @@ class SQLAlchemyStorage(base.StorageEngine):
               user_id: user uuid            (->user.id)
               project_id: project uuid      (->project.id)
               resource_id: resource uuid    (->resource.id)
-              resource_metadata: metadata dictionaries
+              metadata_id: metadata digest  (->resource_metadata.id)
               volume: sample volume
               timestamp: datetime
               message_signature: message signature
@@ -85,6 +86,12 @@ class SQLAlchemyStorage(base.StorageEngine):
               project_id: project uuid      (->project.id)
               user_id: user uuid            (->user.id)
               }
+        - resource_metadata
+          - the metadata sent with the samples, stored once for all
+            the samples sharing it
+          - { id: metadata digest
+              value: metadata dictionaries
+              }
         - sourceassoc
           - the relationships
           - { sample_id: sample id           (->sample.id)
@@ -110,6 +117,9 @@ META_TYPE_MAP = {bool: models.MetaBool,
                  long: models.MetaBigInt,
                  float: models.MetaFloat}
 
+# Upper bound on the number of rows remembered as recorded
+KNOWN_CACHE_SIZE = 10000
+
 STANDARD_AGGREGATES = dict(
     avg=func.avg(models.Sample.volume).label('avg'),
     sum=func.sum(models.Sample.volume).label('sum'),
@@ -184,7 +194,7 @@ def apply_metaquery_filter(session, query, metaquery):
             meta_q = session.query(_model).\
                 filter(and_(_model.meta_key == key,
                             _model.value == v)).subquery()
-            query = query.filter(models.Sample.id == meta_q.c.id)
+            query = query.filter(models.Sample.metadata_id == meta_q.c.id)
     return query
 
 
@@ -255,6 +265,13 @@ class Connection(base.Connection):
         sqlalchemy_session._MAKER = None
         self._CAPABILITIES = utils.update_nested(self.DEFAULT_CAPABILITIES,
                                                  AVAILABLE_CAPABILITIES)
+        # The rows already recorded, to skip looking them up again:
+        # ('source', id), (table, user or project id, source id) -> True,
+        # ('resource', id) -> (source id, user id, project id,
+        # metadata digest),
+        # ('metadata', digest) -> True,
+        # ('meter', name, type, unit) -> meter id
+        self._known = utils.LRUCache(KNOWN_CACHE_SIZE)
 
     def _get_db_session(self):
         return self._maker()
@@ -263,6 +280,7 @@ class Connection(base.Connection):
         migration.db_sync(self._engine)
 
     def clear(self):
+        self._known = utils.LRUCache(KNOWN_CACHE_SIZE)
         for table in reversed(models.Base.metadata.sorted_tables):
             self._engine.execute(table.delete())
         self._maker.close_all()
@@ -308,58 +326,150 @@ class Connection(base.Connection):
 
         return obj
 
+    @staticmethod
+    def _create_metadata(session, digest, rmetadata):
+        try:
+            with session.begin(subtransactions=True):
+                if session.query(models.ResourceMetadata).get(digest):
+                    return
+                session.add(models.ResourceMetadata(id=digest,
+                                                    value=rmetadata))
+                if rmetadata and isinstance(rmetadata, dict):
+                    for key, v in utils.dict_to_keyval(rmetadata):
+                        try:
+                            _model = META_TYPE_MAP[type(v)]
+                        except KeyError:
+                            LOG.warn(_("Unknown metadata type. Key (%s) "
+                                       "will not be queryable."), key)
+                        else:
+                            session.add(_model(id=digest,
+                                               meta_key=key,
+                                               value=v))
+                session.flush()
+        except dbexc.DBDuplicateEntry:
+            # recorded in the meantime by another process
+            pass
+
+    @staticmethod
+    def _create_or_get(session, objects, model_class, _id, source=None):
+        # only look the rows up once per batch
+        key = (model_class, _id, source and source.id)
+        if key not in objects:
+            objects[key] = Connection._create_or_update(session, model_class,
+                                                        _id, source)
+        return objects[key]
+
     def record_metering_data(self, data):
         """Write the data to the backend storage system.
 
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        The whole batch is recorded in a single transaction, so that
+        either all or none of its samples are stored.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        try:
+            self._record_samples(samples)
+        except dbexc.DBError:
+            if not len(self._known):
+                raise
+            # Some of the rows believed to exist may have been expired
+            # by another process, look them all up again
+            self._known = utils.LRUCache(KNOWN_CACHE_SIZE)
+            self._record_samples(samples)
+
+    def _record_samples(self, samples):
         session = self._get_db_session()
+        objects = {}
+        learned = {}
         with session.begin():
-            # Record the updated resource metadata
-            rmetadata = data['resource_metadata']
-            source = self._create_or_update(session, models.Source,
-                                            data['source'])
-            user = self._create_or_update(session, models.User,
-                                          data['user_id'], source)
-            project = self._create_or_update(session, models.Project,
-                                             data['project_id'], source)
-            resource = self._create_or_update(session, models.Resource,
-                                              data['resource_id'], source,
-                                              user=user, project=project,
-                                              resource_metadata=rmetadata)
-
-            # Record the raw data for the sample.
-            meter = self._create_meter(session,
-                                       data['counter_name'],
-                                       data['counter_type'],
-                                       data['counter_unit'])
-            sample = models.Sample(meter_id=meter.id,
-                                   resource=resource)
-            session.add(sample)
-            if not filter(lambda x: x.id == source.id, sample.sources):
-                sample.sources.append(source)
-            sample.project = project
-            sample.user = user
-            sample.timestamp = data['timestamp']
-            sample.resource_metadata = rmetadata
-            sample.volume = data['counter_volume']
-            sample.message_signature = data['message_signature']
-            sample.message_id = data['message_id']
-            session.flush()
-
-            if rmetadata:
-                if isinstance(rmetadata, dict):
-                    for key, v in utils.dict_to_keyval(rmetadata):
-                        try:
-                            _model = META_TYPE_MAP[type(v)]
-                        except KeyError:
-                            LOG.warn(_("Unknown metadata type. Key (%s) will "
-                                       "not be queryable."), key)
-                        else:
-                            session.add(_model(id=sample.id,
-                                               meta_key=key,
-                                               value=v))
+            for data in samples:
+                self._record_sample(session, objects, learned, data)
+        # Only remember the rows once they are committed
+        for key, value in learned.iteritems():
+            self._known[key] = value
+
+    def _is_known(self, learned, key, value=True):
+        if key in learned:
+            return learned[key] == value
+        return self._known.get(key) == value
+
+    def _record_sample(self, session, objects, learned, data):
+        rmetadata = data['resource_metadata']
+        source_id = data['source']
+        user_id = data['user_id']
+        project_id = data['project_id']
+        resource_id = data['resource_id']
+
+        def get_source():
+            return self._create_or_get(session, objects, models.Source,
+                                       source_id)
+
+        # Make sure the source, user and project rows exist, and that
+        # the source is attached to the user and project
+        if not self._is_known(learned, ('source', source_id)):
+            get_source()
+            learned[('source', source_id)] = True
+        for model_class, _id in ((models.User, user_id),
+                                 (models.Project, project_id)):
+            key = (model_class.__tablename__, _id, source_id)
+            if _id and not self._is_known(learned, key):
+                self._create_or_get(session, objects, model_class, _id,
+                                    get_source())
+                learned[key] = True
+
+        # Record the updated resource metadata, only when it changed
+        key = ('resource', resource_id)
+        digest = utils.metadata_digest(rmetadata)
+        resource = (source_id, user_id, project_id, digest)
+        if not self._is_known(learned, key, resource):
+            obj = self._create_or_update(session, models.Resource,
+                                         resource_id, get_source(),
+                                         user_id=user_id,
+                                         project_id=project_id)
+            if obj is not None and obj.metadata_hash != digest:
+                obj.resource_metadata = rmetadata
+                obj.metadata_hash = digest
+            learned[key] = resource
+
+        # The metadata is stored once, and shared by all the samples
+        # sent with it
+        key = ('metadata', digest)
+        if not self._is_known(learned, key):
+            self._create_metadata(session, digest, rmetadata)
+            learned[key] = True
+
+        # Record the raw data for the sample.
+        key = ('meter', data['counter_name'], data['counter_type'],
+               data['counter_unit'])
+        meter_id = learned.get(key) or self._known.get(key)
+        if meter_id is None:
+            meter_id = self._create_meter(session,
+                                          data['counter_name'],
+                                          data['counter_type'],
+                                          data['counter_unit']).id
+            learned[key] = meter_id
+        sample = models.Sample(meter_id=meter_id,
+                               resource_id=resource_id,
+                               user_id=user_id,
+                               project_id=project_id,
+                               metadata_id=digest)
+        sample.timestamp = data['timestamp']
+        sample.volume = data['counter_volume']
+        sample.message_signature = data['message_signature']
+        sample.message_id = data['message_id']
+        session.add(sample)
+        session.flush()
+        session.execute(models.sourceassoc.insert(),
+                        {'sample_id': sample.id, 'source_id': source_id})
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system according to the
@@ -407,6 +517,15 @@ class Connection(base.Connection):
             for res_obj in query.all():
                 session.delete(res_obj)
 
+            query = session.query(models.ResourceMetadata)\
+                .filter(~models.ResourceMetadata.id.in_(
+                    session.query(models.Sample.metadata_id).group_by(
+                        models.Sample.metadata_id)))
+            for metadata_obj in query.all():
+                session.delete(metadata_obj)
+        # Some of the rows remembered as recorded may be gone
+        self._known = utils.LRUCache(KNOWN_CACHE_SIZE)
+
     def get_users(self, source=None):
         """Return an iterable of user id strings.
 
@@ -481,8 +600,9 @@ class Connection(base.Connection):
         res_q = _apply_filters(res_q)
 
         for res_id in res_q.all():
-            # get latest Sample
+            # get latest Sample, along with its metadata
             max_q = session.query(models.Sample)\
+                .options(joinedload(models.Sample.metadata_record))\
                 .filter(models.Sample.resource_id == res_id[0])
             max_q = _apply_filters(max_q)
             max_q = max_q.order_by(models.Sample.timestamp.desc(),
@@ -503,7 +623,7 @@ class Connection(base.Connection):
                     last_sample_timestamp=sample.timestamp,
                     source=sample.sources[0].id,
                     user_id=sample.user_id,
-                    metadata=sample.resource_metadata
+                    metadata=sample.metadata_record.value
                 )
 
     def get_meters(self, user=None, project=None, resource=None, source=None,
@@ -1291,7 +1411,7 @@ class QueryTransformer(object):
         field_name = field_name[len('resource_metadata.'):]
         meta_table = META_TYPE_MAP[type(value)]
         meta_alias = aliased(meta_table)
-        on_clause = and_(self.table.id == meta_alias.id,
+        on_clause = and_(self.table.metadata_id == meta_alias.id,
                          meta_alias.meta_key == field_name)
         # outer join is needed to support metaquery
         # with or operator on non existent metadata field
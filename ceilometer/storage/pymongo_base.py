@@ -20,6 +20,7 @@
 """
 
 import pymongo
+from pymongo import errors
 import weakref
 
 from ceilometer.openstack.common.gettextutils import _  # noqa
@@ -130,6 +131,23 @@ class Connection(base.Connection):
     """Base Connection class for MongoDB and DB2 drivers.
     """
 
+    def _insert_meter_records(self, records):
+        """Insert the records of a batch of samples.
+
+        The records are identified by the message id of their sample,
+        the ones already stored by a previous attempt at recording the
+        batch are skipped, instead of being stored twice.
+        """
+        try:
+            self.db.meter.insert(records)
+        except errors.DuplicateKeyError:
+            # The insertion stopped at the first record already stored
+            for record in records:
+                try:
+                    self.db.meter.insert(record)
+                except errors.DuplicateKeyError:
+                    pass
+
     def get_users(self, source=None):
         """Return an iterable of user id strings.
 
@@ -357,9 +375,9 @@ class Connection(base.Connection):
                                          sort=orderby)
 
         for s in samples:
-            # Remove the ObjectId generated by the database when
-            # the sample was inserted. It is an implementation
-            # detail that should not leak outside of the driver.
+            # Remove the id given to the sample when it was
+            # inserted. It is an implementation detail that should
+            # not leak outside of the driver.
             del s['_id']
             # Backward compatibility for samples without units
             s['counter_unit'] = s.get('counter_unit', '')
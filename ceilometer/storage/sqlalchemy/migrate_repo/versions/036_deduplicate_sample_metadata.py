@@ -0,0 +1,175 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import json
+import types
+
+import migrate
+import sqlalchemy as sa
+
+from ceilometer import utils
+
+# The number of rows handled at once
+PAGE_SIZE = 1000
+
+tables = [('metadata_text', 'ix_meta_text_key', sa.Text, True),
+          ('metadata_bool', 'ix_meta_bool_key', sa.Boolean, False),
+          ('metadata_int', 'ix_meta_int_key', sa.BigInteger, False),
+          ('metadata_float', 'ix_meta_float_key', sa.Float(53), False)]
+
+# The tables the metadata values are stored in by the driver, according
+# to their type, see META_TYPE_MAP in impl_sqlalchemy
+META_TYPE_MAP = {bool: 'metadata_bool',
+                 str: 'metadata_text',
+                 unicode: 'metadata_text',
+                 types.NoneType: 'metadata_text',
+                 int: 'metadata_int',
+                 long: 'metadata_int',
+                 float: 'metadata_float'}
+
+
+def paged(query, id_column):
+    """Return the rows of a query page by page, ordered by id_column.
+
+    The id must be the first column of the query.
+    """
+    last = None
+    while True:
+        page = query.order_by(id_column).limit(PAGE_SIZE)
+        if last is not None:
+            page = page.where(id_column > last)
+        rows = page.execute().fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def create_meta_tables(meta, id_type, ref):
+    meta_tables = {}
+    for t_name, i_name, t_type, t_nullable in tables:
+        sa.Table(t_name, meta, autoload=True).drop()
+        meta.remove(meta.tables[t_name])
+        meta_tables[t_name] = sa.Table(
+            t_name, meta,
+            sa.Column('id', id_type, sa.ForeignKey(ref), primary_key=True),
+            sa.Column('meta_key', sa.String(255), primary_key=True),
+            sa.Column('value', t_type, nullable=t_nullable),
+            sa.Index(i_name, 'meta_key'),
+            mysql_engine='InnoDB',
+            mysql_charset='utf8',
+        )
+        meta_tables[t_name].create()
+    return meta_tables
+
+
+def insert_metadata(meta_tables, rows):
+    """Store the flattened metadata of rows of (id, metadata text)."""
+    values = dict((t_name, []) for t_name in meta_tables)
+    for _id, text in rows:
+        rmeta = json.loads(text) if text else None
+        if not rmeta or not isinstance(rmeta, dict):
+            continue
+        for key, v in utils.dict_to_keyval(rmeta):
+            t_name = META_TYPE_MAP.get(type(v))
+            if t_name is not None:
+                values[t_name].append({'id': _id, 'meta_key': key,
+                                       'value': v})
+    for t_name, t_values in values.iteritems():
+        if t_values:
+            meta_tables[t_name].insert().execute(t_values)
+
+
+def metadata_id_fk(migrate_engine, sample, resource_metadata):
+    params = {'columns': [sample.c.metadata_id],
+              'refcolumns': [resource_metadata.c.id]}
+    if migrate_engine.name == 'mysql':
+        params['name'] = 'fk_sample_metadata_id'
+    return migrate.ForeignKeyConstraint(**params)
+
+
+def upgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    resource_metadata = sa.Table(
+        'resource_metadata', meta,
+        sa.Column('id', sa.String(32), primary_key=True),
+        sa.Column('value', sa.Text),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    resource_metadata.create()
+    sample = sa.Table('sample', meta, autoload=True)
+    metadata_id = sa.Column('metadata_id', sa.String(32))
+    metadata_id.create(sample)
+
+    # Store each distinct metadata once, addressed by its digest; the
+    # same metadata may have been serialized with different key orders
+    query = sa.select([sample.c.id, sample.c.resource_metadata])
+    update = sample.update()\
+        .where(sample.c.id == sa.bindparam('sample_id'))\
+        .values(metadata_id=sa.bindparam('digest'))
+    for rows in paged(query, sample.c.id):
+        digests = {}
+        records = {}
+        updates = []
+        for _id, text in rows:
+            if text not in digests:
+                digests[text] = utils.metadata_digest(
+                    json.loads(text) if text else None)
+                records.setdefault(digests[text], text)
+            updates.append({'sample_id': _id, 'digest': digests[text]})
+        known = sa.select([resource_metadata.c.id])\
+            .where(resource_metadata.c.id.in_(records.keys())).execute()
+        for row in known:
+            del records[row['id']]
+        if records:
+            resource_metadata.insert().execute(
+                [{'id': digest, 'value': text}
+                 for digest, text in records.iteritems()])
+        migrate_engine.execute(update, updates)
+
+    if migrate_engine.name != 'sqlite':
+        metadata_id_fk(migrate_engine, sample, resource_metadata).create()
+
+    meta_tables = create_meta_tables(meta, sa.String(32),
+                                     'resource_metadata.id')
+    query = sa.select([resource_metadata.c.id, resource_metadata.c.value])
+    for rows in paged(query, resource_metadata.c.id):
+        insert_metadata(meta_tables, rows)
+
+    sample.c.resource_metadata.drop()
+
+
+def downgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    sample = sa.Table('sample', meta, autoload=True)
+    resource_metadata = sa.Table('resource_metadata', meta, autoload=True)
+    sa.Column('resource_metadata', sa.Text).create(sample)
+    query = sa.select([sample.c.id, resource_metadata.c.value])\
+        .where(sample.c.metadata_id == resource_metadata.c.id)
+    update = sample.update()\
+        .where(sample.c.id == sa.bindparam('sample_id'))\
+        .values(resource_metadata=sa.bindparam('text'))
+    for rows in paged(query, sample.c.id):
+        migrate_engine.execute(update, [{'sample_id': _id, 'text': text}
+                                        for _id, text in rows])
+
+    if migrate_engine.name != 'sqlite':
+        metadata_id_fk(migrate_engine, sample, resource_metadata).drop()
+    sample.c.metadata_id.drop()
+
+    meta_tables = create_meta_tables(meta, sa.Integer, 'sample.id')
+    query = sa.select([sample.c.id, sample.c.resource_metadata])
+    for rows in paged(query, sample.c.id):
+        insert_metadata(meta_tables, rows)
+    resource_metadata.drop()
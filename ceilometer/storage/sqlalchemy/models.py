@@ -142,6 +142,25 @@ class Source(Base):
     id = Column(String(255), primary_key=True)
 
 
+class ResourceMetadata(Base):
+    """Resource metadata, shared by all the samples sent with it.
+
+    It is addressed by its content: its id is the digest of the metadata.
+    """
+
+    __tablename__ = 'resource_metadata'
+    id = Column(String(32), primary_key=True)
+    value = Column(JSONEncodedDict())
+    meta_text = relationship("MetaText", backref="resource_metadata",
+                             cascade="all, delete-orphan")
+    meta_float = relationship("MetaFloat", backref="resource_metadata",
+                              cascade="all, delete-orphan")
+    meta_int = relationship("MetaBigInt", backref="resource_metadata",
+                            cascade="all, delete-orphan")
+    meta_bool = relationship("MetaBool", backref="resource_metadata",
+                             cascade="all, delete-orphan")
+
+
 class MetaText(Base):
     """Metering text metadata."""
 
@@ -149,7 +168,8 @@ class MetaText(Base):
     __table_args__ = (
         Index('ix_meta_text_key', 'meta_key'),
     )
-    id = Column(Integer, ForeignKey('sample.id'), primary_key=True)
+    id = Column(String(32), ForeignKey('resource_metadata.id'),
+                primary_key=True)
     meta_key = Column(String(255), primary_key=True)
     value = Column(Text)
 
@@ -161,7 +181,8 @@ class MetaBool(Base):
     __table_args__ = (
         Index('ix_meta_bool_key', 'meta_key'),
     )
-    id = Column(Integer, ForeignKey('sample.id'), primary_key=True)
+    id = Column(String(32), ForeignKey('resource_metadata.id'),
+                primary_key=True)
     meta_key = Column(String(255), primary_key=True)
     value = Column(Boolean)
 
@@ -173,7 +194,8 @@ class MetaBigInt(Base):
     __table_args__ = (
         Index('ix_meta_int_key', 'meta_key'),
     )
-    id = Column(Integer, ForeignKey('sample.id'), primary_key=True)
+    id = Column(String(32), ForeignKey('resource_metadata.id'),
+                primary_key=True)
     meta_key = Column(String(255), primary_key=True)
     value = Column(BigInteger, default=False)
 
@@ -185,7 +207,8 @@ class MetaFloat(Base):
     __table_args__ = (
         Index('ix_meta_float_key', 'meta_key'),
     )
-    id = Column(Integer, ForeignKey('sample.id'), primary_key=True)
+    id = Column(String(32), ForeignKey('resource_metadata.id'),
+                primary_key=True)
     meta_key = Column(String(255), primary_key=True)
     value = Column(Float(53), default=False)
 
@@ -218,21 +241,14 @@ class Sample(Base):
     user_id = Column(String(255), ForeignKey('user.id'))
     project_id = Column(String(255), ForeignKey('project.id'))
     resource_id = Column(String(255), ForeignKey('resource.id'))
-    resource_metadata = Column(JSONEncodedDict())
+    metadata_id = Column(String(32), ForeignKey('resource_metadata.id'))
     volume = Column(Float(53))
     timestamp = Column(PreciseTimestamp(), default=timeutils.utcnow)
     recorded_at = Column(PreciseTimestamp(), default=timeutils.utcnow)
     message_signature = Column(String(1000))
     message_id = Column(String(1000))
     sources = relationship("Source", secondary=lambda: sourceassoc)
-    meta_text = relationship("MetaText", backref="sample",
-                             cascade="all, delete-orphan")
-    meta_float = relationship("MetaFloat", backref="sample",
-                              cascade="all, delete-orphan")
-    meta_int = relationship("MetaBigInt", backref="sample",
-                            cascade="all, delete-orphan")
-    meta_bool = relationship("MetaBool", backref="sample",
-                             cascade="all, delete-orphan")
+    metadata_record = relationship("ResourceMetadata")
 
 
 class MeterSample(Base):
@@ -241,10 +257,13 @@ class MeterSample(Base):
     """
     meter = Meter.__table__
     sample = Sample.__table__
-    __table__ = join(meter, sample)
+    record = ResourceMetadata.__table__
+    __table__ = join(join(meter, sample), record)
 
     id = column_property(sample.c.id)
     meter_id = column_property(meter.c.id, sample.c.meter_id)
+    metadata_id = column_property(record.c.id, sample.c.metadata_id)
+    resource_metadata = column_property(record.c.value)
     counter_name = column_property(meter.c.name)
     counter_type = column_property(meter.c.type)
     counter_unit = column_property(meter.c.unit)
@@ -278,6 +297,7 @@ class Resource(Base):
     id = Column(String(255), primary_key=True)
     sources = relationship("Source", secondary=lambda: sourceassoc)
     resource_metadata = Column(JSONEncodedDict())
+    metadata_hash = Column(String(32))
     user_id = Column(String(255), ForeignKey('user.id'))
     project_id = Column(String(255), ForeignKey('project.id'))
     samples = relationship("Sample", backref='resource')
@@ -46,10 +46,13 @@ class TestSample(sample.Sample):
         super(TestSample, self).__init__(name, type, unit, volume, user_id,
                                          project_id, resource_id, timestamp,
                                          resource_metadata, source)
+        # Generate the id now, so that the copies made by the pollsters
+        # share it
+        self.id
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.as_dict() == other.as_dict()
         return False
 
     def __ne__(self, other):
@@ -364,6 +367,92 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         mgr.start()
         self.assertTrue(mgr.tg.add_timer.called)
 
+    def test_agent_manager_start_refresh_pipeline(self):
+        self.CONF.set_override('refresh_pipeline_cfg', True)
+        mgr = self.create_manager()
+        mgr.pollster_manager = self.mgr.pollster_manager
+        mgr.tg = mock.MagicMock()
+        mgr.start()
+        mgr.tg.add_timer.assert_any_call(20, mgr.refresh_pipeline)
+
+    def test_update_polling_tasks(self):
+        self.mgr.tg = mock.MagicMock()
+        self.mgr.polling_tasks = {}
+        self.mgr.polling_timers = {}
+        self.mgr.update_polling_tasks(self.mgr.setup_polling_tasks())
+        self.assertEqual([60], list(self.mgr.polling_timers))
+        timer = self.mgr.polling_timers[60]
+        self.assertEqual(1, self.mgr.tg.add_timer.call_count)
+
+        self.pipeline_cfg.append({
+            'name': "test_pipeline_2",
+            'interval': 10,
+            'counters': ['testanother'],
+            'transformers': [],
+            'publishers': ["test"],
+        })
+        self.setup_pipeline()
+        self.mgr.update_polling_tasks(self.mgr.setup_polling_tasks())
+        self.assertEqual([10, 60], sorted(self.mgr.polling_timers))
+        self.assertEqual(2, self.mgr.tg.add_timer.call_count)
+        self.assertFalse(timer.stop.called)
+
+        del self.pipeline_cfg[0]
+        self.setup_pipeline()
+        self.mgr.update_polling_tasks(self.mgr.setup_polling_tasks())
+        self.assertEqual([10], list(self.mgr.polling_timers))
+        self.assertEqual(2, self.mgr.tg.add_timer.call_count)
+        self.assertTrue(timer.stop.called)
+
+    def test_polling_task_for_uses_current_task(self):
+        self.mgr.tg = mock.MagicMock()
+        self.mgr.polling_tasks = {}
+        self.mgr.polling_timers = {}
+        self.mgr.update_polling_tasks(self.mgr.setup_polling_tasks())
+        self.pipeline_cfg[0]['publishers'] = ['new']
+        self.setup_pipeline()
+        self.mgr.update_polling_tasks(self.mgr.setup_polling_tasks())
+        self.mgr.polling_task_for(60)
+        pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(1, len(pub.samples))
+
+    def test_refresh_pipeline(self):
+        self.mgr.tg = mock.MagicMock()
+        self.mgr.polling_tasks = {}
+        self.mgr.polling_timers = {}
+        self.mgr.update_polling_tasks(self.mgr.setup_polling_tasks())
+        self.pipeline_cfg[0]['interval'] = 10
+        new_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                               self.transformer_manager)
+        with mock.patch('ceilometer.pipeline.reload_pipeline',
+                        return_value=new_manager):
+            self.mgr.refresh_pipeline()
+        self.assertEqual(new_manager, self.mgr.pipeline_manager)
+        self.assertEqual([10], list(self.mgr.polling_timers))
+
+    def test_reload_pipeline(self):
+        pipeline_manager = pipeline.setup_pipeline(self.transformer_manager)
+        self.assertIsNone(pipeline.reload_pipeline(pipeline_manager))
+        pipeline_manager.cfg_digest = 'outdated'
+        self.assertIsNotNone(pipeline.reload_pipeline(pipeline_manager))
+
+    def test_reload_pipeline_text(self):
+        data = six.text_type(pipeline._read_pipeline_cfg_file())
+        with mock.patch.object(pipeline, '_read_pipeline_cfg_file',
+                               return_value=data):
+            pipeline_manager = pipeline.setup_pipeline(
+                self.transformer_manager)
+            self.assertIsNone(pipeline.reload_pipeline(pipeline_manager))
+
+    def test_refresh_pipeline_unchanged(self):
+        self.mgr.tg = mock.MagicMock()
+        pipeline_manager = self.mgr.pipeline_manager
+        with mock.patch('ceilometer.pipeline.reload_pipeline',
+                        return_value=None):
+            self.mgr.refresh_pipeline()
+        self.assertEqual(pipeline_manager, self.mgr.pipeline_manager)
+        self.assertFalse(self.mgr.tg.add_timer.called)
+
     def test_manager_exception_persistency(self):
         self.pipeline_cfg.append({
             'name': "test_pipeline",
@@ -22,6 +22,7 @@ import mock
 from ceilometer.dispatcher import database
 from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import test
+from ceilometer.openstack.common import timeutils
 from ceilometer.publisher import utils
 
 
@@ -44,10 +45,10 @@ class TestDispatcherDB(test.BaseTestCase):
         )
 
         with mock.patch.object(self.dispatcher.storage_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(msg)
+        record_batch.assert_called_once_with([msg])
 
     def test_invalid_message(self):
         msg = {'counter_name': 'test',
@@ -63,6 +64,9 @@ class TestDispatcherDB(test.BaseTestCase):
             def record_metering_data(self, data):
                 self.called = True
 
+            def record_metering_data_batch(self, samples):
+                self.called = True
+
         self.dispatcher.storage_conn = ErrorConnection()
 
         self.dispatcher.record_metering_data(msg)
@@ -85,10 +89,10 @@ class TestDispatcherDB(test.BaseTestCase):
         expected['timestamp'] = datetime.datetime(2012, 7, 2, 13, 53, 40)
 
         with mock.patch.object(self.dispatcher.storage_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
 
     def test_timestamp_tzinfo_conversion(self):
         msg = {'counter_name': 'test',
@@ -106,7 +110,123 @@ class TestDispatcherDB(test.BaseTestCase):
                                                   31, 50, 262000)
 
         with mock.patch.object(self.dispatcher.storage_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
+
+    def _signed_message(self, message_id, volume=1):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': volume,
+               'message_id': message_id,
+               }
+        msg['message_signature'] = utils.compute_signature(
+            msg,
+            self.CONF.publisher.metering_secret,
+        )
+        return msg
+
+    def test_batch(self):
+        valid = self._signed_message('1')
+        invalid = self._signed_message('2')
+        invalid['counter_volume'] = 2
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data([valid, invalid])
+
+        record_batch.assert_called_once_with([valid])
+
+    def test_columnar_batch(self):
+        messages = [self._signed_message('1'), self._signed_message('2')]
+        batch = utils.unpack_meter_messages(
+            utils.pack_meter_messages(messages, columnar=True))
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data(batch)
+
+        record_batch.assert_called_once_with(messages)
+
+    def test_duplicate_disabled(self):
+        msg = self._signed_message('1')
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data(msg)
+            self.dispatcher.record_metering_data(msg)
+
+        self.assertEqual(2, record_batch.call_count)
+
+    def test_duplicate_window(self):
+        self.CONF.set_override('duplicate_window', 60,
+                               group='dispatcher_database')
+        msg = self._signed_message('1')
+        other = self._signed_message('2')
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            with mock.patch.object(utils, 'verify_signatures',
+                                   wraps=utils.verify_signatures) as verify:
+                self.dispatcher.record_metering_data(msg)
+                self.dispatcher.record_metering_data([msg, other])
+
+        self.assertEqual(2, record_batch.call_count)
+        verify.assert_called_with([other], mock.ANY)
+
+    def test_duplicate_window_expired(self):
+        self.CONF.set_override('duplicate_window', 60,
+                               group='dispatcher_database')
+        msg = self._signed_message('1')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data(msg)
+            timeutils.advance_time_seconds(61)
+            self.dispatcher.record_metering_data(msg)
+
+        self.assertEqual(2, record_batch.call_count)
+        self.assertEqual(1, len(self.dispatcher.recorded))
+
+    def test_duplicate_window_failed_record(self):
+        self.CONF.set_override('duplicate_window', 60,
+                               group='dispatcher_database')
+        msg = self._signed_message('1')
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch',
+                               side_effect=Exception('boom')) as record_batch:
+            with mock.patch.object(self.dispatcher.storage_conn,
+                                   'record_metering_data',
+                                   side_effect=Exception('boom')) as record:
+                self.dispatcher.record_metering_data(msg)
+                self.dispatcher.record_metering_data(msg)
+
+        self.assertEqual(2, record_batch.call_count)
+        self.assertEqual(2, record.call_count)
+
+    def test_batch_failure(self):
+        self.CONF.set_override('duplicate_window', 60,
+                               group='dispatcher_database')
+        rejected = self._signed_message('1')
+        accepted = self._signed_message('2')
+
+        def record(meter):
+            if meter is rejected:
+                raise Exception('boom')
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch',
+                               side_effect=Exception('boom')):
+            with mock.patch.object(self.dispatcher.storage_conn,
+                                   'record_metering_data',
+                                   side_effect=record) as record_metering_data:
+                self.dispatcher.record_metering_data([rejected, accepted])
+
+        self.assertEqual([mock.call(rejected), mock.call(accepted)],
+                         record_metering_data.call_args_list)
+        self.assertNotIn('1', self.dispatcher.recorded)
+        self.assertIn('2', self.dispatcher.recorded)
@@ -18,11 +18,14 @@
 # under the License.
 
 import abc
+import copy
 import datetime
 
+import mock
 import six
 from stevedore import extension
 
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common.fixture import mockpatch
 from ceilometer.openstack.common import test
 from ceilometer.openstack.common import timeutils
@@ -32,6 +35,7 @@ from ceilometer.publisher import test as test_publisher
 from ceilometer import sample
 from ceilometer import transformer
 from ceilometer.transformer import accumulator
+from ceilometer.transformer import aggregator
 from ceilometer.transformer import conversions
 
 
@@ -54,6 +58,7 @@ class BasePipelineTestCase(test.BaseTestCase):
             'cache': accumulator.TransformerAccumulator,
             'unit_conversion': conversions.ScalingTransformer,
             'rate_of_change': conversions.RateOfChangeTransformer,
+            'aggregator': aggregator.AggregatorTransformer,
         }
 
         if name in class_name_ext:
@@ -235,6 +240,50 @@ class BasePipelineTestCase(test.BaseTestCase):
         pipe = pipeline_manager.pipelines[0]
         self.assertEqual(5, pipe.get_interval())
 
+    def test_unchanged_sink_reused(self):
+        previous = pipeline.PipelineManager(copy.deepcopy(self.pipeline_cfg),
+                                            self.transformer_manager)
+        self._set_pipeline_cfg('interval', 10)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager,
+                                                    previous)
+        self.assertEqual(10, pipeline_manager.pipelines[0].get_interval())
+        self.assertIs(previous.pipelines[0].sink,
+                      pipeline_manager.pipelines[0].sink)
+
+    def test_changed_sink_rebuilt(self):
+        previous = pipeline.PipelineManager(copy.deepcopy(self.pipeline_cfg),
+                                            self.transformer_manager)
+        self._set_pipeline_cfg('publishers', ['new'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager,
+                                                    previous)
+        self.assertIsNot(previous.pipelines[0].sink,
+                         pipeline_manager.pipelines[0].sink)
+
+    def test_sink_changed_in_place_rebuilt(self):
+        previous = pipeline.PipelineManager(self.pipeline_cfg,
+                                            self.transformer_manager)
+        self._set_pipeline_cfg('publishers', ['new'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager,
+                                                    previous)
+        self.assertIsNot(previous.pipelines[0].sink,
+                         pipeline_manager.pipelines[0].sink)
+
+    def test_changed_sink_flushed(self):
+        self._set_pipeline_cfg('transformers', [{'name': 'cache',
+                                                 'parameters': {'size': 2}}])
+        previous = pipeline.PipelineManager(copy.deepcopy(self.pipeline_cfg),
+                                            self.transformer_manager)
+        previous.pipelines[0].publish_samples(None, [self.test_counter])
+        publisher = previous.pipelines[0].publishers[0]
+        self.assertEqual(0, len(publisher.samples))
+        self._set_pipeline_cfg('publishers', ['new'])
+        pipeline.PipelineManager(self.pipeline_cfg, self.transformer_manager,
+                                 previous)
+        self.assertEqual(1, len(publisher.samples))
+
     def test_publisher_transformer_invoked(self):
         pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
                                                     self.transformer_manager)
@@ -380,6 +429,40 @@ class BasePipelineTestCase(test.BaseTestCase):
         self.assertTrue(pipeline_manager.pipelines[0].
                         support_meter('instance'))
 
+    def test_wildcard_character_class_counters(self):
+        counter_cfg = ['disk.?.bytes', 'network.[io]*']
+        self._set_pipeline_cfg('counters', counter_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        self.assertTrue(pipe.support_meter('disk.r.bytes'))
+        self.assertFalse(pipe.support_meter('disk.read.bytes'))
+        self.assertTrue(pipe.support_meter('network.incoming.bytes'))
+        self.assertTrue(pipe.support_meter('network.outgoing.bytes'))
+        self.assertFalse(pipe.support_meter('network.bytes'))
+
+    def test_variable_counter_support_meter(self):
+        counter_cfg = ['*', '!instance:*']
+        self._set_pipeline_cfg('counters', counter_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        self.assertFalse(pipe.support_meter('instance:m1.tiny'))
+        self.assertTrue(pipe.support_meter('instance'))
+
+    def test_support_meter_decision_cached(self):
+        counter_cfg = ['*', '!disk.*']
+        self._set_pipeline_cfg('counters', counter_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        source = pipeline_manager.pipelines[0].source
+        self.assertFalse(source.support_meter('disk.read.bytes'))
+        self.assertTrue(source.support_meter('cpu'))
+        with mock.patch.object(source, '_match_meter') as match:
+            self.assertFalse(source.support_meter('disk.read.bytes'))
+            self.assertTrue(source.support_meter('cpu'))
+            self.assertFalse(match.called)
+
     def test_multiple_pipeline(self):
         self._augment_pipeline_cfg()
 
@@ -417,6 +500,59 @@ class BasePipelineTestCase(test.BaseTestCase):
         self.assertEqual('b',
                          getattr(self.TransformerClass.samples[1], "name"))
 
+    def test_multiple_pipeline_mixed_batch(self):
+        self._augment_pipeline_cfg()
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        counter_b = sample.Sample(
+            name='b',
+            type=self.test_counter.type,
+            volume=self.test_counter.volume,
+            unit=self.test_counter.unit,
+            user_id=self.test_counter.user_id,
+            project_id=self.test_counter.project_id,
+            resource_id=self.test_counter.resource_id,
+            timestamp=self.test_counter.timestamp,
+            resource_metadata=self.test_counter.resource_metadata,
+        )
+
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter, counter_b, self.test_counter])
+
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(2, len(publisher.samples))
+        self.assertEqual(['a_update', 'a_update'],
+                         [s.name for s in publisher.samples])
+        new_publisher = pipeline_manager.pipelines[1].publishers[0]
+        self.assertEqual(1, len(new_publisher.samples))
+        self.assertEqual('b_new', getattr(new_publisher.samples[0], "name"))
+
+    def test_routing_table(self):
+        self._augment_pipeline_cfg()
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        routing_table = pipeline_manager.routing_table
+        self.assertEqual([pipeline_manager.pipelines[0]],
+                         routing_table.route('a'))
+        self.assertEqual([pipeline_manager.pipelines[1]],
+                         routing_table.route('b'))
+        self.assertEqual([], routing_table.route('c'))
+
+    def test_routing_table_memoized(self):
+        self._augment_pipeline_cfg()
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        with mock.patch.object(pipeline.Source, '_match_meter',
+                               return_value=True) as match_meter:
+            with pipeline_manager.publisher(None) as p:
+                p([self.test_counter] * 10)
+            with pipeline_manager.publisher(None) as p:
+                p([self.test_counter] * 10)
+        self.assertEqual(2, match_meter.call_count)
+
     def test_multiple_pipeline_exception(self):
         self._break_pipeline_cfg()
         pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
@@ -601,6 +737,157 @@ class BasePipelineTestCase(test.BaseTestCase):
         self.assertEqual('a_update',
                          getattr(new_publisher.samples[0], 'name'))
 
+    def test_stats(self):
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter])
+
+        pipe = pipeline_manager.pipelines[0]
+        stats = pipeline_manager.stats()
+        source_stats = stats['sources'][pipe.source.name]
+        self.assertEqual(1, source_stats['samples_in'])
+        sink_stats = stats['sinks'][pipe.sink.name]
+        self.assertEqual(1, sink_stats['samples_in'])
+        self.assertEqual(1, sink_stats['samples_out'])
+        self.assertEqual(1, sink_stats['latency']['count'])
+        transformer_stats = sink_stats['transformers'][0]
+        self.assertEqual('update', transformer_stats['name'])
+        self.assertEqual(1, transformer_stats['samples_out'])
+        self.assertEqual(0, transformer_stats['dropped'])
+        publisher_stats = sink_stats['publishers'][0]
+        self.assertEqual('test://', publisher_stats['url'])
+        self.assertEqual(1, publisher_stats['samples_out'])
+        self.assertEqual(0, publisher_stats['errors'])
+
+    def test_stats_transformer_drop(self):
+        self._set_pipeline_cfg('transformers', [{'name': 'drop',
+                                                 'parameters': {}}])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter, self.test_counter])
+
+        pipe = pipeline_manager.pipelines[0]
+        sink_stats = pipeline_manager.stats()['sinks'][pipe.sink.name]
+        self.assertEqual(2, sink_stats['dropped'])
+        self.assertEqual(2, sink_stats['transformers'][0]['dropped'])
+        self.assertEqual(0, sink_stats['publishers'][0]['samples_in'])
+
+    def test_stats_publisher_error(self):
+        self._set_pipeline_cfg('publishers', ['except://', 'new://'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter])
+
+        pipe = pipeline_manager.pipelines[0]
+        sink_stats = pipeline_manager.stats()['sinks'][pipe.sink.name]
+        except_stats, new_stats = sink_stats['publishers']
+        self.assertEqual(1, except_stats['errors'])
+        self.assertEqual(1, except_stats['dropped'])
+        self.assertEqual(0, new_stats['errors'])
+        self.assertEqual(1, new_stats['samples_out'])
+
+    def test_stats_source_rejected(self):
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        counter_b = sample.Sample(
+            name='b',
+            type=self.test_counter.type,
+            volume=self.test_counter.volume,
+            unit=self.test_counter.unit,
+            user_id=self.test_counter.user_id,
+            project_id=self.test_counter.project_id,
+            resource_id=self.test_counter.resource_id,
+            timestamp=self.test_counter.timestamp,
+            resource_metadata=self.test_counter.resource_metadata,
+        )
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter, counter_b])
+
+        pipe = pipeline_manager.pipelines[0]
+        source_stats = pipeline_manager.stats()['sources'][pipe.source.name]
+        self.assertEqual(2, source_stats['samples_in'])
+        self.assertEqual(1, source_stats['samples_out'])
+        self.assertEqual(1, source_stats['dropped'])
+
+    def test_stats_transformer_error(self):
+        self._set_pipeline_cfg('transformers', [{'name': 'except',
+                                                 'parameters': {}}])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        pipe.publish_samples(None, [self.test_counter])
+
+        sink_stats = pipeline_manager.stats()['sinks'][pipe.sink.name]
+        self.assertEqual(1, sink_stats['transformers'][0]['errors'])
+        self.assertEqual(1, sink_stats['transformers'][0]['dropped'])
+
+    def test_stats_transformer_flush_error(self):
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        with mock.patch.object(pipe.sink.transformers[0], 'flush',
+                               side_effect=Exception()):
+            pipeline_manager.flush(None)
+
+        sink_stats = pipeline_manager.stats()['sinks'][pipe.sink.name]
+        self.assertEqual(1, sink_stats['transformers'][0]['errors'])
+        self.assertEqual(0, sink_stats['latency']['count'])
+
+    def test_publisher_queue(self):
+        conf = self.useFixture(config.Config()).conf
+        conf.set_override('publisher_queue_size', 10)
+        self._set_pipeline_cfg('publishers', ['except://', 'new://'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter])
+
+        pipe = pipeline_manager.pipelines[0]
+        for publisher_queue in pipe.sink.publisher_queues:
+            publisher_queue.join()
+        new_publisher = pipe.publishers[1]
+        self.assertEqual(1, len(new_publisher.samples))
+        self.assertEqual('a_update',
+                         getattr(new_publisher.samples[0], 'name'))
+
+        sink_stats = pipeline_manager.stats()['sinks'][pipe.sink.name]
+        except_stats, new_stats = sink_stats['publishers']
+        self.assertEqual(1, except_stats['errors'])
+        self.assertEqual(1, new_stats['samples_out'])
+        self.assertEqual(0, new_stats['queue']['depth'])
+        self.assertEqual(0, new_stats['queue']['dropped'])
+        pipe.sink.stop()
+
+    def test_publisher_queue_unknown_policy(self):
+        conf = self.useFixture(config.Config()).conf
+        conf.set_override('publisher_queue_size', 10)
+        conf.set_override('publisher_queue_policy', 'drop-all')
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        sink = pipeline_manager.pipelines[0].sink
+        self.assertEqual('block', sink.publisher_queues[0].policy)
+        sink.stop()
+
+    def test_publisher_queue_stopped_on_reload(self):
+        conf = self.useFixture(config.Config()).conf
+        conf.set_override('publisher_queue_size', 10)
+        previous = pipeline.PipelineManager(copy.deepcopy(self.pipeline_cfg),
+                                            self.transformer_manager)
+        previous_queue = previous.pipelines[0].sink.publisher_queues[0]
+        previous.pipelines[0].publish_samples(None, [self.test_counter])
+        self._set_pipeline_cfg('publishers', ['new://'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager,
+                                                    previous)
+        self.assertIsNone(previous_queue.worker)
+        self.assertEqual(1, len(previous.pipelines[0].publishers[0].samples))
+        self.assertIsNotNone(
+            pipeline_manager.pipelines[0].sink.publisher_queues[0].worker)
+        pipeline_manager.pipelines[0].sink.stop()
+
     def test_multiple_counter_pipeline(self):
         self._set_pipeline_cfg('counters', ['a', 'b'])
         pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
@@ -725,6 +1012,48 @@ class BasePipelineTestCase(test.BaseTestCase):
         self.assertEqual('a_update',
                          getattr(publisher.samples[0], 'name'))
 
+    def test_flush_pipeline_cache_max_age(self):
+        extra_transformer_cfg = [{
+            'name': 'cache',
+            'parameters': {'size': 100, 'max_age': 60}
+        }]
+        self._extend_pipeline_cfg('transformers', extra_transformer_cfg)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+
+        publisher = pipe.publishers[0]
+        pipe.publish_sample(None, self.test_counter)
+        pipe.flush(None)
+        self.assertEqual(0, len(publisher.samples))
+        timeutils.advance_time_seconds(30)
+        pipe.publish_sample(None, self.test_counter)
+        pipe.flush(None)
+        self.assertEqual(0, len(publisher.samples))
+        timeutils.advance_time_seconds(30)
+        pipeline_manager.flush(None)
+        self.assertEqual(2, len(publisher.samples))
+        pipeline_manager.flush(None)
+        self.assertEqual(2, len(publisher.samples))
+
+    def test_flush_pipeline_cache_max_bytes(self):
+        extra_transformer_cfg = [{
+            'name': 'cache',
+            'parameters': {'size': 100, 'max_bytes': 1}
+        }]
+        self._extend_pipeline_cfg('transformers', extra_transformer_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+
+        publisher = pipe.publishers[0]
+        pipe.publish_samples(None, [self.test_counter, self.test_counter])
+        self.assertEqual(0, len(publisher.samples))
+        pipe.flush(None)
+        self.assertEqual(2, len(publisher.samples))
+
     def test_variable_counter(self):
         self.pipeline_cfg = [{
             'name': "test_pipeline",
@@ -806,6 +1135,113 @@ class BasePipelineTestCase(test.BaseTestCase):
         self.assertEqual(sample.TYPE_CUMULATIVE, getattr(cpu_mins, 'type'))
         self.assertEqual(20, getattr(cpu_mins, 'volume'))
 
+    def test_unit_conversion_scale_expression_compiled(self):
+        transformer_cfg = [
+            {
+                'name': 'unit_conversion',
+                'parameters': {
+                    'source': {},
+                    'target': {'scale': 'volume * (resource_metadata.'
+                                        'factor or 2) + (missing or 0)'},
+                }
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['cpu'])
+        counters = [
+            sample.Sample(
+                name='cpu',
+                type=sample.TYPE_CUMULATIVE,
+                volume=10,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id='test_resource',
+                timestamp=timeutils.utcnow().isoformat(),
+                resource_metadata=metadata
+            )
+            for metadata in ({'factor': 3}, {})
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        xformer = pipe.sink.transformers[0]
+        self.assertEqual(['missing', 'resource_metadata', 'volume'],
+                         xformer._scale_expression.names)
+
+        with mock.patch.object(sample.Sample, 'as_dict') as as_dict:
+            pipe.publish_samples(None, counters)
+        self.assertFalse(as_dict.called)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual([30, 20], [s.volume for s in publisher.samples])
+
+    def test_unit_conversion_batch_isolates_errors(self):
+        transformer_cfg = [
+            {
+                'name': 'unit_conversion',
+                'parameters': {
+                    'source': {},
+                    'target': {'scale': 'volume / resource_metadata.cores'},
+                }
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['cpu'])
+        counters = [
+            sample.Sample(
+                name='cpu',
+                type=sample.TYPE_CUMULATIVE,
+                volume=12,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id='test_resource',
+                timestamp=timeutils.utcnow().isoformat(),
+                resource_metadata={'cores': cores}
+            )
+            for cores in (2, 0, 4)
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+
+        pipe.publish_samples(None, counters)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual([6, 3], [s.volume for s in publisher.samples])
+        sink_stats = pipeline_manager.stats()['sinks'][pipe.sink.name]
+        self.assertEqual(1, sink_stats['transformers'][0]['errors'])
+
+    def test_batch_transformer_invoked_once_per_batch(self):
+        extra_transformer_cfg = [{
+            'name': 'cache',
+            'parameters': {'size': 10}
+        }]
+        self._extend_pipeline_cfg('transformers', extra_transformer_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        with mock.patch.object(accumulator.TransformerAccumulator,
+                               'handle_samples',
+                               return_value=[]) as handle_samples:
+            pipe.publish_samples(None, [self.test_counter] * 3)
+        self.assertEqual(1, handle_samples.call_count)
+        self.assertEqual(3, len(handle_samples.call_args[0][1]))
+        self.assertEqual(3, len(self.TransformerClass.samples))
+
+    def test_transformer_without_batch_support(self):
+        transformer_cfg = [{'name': 'except', 'parameters': {}}]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        pipe.publish_samples(None, [self.test_counter] * 2)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(0, len(publisher.samples))
+        sink_stats = pipeline_manager.stats()['sinks'][pipe.sink.name]
+        self.assertEqual(2, sink_stats['transformers'][0]['errors'])
+
     def test_unit_identified_source_unit_conversion(self):
         transformer_cfg = [
             {
@@ -1030,6 +1466,150 @@ class BasePipelineTestCase(test.BaseTestCase):
         pipe.flush(None)
         self.assertEqual(0, len(publisher.samples))
 
+    def _do_test_rate_of_change_cache_size(self, max_cache_size):
+        transformer_cfg = [
+            {
+                'name': 'rate_of_change',
+                'parameters': {
+                    'source': {},
+                    'target': {'name': 'cpu_util',
+                               'unit': '%',
+                               'type': sample.TYPE_GAUGE},
+                    'max_cache_size': max_cache_size,
+                }
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['cpu'])
+        now = timeutils.utcnow()
+        later = now + datetime.timedelta(minutes=1)
+        counters = [
+            sample.Sample(
+                name='cpu',
+                type=sample.TYPE_CUMULATIVE,
+                volume=volume,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id=resource_id,
+                timestamp=timestamp.isoformat(),
+                resource_metadata={}
+            )
+            for (volume, timestamp) in ((0, now), (60, later))
+            for resource_id in ('test_resource', 'test_resource2')
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        pipe.publish_samples(None, counters)
+        return (pipe.publishers[0].samples,
+                pipe.sink.transformers[0].cache.stats())
+
+    def test_rate_of_change_cache_size(self):
+        published, stats = self._do_test_rate_of_change_cache_size(2)
+        self.assertEqual([1.0, 1.0], [s.volume for s in published])
+        self.assertEqual(0, stats['evictions'])
+        self.assertEqual(2, stats['hits'])
+
+    def test_rate_of_change_cache_size_exceeded(self):
+        published, stats = self._do_test_rate_of_change_cache_size(1)
+        self.assertEqual(0, len(published))
+        self.assertEqual(3, stats['evictions'])
+        self.assertEqual(4, stats['misses'])
+
+    def _do_test_aggregator(self, parameters, type, volumes):
+        transformer_cfg = [
+            {
+                'name': 'aggregator',
+                'parameters': parameters,
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['storage.api.request'])
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        counters = [
+            sample.Sample(
+                name='storage.api.request',
+                type=type,
+                volume=volume,
+                unit='request',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id=resource_id,
+                timestamp=timeutils.utcnow().isoformat(),
+                resource_metadata={'version': volume}
+            )
+            for resource_id in ('test_resource', 'test_resource2')
+            for volume in volumes
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        publisher = pipe.publishers[0]
+        pipe.publish_samples(None, counters)
+        pipe.flush(None)
+        self.assertEqual(0, len(publisher.samples))
+        timeutils.advance_time_seconds(60)
+        pipe.flush(None)
+        self.assertEqual(2, len(publisher.samples))
+        self.assertEqual(['test_resource', 'test_resource2'],
+                         sorted(s.resource_id for s in publisher.samples))
+        for s in publisher.samples:
+            self.assertEqual(volumes[-1], s.resource_metadata['version'])
+        return publisher.samples[0].volume
+
+    def test_aggregator_default_delta(self):
+        self.assertEqual(6, self._do_test_aggregator(
+            {}, sample.TYPE_DELTA, [1, 2, 3]))
+
+    def test_aggregator_default_cumulative(self):
+        self.assertEqual(2, self._do_test_aggregator(
+            {}, sample.TYPE_CUMULATIVE, [1, 3, 2]))
+
+    def test_aggregator_default_gauge(self):
+        self.assertEqual(2.0, self._do_test_aggregator(
+            {}, sample.TYPE_GAUGE, [1, 3, 2]))
+
+    def test_aggregator_max(self):
+        self.assertEqual(3, self._do_test_aggregator(
+            {'aggregation': 'max'}, sample.TYPE_GAUGE, [1, 3, 2]))
+
+    def test_aggregator_min(self):
+        self.assertEqual(1, self._do_test_aggregator(
+            {'aggregation': 'min'}, sample.TYPE_GAUGE, [2, 1, 3]))
+
+    def test_aggregator_size(self):
+        transformer_cfg = [
+            {
+                'name': 'aggregator',
+                'parameters': {'size': 1, 'retention_time': 3600,
+                               'aggregation': 'sum'},
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        pipe.publish_samples(None, [self.test_counter, self.test_counter])
+        pipe.flush(None)
+        publisher = pipe.publishers[0]
+        self.assertEqual(1, len(publisher.samples))
+        self.assertEqual(2, publisher.samples[0].volume)
+
+    def test_aggregator_invalid_aggregation(self):
+        transformer_cfg = [
+            {
+                'name': 'aggregator',
+                'parameters': {'aggregation': 'median'},
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self.assertRaises(ValueError, pipeline.PipelineManager,
+                          self.pipeline_cfg, self.transformer_manager)
+
     def test_resources(self):
         resources = ['test1://', 'test2://']
         self._set_pipeline_cfg('resources', resources)
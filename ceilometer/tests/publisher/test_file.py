@@ -24,9 +24,13 @@ import logging.handlers
 import os
 import tempfile
 
+import mock
+
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import network_utils as utils
 from ceilometer.openstack.common import test
 from ceilometer.publisher import file
+from ceilometer.publisher import utils as publisher_utils
 from ceilometer import sample
 
 
@@ -121,3 +125,108 @@ class TestFilePublisher(test.BaseTestCase):
                                   self.test_data)
 
         self.assertIsNone(publisher.publisher_logger)
+
+    def _test_file_publisher_format(self, format):
+        self.useFixture(config.Config()).conf.set_override(
+            'metering_secret', 'not-so-secret', group='publisher')
+        tempdir = tempfile.mkdtemp()
+        name = '%s/meters' % tempdir
+        parsed_url = utils.urlsplit('file://%s?format=%s' % (name, format))
+        publisher = file.FilePublisher(parsed_url)
+        self.assertIsNone(publisher.publisher_logger)
+        publisher.publish_samples(None,
+                                  self.test_data)
+
+        messages = list(file.read_meter_messages(name))
+        self.assertEqual([s.id for s in self.test_data],
+                         [m['message_id'] for m in messages])
+        self.assertTrue(all(publisher_utils.verify_signatures(
+            messages, 'not-so-secret')))
+
+    def test_file_publisher_json(self):
+        self._test_file_publisher_format('json')
+
+    def test_file_publisher_msgpack(self):
+        self._test_file_publisher_format('msgpack')
+
+    def test_file_publisher_unknown_format(self):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = utils.urlsplit('file://%s/meters?format=xml' % tempdir)
+        publisher = file.FilePublisher(parsed_url)
+        self.assertIsNone(publisher.writer)
+        self.assertIsNone(publisher.publisher_logger)
+
+    def test_file_publisher_invalid_writer_option(self):
+        tempdir = tempfile.mkdtemp()
+        parsed_url = utils.urlsplit('file://%s/meters?format=json'
+                                    '&fsync_interval=often' % tempdir)
+        publisher = file.FilePublisher(parsed_url)
+        self.assertIsNone(publisher.writer)
+
+
+class TestMeterFileWriter(test.BaseTestCase):
+    def setUp(self):
+        super(TestMeterFileWriter, self).setUp()
+        self.path = '%s/meters' % tempfile.mkdtemp()
+
+    def test_rotate_max_bytes(self):
+        writer = file.MeterFileWriter(self.path, max_bytes=20)
+        for i in range(5):
+            writer.write([{'n': i}])
+        # each message is 9 bytes long, two of them fit in a file
+        rotated = writer.rotated_files()
+        self.assertEqual(2, len(rotated))
+        self.assertEqual([[{'n': 0}, {'n': 1}], [{'n': 2}, {'n': 3}],
+                          [{'n': 4}]],
+                         [list(file.read_meter_messages(path))
+                          for path in rotated + [self.path]])
+
+    def test_rotate_backup_count(self):
+        writer = file.MeterFileWriter(self.path, max_bytes=1,
+                                      backup_count=2)
+        for i in range(5):
+            writer.write([{'n': i}])
+        self.assertEqual([[{'n': 2}], [{'n': 3}]],
+                         [list(file.read_meter_messages(path))
+                          for path in writer.rotated_files()])
+
+    @mock.patch('time.time')
+    def test_rotate_interval(self, mytime):
+        mytime.return_value = 1000
+        writer = file.MeterFileWriter(self.path, rotate_interval=60)
+        writer.write([{'n': 0}])
+        mytime.return_value = 1059
+        writer.write([{'n': 1}])
+        self.assertEqual([], writer.rotated_files())
+        mytime.return_value = 1060
+        writer.write([{'n': 2}])
+        self.assertEqual(1, len(writer.rotated_files()))
+        self.assertEqual([{'n': 2}],
+                         list(file.read_meter_messages(self.path)))
+
+    @mock.patch('os.fsync')
+    @mock.patch('time.time')
+    def test_fsync_interval(self, mytime, myfsync):
+        mytime.return_value = 1000
+        writer = file.MeterFileWriter(self.path, fsync_interval=10)
+        writer.write([{'n': 0}])
+        self.assertFalse(myfsync.called)
+        mytime.return_value = 1010
+        writer.write([{'n': 1}])
+        self.assertEqual(1, myfsync.call_count)
+
+    def test_append(self):
+        file.MeterFileWriter(self.path, format='msgpack').write([{'n': 0}])
+        file.MeterFileWriter(self.path, format='msgpack').write([{'n': 1}])
+        self.assertEqual([{'n': 0}, {'n': 1}],
+                         list(file.read_meter_messages(self.path)))
+
+    def test_read_corrupted(self):
+        with open(self.path, 'w') as f:
+            f.write('{"n": 0}\n{"n": ')
+        self.assertEqual([{'n': 0}],
+                         list(file.read_meter_messages(self.path)))
+
+    def test_read_empty(self):
+        open(self.path, 'w').close()
+        self.assertEqual([], list(file.read_meter_messages(self.path)))
@@ -19,15 +19,18 @@
 """Tests for ceilometer/publisher/rpc.py
 """
 import datetime
+import os
 
 import eventlet
 import fixtures
 import mock
 
 from ceilometer.openstack.common.fixture import config
+from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import network_utils
 from ceilometer.openstack.common import test
 from ceilometer.publisher import rpc
+from ceilometer.publisher import utils
 from ceilometer import sample
 
 
@@ -133,6 +136,67 @@ class TestPublish(test.BaseTestCase):
         self.assertEqual('custom_procedure_call',
                          self.published[0][1]['method'])
 
+    def test_published_with_max_batch_samples(self):
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?max_batch_samples=2'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+        self.assertEqual(3, len(self.published))
+        self.assertEqual([2, 2, 1], [len(rpc_call['args']['data'])
+                                     for topic, rpc_call in self.published])
+
+    def test_published_with_max_batch_bytes(self):
+        meter_bytes = len(jsonutils.dumps(
+            utils.meter_message_from_counter(self.test_data[0],
+                                             'not-so-secret')))
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?max_batch_bytes=%d'
+                                   % (meter_bytes * 2 + 10)))
+        publisher.publish_samples(None,
+                                  self.test_data)
+        self.assertEqual(3, len(self.published))
+        for topic, rpc_call in self.published:
+            self.assertTrue(1 <= len(rpc_call['args']['data']) <= 2)
+
+    def test_published_with_compression(self):
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?compression=zlib'
+                                   '&dedup_metadata=1'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+        self.assertEqual(1, len(self.published))
+        data = self.published[0][1]['args']['data']
+        self.assertEqual(utils.BATCH_FORMAT, data['format'])
+        self.assertEqual('zlib', data['compression'])
+        self.assertEqual(5, data['count'])
+        meters = utils.unpack_meter_messages(data)
+        self.assertEqual([s.name for s in self.test_data],
+                         [m['counter_name'] for m in meters])
+        self.assertTrue(all(utils.verify_signatures(
+            meters, self.CONF.publisher.metering_secret)))
+
+    def test_published_columnar(self):
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?columnar=1'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+        self.assertEqual(1, len(self.published))
+        data = self.published[0][1]['args']['data']
+        self.assertEqual(utils.BATCH_COLUMNS_VERSION, data['version'])
+        self.assertEqual(['test', 'test2', 'test3'],
+                         data['payload']['dictionaries']['counter_name'])
+        meters = utils.unpack_meter_messages(data)
+        self.assertEqual([s.name for s in self.test_data],
+                         [m['counter_name'] for m in meters])
+
+    def test_published_with_unknown_compression(self):
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?compression=lzma'))
+        self.assertIsNone(publisher.compression)
+        publisher.publish_samples(None,
+                                  self.test_data)
+        self.assertIsInstance(self.published[0][1]['args']['data'], list)
+
     def test_published_with_per_meter_topic(self):
         publisher = rpc.RPCPublisher(
             network_utils.urlsplit('rpc://?per_meter_topic=1'))
@@ -301,3 +365,114 @@ class TestPublish(test.BaseTestCase):
         self.assertEqual('test-1999',
                          publisher.local_queue[1023][2]['args']['data'][0]
                          ['source'])
+
+    def _publish_with_sources(self, publisher, sources):
+        for source in sources:
+            for s in self.test_data:
+                s.source = source
+            publisher.publish_samples(None,
+                                      self.test_data)
+
+    def test_published_with_policy_queue_and_spill(self):
+        spill_file = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                  'rpc-queue')
+        self.rpc_unreachable = True
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?policy=queue&max_queue_length=3'
+                                   '&spill_file=%s' % spill_file))
+        self._publish_with_sources(publisher,
+                                   ['test-%d' % i for i in range(5)])
+        self.assertEqual(0, len(self.published))
+        self.assertEqual(3, len(publisher.local_queue))
+        self.assertEqual(2, len(publisher.spill))
+
+        self.rpc_unreachable = False
+        self._publish_with_sources(publisher, ['test-5'])
+        self.assertEqual(['test-%d' % i for i in range(6)],
+                         [msg['args']['data'][0]['source']
+                          for topic, msg in self.published])
+        self.assertEqual(0, len(publisher.local_queue))
+        self.assertEqual(0, len(publisher.spill))
+        self.assertFalse(os.path.exists(spill_file))
+
+    def test_published_with_policy_queue_and_spill_after_restart(self):
+        spill_file = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                  'rpc-queue')
+        url = network_utils.urlsplit('rpc://?policy=queue&max_queue_length=1'
+                                     '&spill_file=%s' % spill_file)
+        self.rpc_unreachable = True
+        publisher = rpc.RPCPublisher(url)
+        self._publish_with_sources(publisher,
+                                   ['test-%d' % i for i in range(4)])
+        self.assertEqual(3, len(publisher.spill))
+
+        publisher = rpc.RPCPublisher(url)
+        self.assertEqual(3, len(publisher.spill))
+        self.rpc_unreachable = False
+        self._publish_with_sources(publisher, ['test-4'])
+        # the message only queued in memory is lost with the publisher
+        self.assertEqual(['test-0', 'test-1', 'test-2', 'test-4'],
+                         [msg['args']['data'][0]['source']
+                          for topic, msg in self.published])
+
+    def test_published_with_policy_queue_and_full_spill(self):
+        spill_file = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                  'rpc-queue')
+        self.rpc_unreachable = True
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?policy=queue&max_queue_length=1'
+                                   '&spill_file=%s&max_spill_size=1'
+                                   % spill_file))
+        self._publish_with_sources(publisher,
+                                   ['test-%d' % i for i in range(3)])
+        self.assertEqual(1, len(publisher.local_queue))
+        self.assertEqual(0, len(publisher.spill))
+
+
+class TestSpillFile(test.BaseTestCase):
+    def setUp(self):
+        super(TestSpillFile, self).setUp()
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'spill')
+
+    def test_append_replay(self):
+        spill = rpc.SpillFile(self.path)
+        self.assertEqual(0, spill.append([{'n': 1}, {'n': 2}]))
+        self.assertEqual(2, len(spill))
+        replayed = []
+        spill.replay(replayed.append)
+        self.assertEqual([{'n': 1}, {'n': 2}], replayed)
+        self.assertEqual(0, len(spill))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_replay_resumed(self):
+        spill = rpc.SpillFile(self.path)
+        spill.append([{'n': 1}, {'n': 2}, {'n': 3}])
+        replayed = []
+
+        def send(entry):
+            if entry['n'] == 2:
+                raise rpc.rpc.common.RPCException()
+            replayed.append(entry)
+
+        self.assertRaises(rpc.rpc.common.RPCException, spill.replay, send)
+        self.assertEqual(2, len(spill))
+
+        spill = rpc.SpillFile(self.path)
+        self.assertEqual(2, len(spill))
+        spill.replay(replayed.append)
+        self.assertEqual([{'n': 1}, {'n': 2}, {'n': 3}], replayed)
+
+    def test_replay_skip_corrupted(self):
+        with open(self.path, 'w') as f:
+            f.write('{"n": 1}\n{"n": \n')
+        spill = rpc.SpillFile(self.path)
+        replayed = []
+        spill.replay(replayed.append)
+        self.assertEqual([{'n': 1}], replayed)
+        self.assertEqual(0, len(spill))
+
+    def test_max_size(self):
+        spill = rpc.SpillFile(self.path, max_size=10)
+        self.assertEqual(2, spill.append([{'n': 1}, {'n': 2}, {'n': 3}]))
+        self.assertEqual(1, len(spill))
@@ -140,6 +140,52 @@ class TestUDPPublisher(test.BaseTestCase):
             [utils.meter_message_from_counter(d, "not-so-secret")
              for d in self.test_data]), sorted(sent_counters))
 
+    def test_published_packed(self):
+        self.data_sent = []
+        with mock.patch('socket.socket',
+                        self._make_fake_socket(self.data_sent)):
+            publisher = udp.UDPPublisher(
+                network_utils.urlsplit('udp://somehost?'
+                                       'max_datagram_size=8192'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+
+        self.assertEqual(1, len(self.data_sent))
+        data, dest = self.data_sent[0]
+        self.assertEqual(('somehost', self.CONF.collector.udp_port), dest)
+        self.assertEqual(sorted(
+            [utils.meter_message_from_counter(d, "not-so-secret")
+             for d in self.test_data]), sorted(msgpack.loads(data)))
+
+    def test_published_packed_max_size(self):
+        size = max(len(msgpack.dumps(
+            utils.meter_message_from_counter(d, "not-so-secret")))
+            for d in self.test_data)
+        self.data_sent = []
+        with mock.patch('socket.socket',
+                        self._make_fake_socket(self.data_sent)):
+            publisher = udp.UDPPublisher(
+                network_utils.urlsplit('udp://somehost?'
+                                       'max_datagram_size=%d'
+                                       % (size * 2 + 3)))
+        publisher.publish_samples(None,
+                                  self.test_data)
+
+        self.assertEqual(3, len(self.data_sent))
+        sent_counters = []
+        for data, dest in self.data_sent:
+            self.assertTrue(len(data) <= size * 2 + 3)
+            sent_counters.extend(msgpack.loads(data))
+        self.assertEqual(sorted(
+            [utils.meter_message_from_counter(d, "not-so-secret")
+             for d in self.test_data]), sorted(sent_counters))
+
+    def test_array_header(self):
+        for count in (0, 1, 15, 16, 300, 65535):
+            self.assertEqual(msgpack.dumps([None] * count),
+                             udp._array_header(count) +
+                             msgpack.dumps(None) * count)
+
     @staticmethod
     def _raise_ioerror(*args):
         raise IOError
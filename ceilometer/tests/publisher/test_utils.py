@@ -20,6 +20,7 @@
 """Tests for ceilometer/publisher/utils.py
 """
 
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import test
 from ceilometer.publisher import utils
@@ -101,3 +102,193 @@ class TestSignature(test.BaseTestCase):
             'not-so-secret')
         jsondata = jsonutils.loads(jsonutils.dumps(data))
         self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
+
+    def test_compute_signature_v2(self):
+        data = {'a': 'A', 'b': 'B'}
+        sig1 = utils.compute_signature(data, 'not-so-secret', 1)
+        sig2 = utils.compute_signature(data, 'not-so-secret', 2)
+        self.assertNotEqual(sig1, sig2)
+        self.assertTrue(sig2.startswith(utils.SIGNATURE_V2_PREFIX))
+        self.assertEqual(1, utils.signature_version(sig1))
+        self.assertEqual(2, utils.signature_version(sig2))
+
+    def test_compute_signature_v2_change_value(self):
+        sig1 = utils.compute_signature({'a': 'A', 'b': {'c': 'C'}},
+                                       'not-so-secret', 2)
+        sig2 = utils.compute_signature({'a': 'A', 'b': {'c': 'c'}},
+                                       'not-so-secret', 2)
+        self.assertNotEqual(sig1, sig2)
+
+    def test_compute_signature_configured_version(self):
+        data = {'a': 'A', 'b': 'B'}
+        conf = self.useFixture(config.Config()).conf
+        conf.set_override('signature_version', 2, group='publisher')
+        self.assertEqual(utils.compute_signature(data, 'not-so-secret', 2),
+                         utils.compute_signature(data, 'not-so-secret'))
+
+    def test_compute_signature_unknown_version(self):
+        self.assertRaises(ValueError, utils.compute_signature,
+                          {'a': 'A'}, 'not-so-secret', 42)
+
+    def test_verify_signature_v2(self):
+        data = {'a': 'A', 'b': 'B'}
+        data['message_signature'] = utils.compute_signature(
+            data, 'not-so-secret', 2)
+        self.assertTrue(utils.verify_signature(data, 'not-so-secret'))
+        data['b'] = 'b'
+        self.assertFalse(utils.verify_signature(data, 'not-so-secret'))
+
+    def test_verify_signature_v2_nested_json(self):
+        data = {'a': 'A',
+                'b': 'B',
+                'nested': {'a': 'A',
+                           'b': 'B',
+                           'c': ('c',),
+                           'd': ['d']
+                           },
+                }
+        data['message_signature'] = utils.compute_signature(
+            data,
+            'not-so-secret',
+            2)
+        jsondata = jsonutils.loads(jsonutils.dumps(data))
+        self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
+
+    def test_verify_signature_v2_non_string_keys_json(self):
+        data = {'a': 'A', 'nested': {1: 'one', None: 'none'}}
+        data['message_signature'] = utils.compute_signature(
+            data,
+            'not-so-secret',
+            2)
+        jsondata = jsonutils.loads(jsonutils.dumps(data))
+        self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
+
+    def test_compute_signature_v2_dict_is_not_list(self):
+        sig1 = utils.compute_signature({'a': {'b': 'B'}},
+                                       'not-so-secret', 2)
+        sig2 = utils.compute_signature({'a': [['b', 'B']]},
+                                       'not-so-secret', 2)
+        self.assertNotEqual(sig1, sig2)
+
+    def test_verify_signatures(self):
+        v1 = {'a': 'A'}
+        v1['message_signature'] = utils.compute_signature(
+            v1, 'not-so-secret', 1)
+        v2 = {'b': 'B'}
+        v2['message_signature'] = utils.compute_signature(
+            v2, 'not-so-secret', 2)
+        unsigned = {'c': 'C'}
+        invalid = {'d': 'D', 'message_signature': 'v2:invalid'}
+        self.assertEqual([True, True, False, False],
+                         utils.verify_signatures([v1, v2, unsigned, invalid],
+                                                 'not-so-secret'))
+
+    def test_verify_signature_unicode(self):
+        data = {'a': 'A', 'b': 'B'}
+        data['message_signature'] = unicode(
+            utils.compute_signature(data, 'not-so-secret'))
+        self.assertTrue(utils.verify_signature(data, 'not-so-secret'))
+
+    def test_constant_time_compare(self):
+        self.assertTrue(utils._constant_time_compare('abc', 'abc'))
+        self.assertTrue(utils._constant_time_compare(u'abc', 'abc'))
+        self.assertFalse(utils._constant_time_compare('abc', 'abd'))
+        self.assertFalse(utils._constant_time_compare('abc', 'ab'))
+        self.assertFalse(utils._constant_time_compare('abc', None))
+
+
+class TestMeterBatch(test.BaseTestCase):
+    def setUp(self):
+        super(TestMeterBatch, self).setUp()
+        self.meters = []
+        for i in range(4):
+            meter = {'counter_name': 'test',
+                     'counter_volume': i,
+                     'resource_metadata': {'name': 'resource-%d' % (i % 2),
+                                           'nested': {'a': 'A'}},
+                     }
+            meter['message_signature'] = utils.compute_signature(
+                meter, 'not-so-secret')
+            self.meters.append(meter)
+
+    def _transport(self, data):
+        return jsonutils.loads(jsonutils.dumps(data))
+
+    def test_unpack_plain(self):
+        self.assertEqual(self.meters,
+                         utils.unpack_meter_messages(self.meters))
+        self.assertEqual(self.meters[0],
+                         utils.unpack_meter_messages(self.meters[0]))
+
+    def test_pack_unpack(self):
+        batch = self._transport(utils.pack_meter_messages(self.meters))
+        self.assertEqual(utils.BATCH_FORMAT, batch['format'])
+        self.assertEqual(4, batch['count'])
+        self.assertEqual(self.meters, utils.unpack_meter_messages(batch))
+
+    def test_pack_unpack_dedup_metadata(self):
+        batch = utils.pack_meter_messages(self.meters, dedup_metadata=True)
+        self.assertEqual(2, len(batch['payload']['metadata']))
+        self.assertNotIn('resource_metadata',
+                         batch['payload']['samples'][0])
+        # the packed messages are not modified
+        self.assertIn('resource_metadata', self.meters[0])
+        meters = utils.unpack_meter_messages(self._transport(batch))
+        self.assertEqual(self.meters, meters)
+        self.assertTrue(all(utils.verify_signatures(meters,
+                                                    'not-so-secret')))
+
+    def test_pack_unpack_zlib(self):
+        batch = utils.pack_meter_messages(self.meters, compression='zlib',
+                                          dedup_metadata=True)
+        self.assertEqual('zlib', batch['compression'])
+        meters = utils.unpack_meter_messages(self._transport(batch))
+        self.assertEqual(self.meters, meters)
+
+    def test_pack_unknown_compression(self):
+        self.assertRaises(ValueError, utils.pack_meter_messages,
+                          self.meters, 'lzma')
+
+    def test_unpack_unknown_compression(self):
+        batch = utils.pack_meter_messages(self.meters)
+        batch['compression'] = 'lzma'
+        self.assertRaises(ValueError, utils.unpack_meter_messages, batch)
+
+    def test_pack_unpack_columnar(self):
+        batch = utils.pack_meter_messages(self.meters, columnar=True)
+        self.assertEqual(utils.BATCH_COLUMNS_VERSION, batch['version'])
+        payload = batch['payload']
+        self.assertEqual(['test'],
+                         payload['dictionaries']['counter_name'])
+        self.assertEqual([0, 0, 0, 0], payload['columns']['counter_name'])
+        self.assertEqual(2, len(payload['dictionaries']['resource_metadata']))
+        self.assertEqual([0, 1, 2, 3], payload['columns']['counter_volume'])
+
+        meters = utils.unpack_meter_messages(self._transport(batch))
+        self.assertIsInstance(meters, utils.MeterBatch)
+        self.assertEqual(4, len(meters))
+        self.assertEqual(self.meters, list(meters))
+        self.assertEqual(self.meters[1], meters[1])
+        self.assertEqual(self.meters[1:3], meters[1:3])
+        self.assertEqual([m['resource_metadata'] for m in self.meters],
+                         meters.column('resource_metadata'))
+        self.assertTrue(all(utils.verify_signatures(meters,
+                                                    'not-so-secret')))
+
+    def test_pack_unpack_columnar_zlib(self):
+        batch = utils.pack_meter_messages(self.meters, compression='zlib',
+                                          columnar=True)
+        meters = utils.unpack_meter_messages(self._transport(batch))
+        self.assertEqual(self.meters, list(meters))
+
+    def test_pack_columnar_different_fields(self):
+        del self.meters[0]['resource_metadata']
+        batch = utils.pack_meter_messages(self.meters, columnar=True)
+        self.assertEqual(utils.BATCH_ROWS_VERSION, batch['version'])
+        self.assertEqual(self.meters,
+                         utils.unpack_meter_messages(self._transport(batch)))
+
+    def test_unpack_unknown_version(self):
+        batch = utils.pack_meter_messages(self.meters)
+        batch['version'] = 42
+        self.assertRaises(ValueError, utils.unpack_meter_messages, batch)
@@ -28,6 +28,7 @@ from mock import patch
 
 from ceilometer.storage import impl_hbase as hbase
 from ceilometer.tests import db as tests_db
+from ceilometer.tests.storage import test_storage_scenarios as scenarios
 
 
 class HBaseEngineTestBase(tests_db.TestBase):
@@ -58,6 +59,26 @@ class ConnectionTest(HBaseEngineTestBase):
         self.assertIsInstance(conn.conn_pool, TestConn)
 
 
+class ResourceCacheTest(scenarios.DBTestBase):
+    database_connection = tests_db.HBaseFakeConnectionUrl()
+
+    def prepare_data(self):
+        self.create_and_store_sample(source='test')
+
+    def _record(self, **kwargs):
+        with patch.object(hbase.MTable, 'put', autospec=True) as put:
+            self.create_and_store_sample(source='test', **kwargs)
+        return [c[0][0].name for c in put.call_args_list]
+
+    def test_unchanged_resource(self):
+        self.assertEqual([hbase.Connection.METER_TABLE], self._record())
+
+    def test_changed_metadata(self):
+        self.assertEqual([hbase.Connection.RESOURCE_TABLE,
+                          hbase.Connection.METER_TABLE],
+                         self._record(metadata={'display_name': 'new'}))
+
+
 class CapabilitiesTest(HBaseEngineTestBase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
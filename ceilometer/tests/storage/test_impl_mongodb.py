@@ -24,6 +24,7 @@
 
 """
 
+from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage import impl_mongodb
 from ceilometer.tests import db as tests_db
@@ -87,6 +88,23 @@ class MongoDBTestMarkerBase(test_storage_scenarios.DBTestBase,
             self.assertTrue(True)
 
 
+class RecordAgainTest(test_storage_scenarios.DBTestBase,
+                      MongoDBEngineTestBase):
+
+    def test_record_batch_again(self):
+        # as when the batch is recorded again after a partial failure
+        msgs = [self.create_and_store_sample(resource_id='resource-again',
+                                             volume=i)
+                for i in range(2)]
+        self.conn.record_metering_data_batch(
+            msgs + [dict(msgs[0], message_id='new-message-id')])
+
+        f = storage.SampleFilter(resource='resource-again')
+        self.assertEqual([0, 0, 1],
+                         sorted(s.counter_volume
+                                for s in self.conn.get_samples(f)))
+
+
 class IndexTest(MongoDBEngineTestBase):
     def test_meter_ttl_index_absent(self):
         # create a fake index and check it is deleted
@@ -28,13 +28,16 @@ import repr
 
 from mock import patch
 
+from ceilometer.openstack.common.db import exception as dbexc
 from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import timeutils
+from ceilometer import storage
 from ceilometer.storage import models
 from ceilometer.storage.sqlalchemy import models as sql_models
 from ceilometer.tests import base as tests_base
 from ceilometer.tests import db as tests_db
 from ceilometer.tests.storage import test_storage_scenarios as scenarios
+from ceilometer import utils
 
 
 class EventTestBase(tests_db.TestBase):
@@ -198,9 +201,14 @@ class RelationshipTest(scenarios.DBTestBase):
         for table in meta_tables:
             self.assertEqual(0, session.query(table)
                 .filter(~table.id.in_(
-                    session.query(sql_models.Sample.id)
-                        .group_by(sql_models.Sample.id)
+                    session.query(sql_models.ResourceMetadata.id)
+                        .group_by(sql_models.ResourceMetadata.id)
                         )).count())
+        self.assertEqual(0, session.query(sql_models.ResourceMetadata)
+            .filter(~sql_models.ResourceMetadata.id.in_(
+                session.query(sql_models.Sample.metadata_id)
+                    .group_by(sql_models.Sample.metadata_id)
+                    )).count())
 
     def test_clear_metering_data_associations(self):
         timeutils.utcnow.override_time = datetime.datetime(2012, 7, 2, 10, 45)
@@ -224,6 +232,81 @@ class RelationshipTest(scenarios.DBTestBase):
                     )).count())
 
 
+class KnownRowsTest(scenarios.DBTestBase):
+    database_connection = 'sqlite://'
+
+    def prepare_data(self):
+        self.create_and_store_sample(resource_id='resource-known',
+                                     source='test')
+
+    def _samples(self):
+        f = storage.SampleFilter(resource='resource-known')
+        return list(self.conn.get_samples(f))
+
+    def test_known_rows(self):
+        with patch.object(self.conn, '_create_or_update') as create_or_update:
+            with patch.object(self.conn, '_create_meter') as create_meter:
+                self.create_and_store_sample(resource_id='resource-known',
+                                             source='test')
+        self.assertFalse(create_or_update.called)
+        self.assertFalse(create_meter.called)
+        self.assertEqual(2, len(self._samples()))
+
+    def test_resource_metadata_changed(self):
+        with patch.object(self.conn, '_create_or_update',
+                          wraps=self.conn._create_or_update) as update:
+            self.create_and_store_sample(resource_id='resource-known',
+                                         metadata={'display_name': 'new'},
+                                         source='test')
+        self.assertEqual(1, update.call_count)
+        resource = list(self.conn.get_resources(resource='resource-known'))
+        self.assertEqual({'display_name': 'new'}, resource[0].metadata)
+
+    def test_metadata_hash(self):
+        session = self.conn._get_db_session()
+        resource = session.query(sql_models.Resource).get('resource-known')
+        self.assertEqual(utils.metadata_digest(resource.resource_metadata),
+                         resource.metadata_hash)
+
+    def test_shared_metadata(self):
+        with patch.object(self.conn, '_create_metadata') as create_metadata:
+            self.create_and_store_sample(resource_id='resource-shared',
+                                         source='test')
+        self.assertFalse(create_metadata.called)
+        self.create_and_store_sample(resource_id='resource-shared',
+                                     metadata={'display_name': 'new'},
+                                     source='test')
+
+        session = self.conn._get_db_session()
+        self.assertEqual(2, session.query(sql_models.ResourceMetadata)
+                         .count())
+        f = storage.SampleFilter(resource='resource-shared',
+                                 metaquery={'metadata.display_name':
+                                            'test-server'})
+        self.assertEqual(1, len(list(self.conn.get_samples(f))))
+
+    def test_clear_expired_metering_data(self):
+        self.assertNotEqual(0, len(self.conn._known))
+        self.conn.clear_expired_metering_data(3 * 60)
+        self.assertEqual(0, len(self.conn._known))
+
+    def test_forgotten_rows(self):
+        # the rows remembered may have been expired by another process
+        with patch.object(self.conn, '_record_samples',
+                          side_effect=[dbexc.DBError(), None]) as record:
+            self.create_and_store_sample(resource_id='resource-known',
+                                         source='test')
+        self.assertEqual(2, record.call_count)
+        self.assertEqual(0, len(self.conn._known))
+
+    def test_record_error(self):
+        self.conn.clear_expired_metering_data(3 * 60)
+        with patch.object(self.conn, '_record_samples',
+                          side_effect=dbexc.DBError()) as record:
+            self.assertRaises(dbexc.DBError, self.create_and_store_sample)
+        self.assertEqual(1, record.call_count)
+
+
 class CapabilitiesTest(EventTestBase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
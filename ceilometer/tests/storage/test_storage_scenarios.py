@@ -2259,6 +2259,73 @@ class StatisticsGroupByTest(DBTestBase,
                                      datetime.datetime(2013, 8, 1, 14, 0)])
 
 
+class RecordBatchTest(DBTestBase,
+                      tests_db.MixinTestsWithBackendScenarios):
+
+    def prepare_data(self):
+        self.msgs = []
+        for i in range(3):
+            c = sample.Sample(
+                'instance',
+                sample.TYPE_GAUGE,
+                unit='',
+                volume=i,
+                user_id='user-id',
+                project_id='project-id',
+                resource_id='resource-id',
+                timestamp=datetime.datetime(2012, 7, 2, 10, 40 + i),
+                resource_metadata={'display_name': 'server-%d' % i},
+                source='test-%d' % (i % 2),
+            )
+            self.msgs.append(utils.meter_message_from_counter(
+                c,
+                self.CONF.publisher.metering_secret,
+            ))
+        self.conn.record_metering_data_batch(self.msgs)
+
+    def test_samples(self):
+        f = storage.SampleFilter(meter='instance')
+        results = list(self.conn.get_samples(f))
+        self.assertEqual([0, 1, 2],
+                         sorted(r.counter_volume for r in results))
+
+    def test_resource_metadata(self):
+        resources = list(self.conn.get_resources(resource='resource-id'))
+        self.assertEqual(1, len(resources))
+        self.assertEqual('server-2',
+                         resources[0].metadata['display_name'])
+
+    def test_sources(self):
+        self.assertEqual(['user-id'], list(self.conn.get_users('test-0')))
+        self.assertEqual(['user-id'], list(self.conn.get_users('test-1')))
+        self.assertEqual(['project-id'],
+                         list(self.conn.get_projects('test-1')))
+
+    def test_empty_batch(self):
+        self.conn.record_metering_data_batch([])
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(3, len(list(self.conn.get_samples(f))))
+
+
+class ResourceMetadataTest(DBTestBase,
+                           tests_db.MixinTestsWithBackendScenarios):
+
+    def prepare_data(self):
+        old = {'display_name': 'old', 'tag': 'self.counter'}
+        new = {'display_name': 'new', 'tag': 'self.counter'}
+        for minute, metadata in enumerate([old, dict(old), new, old]):
+            self.create_and_store_sample(
+                timestamp=datetime.datetime(2012, 7, 2, 10, 40 + minute),
+                metadata=metadata, resource_id='resource-metadata',
+                source='test')
+
+    def test_latest_metadata(self):
+        resources = list(self.conn.get_resources(
+            resource='resource-metadata'))
+        self.assertEqual(1, len(resources))
+        self.assertEqual('old', resources[0].metadata['display_name'])
+
+
 class CounterDataTypeTest(DBTestBase,
                           tests_db.MixinTestsWithBackendScenarios):
     def prepare_data(self):
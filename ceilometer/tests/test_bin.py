@@ -27,6 +27,8 @@ import time
 import httplib2
 
 from ceilometer.openstack.common import fileutils
+from ceilometer.publisher import utils
+from ceilometer import sample
 from ceilometer.tests import base
 
 
@@ -72,6 +74,32 @@ class BinTestCase(base.BaseTestCase):
         self.assertEqual(0, subp.poll())
         self.assertIn("Dropping data with TTL 1", err)
 
+    def test_import_samples_run(self):
+        message = utils.meter_message_from_counter(
+            sample.Sample(name='mycounter',
+                          type=sample.TYPE_GAUGE,
+                          unit='',
+                          volume=1,
+                          user_id='test',
+                          project_id='test',
+                          resource_id='someuuid',
+                          timestamp='2014-01-01T00:00:00',
+                          resource_metadata={}),
+            'change this or be hacked')
+        samples_file = fileutils.write_to_tempfile(
+            content=json.dumps(message) + '\n',
+            prefix='ceilometer',
+            suffix='.json')
+        self.addCleanup(os.remove, samples_file)
+        subp = subprocess.Popen(['ceilometer-import-samples',
+                                 '-d',
+                                 "--config-file=%s" % self.tempfile,
+                                 "--file=%s" % samples_file],
+                                stderr=subprocess.PIPE)
+        __, err = subp.communicate()
+        self.assertEqual(0, subp.poll())
+        self.assertIn("Imported 1 samples", err)
+
 
 class BinSendSampleTestCase(base.BaseTestCase):
     def setUp(self):
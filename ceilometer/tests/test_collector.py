@@ -17,6 +17,7 @@
 # under the License.
 import socket
 
+from eventlet import queue
 import mock
 from mock import patch
 import msgpack
@@ -24,6 +25,7 @@ from stevedore import extension
 
 from ceilometer import collector
 from ceilometer.openstack.common.fixture import config
+from ceilometer.publisher import utils as publisher_utils
 from ceilometer import sample
 from ceilometer.tests import base as tests_base
 
@@ -39,6 +41,9 @@ class TestCollector(tests_base.BaseTestCase):
         self.CONF = self.useFixture(config.Config()).conf
         self.CONF.set_override("connection", "log://", group='database')
         self.srv = collector.CollectorService('the-host', 'the-topic')
+        # Don't let the threads and timers started by start() run in the
+        # next tests, the UDP one would bind a real socket
+        self.addCleanup(self.srv.tg.stop)
         self.counter = sample.Sample(
             name='foobar',
             type='bad',
@@ -61,11 +66,12 @@ class TestCollector(tests_base.BaseTestCase):
             ),
         ])
 
-    def _make_fake_socket(self):
+    def _make_fake_socket(self, payload=None):
         def recvfrom(size):
             # Make the loop stop
             self.srv.stop()
-            return (msgpack.dumps(self.counter), ('127.0.0.1', 12345))
+            return (msgpack.dumps(payload or self.counter),
+                    ('127.0.0.1', 12345))
 
         sock = mock.Mock()
         sock.recvfrom = recvfrom
@@ -87,6 +93,72 @@ class TestCollector(tests_base.BaseTestCase):
         mock_dispatcher.record_metering_data.assert_called_once_with(
             data=self.counter)
 
+    def test_record_metering_data_batch(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+
+        batch = publisher_utils.pack_meter_messages([self.counter],
+                                                    compression='zlib',
+                                                    dedup_metadata=True)
+        self.srv.record_metering_data(None, batch)
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            data=[self.counter])
+
+    def test_record_metering_data_columnar_batch(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+
+        batch = publisher_utils.pack_meter_messages([self.counter],
+                                                    columnar=True)
+        self.srv.record_metering_data(None, batch)
+
+        data = mock_dispatcher.record_metering_data.call_args[1]['data']
+        self.assertIsInstance(data, publisher_utils.MeterBatch)
+        self.assertEqual([self.counter], list(data))
+
+    def test_record_metering_data_buffered(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+        self.srv.dispatch_buffer = collector.DispatchBuffer(
+            self.srv._dispatch_samples, 2, 1)
+        counters = [dict(self.counter, resource_id=str(i)) for i in range(3)]
+
+        self.srv.record_metering_data(None, counters[0])
+        self.assertFalse(mock_dispatcher.record_metering_data.called)
+        self.srv.record_metering_data(None, counters[1:])
+        self.srv.dispatch_buffer.pool.waitall()
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            data=counters[:2])
+
+        self.srv.stop()
+        self.assertEqual([mock.call(data=counters[:2]),
+                          mock.call(data=counters[2:])],
+                         mock_dispatcher.record_metering_data.call_args_list)
+
+    def test_dispatch_buffer_error(self):
+        dispatched = []
+
+        def dispatch(samples):
+            if samples == [1]:
+                raise Exception()
+            dispatched.append(samples)
+
+        dispatch_buffer = collector.DispatchBuffer(dispatch, 1, 2)
+        dispatch_buffer.add([1, 2])
+        dispatch_buffer.add([3])
+        dispatch_buffer.drain()
+        self.assertEqual([[2], [3]], dispatched)
+
+    def test_dispatch_buffer_flush(self):
+        dispatched = []
+        dispatch_buffer = collector.DispatchBuffer(dispatched.append, 10, 1)
+        dispatch_buffer.add([1, 2])
+        dispatch_buffer.flush()
+        dispatch_buffer.flush()
+        dispatch_buffer.drain()
+        self.assertEqual([[1, 2]], dispatched)
+
     def test_udp_receive(self):
         mock_dispatcher = mock.MagicMock()
         self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
@@ -103,7 +175,7 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
 
     def test_udp_receive_storage_error(self):
         mock_dispatcher = mock.MagicMock()
@@ -123,7 +195,84 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
+
+    def test_udp_receive_frame(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+        self.counter['source'] = 'mysource'
+        frame = [self.counter, dict(self.counter, resource_id='dog')]
+
+        udp_socket = self._make_fake_socket(frame)
+        with patch('socket.socket', return_value=udp_socket):
+            self.srv.start_udp()
+
+        self._verify_udp_socket(udp_socket)
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(frame)
+
+    def test_udp_receive_batch_size(self):
+        self.CONF.set_override('udp_batch_size', 2, group='collector')
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+        frame = [dict(self.counter, resource_id=str(i)) for i in range(3)]
+
+        udp_socket = self._make_fake_socket(frame)
+        with patch('socket.socket', return_value=udp_socket):
+            self.srv.start_udp()
+
+        self.assertEqual([mock.call(frame[:2]), mock.call(frame[2:])],
+                         mock_dispatcher.record_metering_data.call_args_list)
+
+    def test_udp_receive_queue_full(self):
+        self.CONF.set_override('udp_queue_size', 2, group='collector')
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+        frame = [dict(self.counter, resource_id=str(i)) for i in range(3)]
+
+        udp_socket = self._make_fake_socket(frame)
+        with patch('socket.socket', return_value=udp_socket):
+            self.srv.start_udp()
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            frame[:2])
+
+    def test_udp_queue_drained_on_stop(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+        self.srv.udp_queue = queue.LightQueue()
+        self.srv.udp_queue.put(self.counter)
+
+        self.srv.stop()
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            [self.counter])
+
+    def test_udp_reuse_port(self):
+        self.CONF.set_override('udp_reuse_port', True, group='collector')
+        self.srv.dispatcher_manager = self._make_test_manager(
+            mock.MagicMock())
+
+        udp_socket = self._make_fake_socket()
+        with patch('socket.socket', return_value=udp_socket):
+            with patch.object(collector, 'SO_REUSEPORT', 15):
+                self.srv.start_udp()
+
+        self.assertEqual([mock.call(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1),
+                          mock.call(socket.SOL_SOCKET, 15, 1)],
+                         udp_socket.setsockopt.call_args_list)
+
+    def test_udp_receive_bad_frame(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = self._make_test_manager(mock_dispatcher)
+
+        udp_socket = self._make_fake_socket([self.counter, 42])
+        with patch('socket.socket', return_value=udp_socket):
+            self.srv.start_udp()
+
+        self._verify_udp_socket(udp_socket)
+
+        self.assertFalse(mock_dispatcher.record_metering_data.called)
 
     @staticmethod
     def _raise_error():
@@ -158,6 +307,16 @@ class TestCollector(tests_base.BaseTestCase):
         self.CONF.set_override('udp_address', '', group='collector')
         with patch('ceilometer.openstack.common.rpc.create_connection'):
             self.srv.start()
+        self.assertIsNone(self.srv.dispatch_buffer)
+
+    def test_start_dispatch_buffer(self):
+        self.CONF.set_override('udp_address', '', group='collector')
+        self.CONF.set_override('dispatch_buffer_size', 10, group='collector')
+        with patch('ceilometer.openstack.common.rpc.create_connection'):
+            self.srv.start()
+        self.assertIsInstance(self.srv.dispatch_buffer,
+                              collector.DispatchBuffer)
+        self.assertEqual(10, self.srv.dispatch_buffer.max_samples)
 
     @patch.object(FakeConnection, 'create_worker')
     @patch('ceilometer.openstack.common.rpc.dispatcher.RpcDispatcher')
@@ -161,6 +161,23 @@ class TestDecoupledPipeline(pipeline_base.BasePipelineTestCase):
             self.assertEqual(getattr(publisher.samples[0], "name"), 'a' + sfx)
             self.assertEqual(getattr(publisher.samples[1], "name"), 'b' + sfx)
 
+    def test_source_with_multiple_sinks_stats(self):
+        self.pipeline_cfg['sinks'].append({
+            'name': 'second_sink',
+            'transformers': [],
+            'publishers': ['new'],
+        })
+        self.pipeline_cfg['sources'][0]['sinks'].append('second_sink')
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter])
+
+        source_stats = pipeline_manager.stats()['sources']['test_source']
+        self.assertEqual(1, source_stats['samples_in'])
+        self.assertEqual(1, source_stats['samples_out'])
+        self.assertEqual(1, source_stats['latency']['count'])
+
     def test_multiple_sources_with_single_sink(self):
         self.pipeline_cfg['sources'].append({
             'name': 'second_source',
@@ -152,3 +152,29 @@ class TestNotification(tests_base.BaseTestCase):
         message = {'event_type': "foo", 'message_id': "abc"}
         self.assertRaises(notification.UnableToSaveEventException,
                           self.srv._message_to_event, message)
+
+    def test_flush_pipelines(self):
+        self.srv.pipeline_manager = mock.MagicMock()
+        self.srv._flush_pipelines()
+        self.assertTrue(self.srv.pipeline_manager.flush.called)
+
+    def test_log_pipeline_stats(self):
+        self.srv.pipeline_manager = mock.MagicMock()
+        self.srv._log_pipeline_stats()
+        self.assertTrue(self.srv.pipeline_manager.log_stats.called)
+
+    def test_refresh_pipeline(self):
+        self.srv.pipeline_manager = mock.MagicMock()
+        new_manager = mock.MagicMock()
+        with mock.patch('ceilometer.pipeline.reload_pipeline',
+                        return_value=new_manager):
+            self.srv._refresh_pipeline()
+        self.assertEqual(new_manager, self.srv.pipeline_manager)
+
+    def test_refresh_pipeline_unchanged(self):
+        pipeline_manager = mock.MagicMock()
+        self.srv.pipeline_manager = pipeline_manager
+        with mock.patch('ceilometer.pipeline.reload_pipeline',
+                        return_value=None):
+            self.srv._refresh_pipeline()
+        self.assertEqual(pipeline_manager, self.srv.pipeline_manager)
@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for the PublisherQueue of ceilometer/pipeline.py
+"""
+
+import threading
+
+from ceilometer.openstack.common import test
+from ceilometer import pipeline
+
+
+class TestPublisherQueue(test.BaseTestCase):
+    def setUp(self):
+        super(TestPublisherQueue, self).setUp()
+        self.published = []
+
+    def publish(self, ctxt, samples):
+        self.published.append(samples)
+
+    def _fill(self, policy):
+        # the worker isn't started, so that nothing leaves the queue
+        publisher_queue = pipeline.PublisherQueue(self.publish, 2, policy)
+        for i in range(4):
+            publisher_queue.put(None, [i] * (i + 1))
+        return publisher_queue
+
+    def test_publish(self):
+        publisher_queue = pipeline.PublisherQueue(self.publish, 2, 'block')
+        publisher_queue.start()
+        publisher_queue.put(None, [1])
+        publisher_queue.put(None, [2])
+        publisher_queue.join()
+        self.assertEqual([[1], [2]], self.published)
+        publisher_queue.stop()
+        self.assertTrue(publisher_queue.wait())
+        self.assertIsNone(publisher_queue.worker)
+
+    def test_wait_timeout(self):
+        published = threading.Event()
+
+        def publish(ctxt, samples):
+            published.wait()
+
+        publisher_queue = pipeline.PublisherQueue(publish, 2, 'block')
+        publisher_queue.start()
+        publisher_queue.put(None, [1])
+        publisher_queue.stop()
+        self.assertFalse(publisher_queue.wait(0.01))
+        self.assertIsNotNone(publisher_queue.worker)
+        published.set()
+        self.assertTrue(publisher_queue.wait())
+
+    def test_publish_error(self):
+        def publish(ctxt, samples):
+            if samples == [1]:
+                raise Exception()
+            self.published.append(samples)
+
+        publisher_queue = pipeline.PublisherQueue(publish, 2, 'block')
+        publisher_queue.start()
+        publisher_queue.put(None, [1])
+        publisher_queue.put(None, [2])
+        publisher_queue.stop()
+        publisher_queue.join()
+        self.assertEqual([[2]], self.published)
+
+    def test_drop_newest(self):
+        publisher_queue = self._fill('drop-newest')
+        snapshot = publisher_queue.snapshot()
+        self.assertEqual(2, snapshot['depth'])
+        self.assertEqual(2, snapshot['max_depth'])
+        self.assertEqual(7, snapshot['dropped'])
+
+        publisher_queue.start()
+        publisher_queue.join()
+        self.assertEqual([[0], [1, 1]], self.published)
+
+    def test_drop_oldest(self):
+        publisher_queue = self._fill('drop-oldest')
+        snapshot = publisher_queue.snapshot()
+        self.assertEqual(2, snapshot['depth'])
+        self.assertEqual(3, snapshot['dropped'])
+
+        publisher_queue.start()
+        publisher_queue.join()
+        self.assertEqual([[2, 2, 2], [3, 3, 3, 3]], self.published)
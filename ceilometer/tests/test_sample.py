@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/sample.py
+"""
+
+import mock
+
+from ceilometer.openstack.common import test
+from ceilometer import sample
+
+
+class TestSample(test.BaseTestCase):
+
+    def setUp(self):
+        super(TestSample, self).setUp()
+        self.sample = sample.Sample(
+            name='cpu',
+            type=sample.TYPE_CUMULATIVE,
+            unit='ns',
+            volume=1,
+            user_id='user',
+            project_id='project',
+            resource_id='resource',
+            timestamp='2014-01-01T00:00:00',
+            resource_metadata={'host': 'compute'},
+            source='source',
+        )
+
+    def test_no_dict(self):
+        self.assertFalse(hasattr(self.sample, '__dict__'))
+        self.assertRaises(AttributeError, setattr, self.sample, 'foo', 1)
+
+    def test_lazy_id(self):
+        with mock.patch('uuid.uuid1', return_value='an-id') as uuid1:
+            s = sample.Sample('cpu', sample.TYPE_GAUGE, '%', 1, 'user',
+                              'project', 'resource', None, {})
+            self.assertFalse(uuid1.called)
+            self.assertEqual('an-id', s.id)
+            self.assertEqual('an-id', s.id)
+            self.assertEqual(1, uuid1.call_count)
+
+    def test_set_id(self):
+        self.sample.id = 'an-id'
+        self.assertEqual('an-id', self.sample.id)
+
+    def test_as_dict(self):
+        expected = {'source': 'source',
+                    'name': 'cpu',
+                    'type': sample.TYPE_CUMULATIVE,
+                    'unit': 'ns',
+                    'volume': 1,
+                    'user_id': 'user',
+                    'project_id': 'project',
+                    'resource_id': 'resource',
+                    'timestamp': '2014-01-01T00:00:00',
+                    'resource_metadata': {'host': 'compute'},
+                    'id': self.sample.id}
+        self.assertEqual(expected, self.sample.as_dict())
+        self.assertEqual(set(sample.FIELDS), set(self.sample.as_dict()))
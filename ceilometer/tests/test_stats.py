@@ -0,0 +1,64 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/stats.py
+"""
+
+from ceilometer.openstack.common import test
+from ceilometer import stats
+
+
+class TestHistogram(test.BaseTestCase):
+
+    def test_empty(self):
+        histogram = stats.Histogram()
+        self.assertEqual({'count': 0, 'mean': 0.0, 'p50': 0.0, 'p99': 0.0,
+                          'max': 0.0},
+                         histogram.snapshot())
+
+    def test_percentiles(self):
+        histogram = stats.Histogram()
+        for i in range(98):
+            histogram.add(0.0002)
+        histogram.add(0.2)
+        histogram.add(0.3)
+        self.assertEqual(100, histogram.count)
+        self.assertEqual(0.0005, histogram.percentile(50))
+        self.assertEqual(0.3, histogram.percentile(99))
+        self.assertEqual(0.3, histogram.max)
+
+    def test_percentile_capped_by_max(self):
+        histogram = stats.Histogram()
+        histogram.add(0.002)
+        self.assertEqual(0.002, histogram.percentile(50))
+
+    def test_overflow_bucket(self):
+        histogram = stats.Histogram()
+        histogram.add(60)
+        self.assertEqual(60, histogram.percentile(99))
+
+
+class TestComponentStats(test.BaseTestCase):
+
+    def test_record(self):
+        component_stats = stats.ComponentStats()
+        component_stats.record(10, 10, 0.01)
+        component_stats.record(10, 4, 0.01)
+        component_stats.record(0, 5, 0.01)
+        component_stats.record(3, 0, 0.01, error=True)
+        snapshot = component_stats.snapshot()
+        self.assertEqual(23, snapshot['samples_in'])
+        self.assertEqual(19, snapshot['samples_out'])
+        self.assertEqual(9, snapshot['dropped'])
+        self.assertEqual(1, snapshot['errors'])
+        self.assertEqual(4, snapshot['latency']['count'])
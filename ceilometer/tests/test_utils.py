@@ -96,3 +96,62 @@ class TestUtils(test.BaseTestCase):
                          ('nested.a', 'A'),
                          ('nested.b', 'B')],
                          pairs)
+
+    def test_metadata_digest(self):
+        digest = utils.metadata_digest({'a': 1, 'b': {'c': [1, 2]}})
+        self.assertEqual(32, len(digest))
+        self.assertEqual(digest,
+                         utils.metadata_digest({'b': {'c': [1, 2]}, 'a': 1}))
+        self.assertNotEqual(digest,
+                            utils.metadata_digest({'a': 1, 'b': {'c': [2]}}))
+        self.assertEqual(utils.metadata_digest(None),
+                         utils.metadata_digest(None))
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+        self.assertEqual(2, len(cache))
+        self.assertNotIn('b', cache)
+        self.assertEqual([('a', 1), ('c', 3)], cache.items())
+
+    def test_lru_cache_update_existing(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 10
+        cache['c'] = 3
+        self.assertEqual(10, cache['a'])
+        self.assertNotIn('b', cache)
+
+    def test_lru_cache_pop_and_clear(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        self.assertEqual(1, cache.pop('a'))
+        self.assertIsNone(cache.pop('a'))
+        cache['b'] = 2
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual([], cache.items())
+
+    def test_lru_cache_peek(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.peek('a'))
+        self.assertIsNone(cache.peek('c'))
+        self.assertEqual(('a', 1), cache.oldest())
+
+    def test_lru_cache_oldest_and_evictions(self):
+        cache = utils.LRUCache(2)
+        self.assertIsNone(cache.oldest())
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        self.assertEqual(('b', 2), cache.oldest())
+        self.assertEqual(0, cache.evictions)
+        cache['c'] = 3
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(('a', 1), cache.oldest())
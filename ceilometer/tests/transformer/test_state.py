@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/transformer/state.py
+"""
+
+import datetime
+import os
+import tempfile
+
+from ceilometer.openstack.common import test
+from ceilometer.openstack.common import timeutils
+from ceilometer.transformer import state
+
+
+class TestMemoryStateStore(test.BaseTestCase):
+
+    def setUp(self):
+        super(TestMemoryStateStore, self).setUp()
+        self.now = datetime.datetime(2014, 1, 1, 12, 0, 0)
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+
+    def test_get_set(self):
+        store = state.MemoryStateStore()
+        self.assertIsNone(store.get('a'))
+        store.set('a', 1)
+        self.assertEqual(1, store.get('a'))
+        self.assertEqual({'entries': 1, 'hits': 1, 'misses': 1,
+                          'evictions': 0, 'expirations': 0},
+                         store.stats())
+
+    def test_max_size(self):
+        store = state.MemoryStateStore(max_size=2)
+        store.set('a', 1)
+        store.set('b', 2)
+        store.get('a')
+        store.set('c', 3)
+        self.assertEqual(2, len(store))
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(1, store.get('a'))
+        self.assertEqual(1, store.stats()['evictions'])
+
+    def test_ttl(self):
+        store = state.MemoryStateStore(ttl=60)
+        store.set('a', 1)
+        timeutils.advance_time_seconds(30)
+        store.set('b', 2)
+        timeutils.advance_time_seconds(45)
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(2, store.get('b'))
+        self.assertEqual(1, store.stats()['expirations'])
+
+    def test_ttl_sweeps_stale_entries_on_set(self):
+        store = state.MemoryStateStore(ttl=60)
+        store.set('a', 1)
+        store.set('b', 2)
+        timeutils.advance_time_seconds(61)
+        store.set('c', 3)
+        self.assertEqual(1, len(store))
+        self.assertEqual(2, store.stats()['expirations'])
+
+    def test_ttl_sweeps_stale_entries_read_since(self):
+        store = state.MemoryStateStore(ttl=60)
+        store.set('a', 1)
+        timeutils.advance_time_seconds(30)
+        store.set('b', 2)
+        timeutils.advance_time_seconds(20)
+        self.assertEqual(1, store.get('a'))
+        timeutils.advance_time_seconds(20)
+        store.set('c', 3)
+        self.assertEqual(2, len(store))
+        self.assertEqual(1, store.stats()['expirations'])
+
+
+class TestFileStateStore(test.BaseTestCase):
+
+    def setUp(self):
+        super(TestFileStateStore, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'state.json')
+
+    def test_save_and_reload(self):
+        store = state.FileStateStore(self.path, max_size=10)
+        store.set('a', [1, 'x'])
+        store.set('b', [2, 'y'])
+        store.save()
+        reloaded = state.FileStateStore(self.path, max_size=10)
+        self.assertEqual([1, 'x'], reloaded.get('a'))
+        self.assertEqual([2, 'y'], reloaded.get('b'))
+
+    def test_encode_decode(self):
+        encode = lambda value: value * 2
+        decode = lambda value: value / 2
+        store = state.FileStateStore(self.path, encode=encode, decode=decode)
+        store.set('a', 21)
+        store.save()
+        reloaded = state.FileStateStore(self.path, encode=encode,
+                                        decode=decode)
+        self.assertEqual(21, reloaded.get('a'))
+
+    def test_sync_interval(self):
+        store = state.FileStateStore(self.path, sync_interval=3600)
+        store.set('a', 1)
+        store.sync()
+        self.assertFalse(os.path.exists(self.path))
+        store.sync_interval = 0
+        store.sync()
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_load_corrupted_file(self):
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        store = state.FileStateStore(self.path)
+        self.assertEqual(0, len(store))
@@ -21,6 +21,11 @@ import six
 
 from stevedore import extension
 
+from ceilometer.openstack.common.gettextutils import _  # noqa
+from ceilometer.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
 
 class TransformerExtensionManager(extension.ExtensionManager):
 
@@ -41,6 +46,10 @@ class TransformerExtensionManager(extension.ExtensionManager):
 class TransformerBase(object):
     """Base class for plugins that transform the sample."""
 
+    # The number of samples dropped after an error, which the pipeline
+    # reports in its statistics
+    errors = 0
+
     def __init__(self, **kwargs):
         """Setup transformer.
 
@@ -61,9 +70,43 @@ class TransformerBase(object):
         :param sample: A sample.
         """
 
+    def handle_samples(self, context, samples):
+        """Transform a batch of samples.
+
+        The default implementation hands each sample in turn to
+        handle_sample(), dropping only the samples that cause an error,
+        which are counted in errors. Transformers that can process a
+        batch more cheaply than one sample at a time should override it.
+
+        :param context: Passed from the data collector.
+        :param samples: A list of samples.
+        :returns: The list of transformed samples.
+        """
+        transformed = []
+        for s in samples:
+            try:
+                s = self.handle_sample(context, s)
+            except Exception:
+                self.errors += 1
+                LOG.exception(_('Transformer %(trans)s failed to handle '
+                                'sample %(smp)s') % {'trans': self,
+                                                     'smp': s})
+                continue
+            if s:
+                transformed.append(s)
+        return transformed
+
     def flush(self, context):
         """Flush samples cached previously.
 
         :param context: Passed from the data collector.
         """
         return []
+
+    def release(self, context):
+        """Flush all the samples cached previously, as the transformer is
+        about to be dropped, even those that flush() would keep.
+
+        :param context: Passed from the data collector.
+        """
+        return self.flush(context)
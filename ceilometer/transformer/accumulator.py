@@ -16,6 +16,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from ceilometer.openstack.common import jsonutils
+from ceilometer.openstack.common import timeutils
 from ceilometer import transformer
 
 
@@ -23,23 +25,61 @@ class TransformerAccumulator(transformer.TransformerBase):
     """Transformer that accumulates sample until a threshold, and then flush
     them out in the wild.
 
+    The threshold is reached once size samples are accumulated, once the
+    accumulated samples amount to max_bytes when serialized, or once the
+    oldest accumulated sample has been held for max_age seconds, whichever
+    comes first.
+
     """
 
-    def __init__(self, size=1, **kwargs):
-        if size >= 1:
-            self.samples = []
+    def __init__(self, size=1, max_age=None, max_bytes=None, **kwargs):
+        self.samples = []
         self.size = size
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.since = None
         super(TransformerAccumulator, self).__init__(**kwargs)
 
+    @staticmethod
+    def _sample_bytes(sample):
+        return len(jsonutils.dumps(sample.as_dict()))
+
+    def _accumulate(self, samples):
+        if not self.samples:
+            self.since = timeutils.utcnow_ts()
+        self.samples.extend(samples)
+        if self.max_bytes:
+            self.bytes += sum(self._sample_bytes(s) for s in samples)
+
     def handle_sample(self, context, sample):
         if self.size >= 1:
-            self.samples.append(sample)
+            self._accumulate([sample])
         else:
             return sample
 
+    def handle_samples(self, context, samples):
+        if self.size >= 1:
+            self._accumulate(samples)
+            return []
+        return samples
+
+    def _threshold_reached(self):
+        if not self.samples:
+            return False
+        return (len(self.samples) >= self.size or
+                (self.max_bytes and self.bytes >= self.max_bytes) or
+                (self.max_age and
+                 timeutils.utcnow_ts() - self.since >= self.max_age))
+
     def flush(self, context):
-        if len(self.samples) >= self.size:
-            x = self.samples
-            self.samples = []
-            return x
+        if self._threshold_reached():
+            return self.release(context)
         return []
+
+    def release(self, context):
+        x = self.samples
+        self.samples = []
+        self.bytes = 0
+        self.since = None
+        return x
@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from ceilometer.openstack.common.gettextutils import _  # noqa
+from ceilometer.openstack.common import log
+from ceilometer.openstack.common import timeutils
+from ceilometer import sample
+from ceilometer import transformer
+
+LOG = log.getLogger(__name__)
+
+AGGREGATIONS = ('sum', 'last', 'min', 'max', 'mean')
+
+# How the volumes are aggregated when no aggregation is configured:
+# a cumulative volume already includes all the previous ones, deltas
+# add up and gauges are averaged.
+DEFAULT_AGGREGATIONS = {
+    sample.TYPE_CUMULATIVE: 'last',
+    sample.TYPE_DELTA: 'sum',
+    sample.TYPE_GAUGE: 'mean',
+}
+
+
+class Aggregate(object):
+    """Running aggregate of the samples of one meter and resource."""
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'last')
+
+    def __init__(self, s):
+        self.count = 1
+        self.total = self.minimum = self.maximum = s.volume
+        self.last = s
+
+    def add(self, s):
+        self.count += 1
+        self.total += s.volume
+        self.minimum = min(self.minimum, s.volume)
+        self.maximum = max(self.maximum, s.volume)
+        self.last = s
+
+    def volume(self, aggregation):
+        if aggregation == 'sum':
+            return self.total
+        if aggregation == 'min':
+            return self.minimum
+        if aggregation == 'max':
+            return self.maximum
+        if aggregation == 'mean':
+            return 1.0 * self.total / self.count
+        return self.last.volume
+
+
+class AggregatorTransformer(transformer.TransformerBase):
+    """Transformer that collapses the samples received within a time
+    window into a single sample per meter, resource, user and project.
+
+    The aggregated samples are released on flush once retention_time
+    seconds have elapsed since the first sample of the window, or once
+    size distinct meters and resources are being aggregated.
+    """
+
+    def __init__(self, retention_time=60, size=None, aggregation=None,
+                 **kwargs):
+        """Initialize transformer with configured parameters.
+
+        :param retention_time: length in seconds of the aggregation window
+        :param size: maximum number of aggregates held before a flush
+        :param aggregation: one of sum, last, min, max or mean; by default
+                            cumulative samples keep the last volume, delta
+                            samples are summed and gauges are averaged
+        """
+        if aggregation is not None and aggregation not in AGGREGATIONS:
+            raise ValueError(_('Unknown aggregation %(aggr)s, must be one '
+                               'of %(valid)s')
+                             % {'aggr': aggregation,
+                                'valid': ', '.join(AGGREGATIONS)})
+        self.retention_time = retention_time
+        self.size = size
+        self.aggregation = aggregation
+        self.aggregates = {}
+        self.since = None
+        super(AggregatorTransformer, self).__init__(**kwargs)
+
+    @staticmethod
+    def _key(s):
+        return s.name + s.resource_id, s.user_id, s.project_id
+
+    def handle_sample(self, context, s):
+        """Fold a sample into the aggregate for its meter and resource."""
+        if not self.aggregates:
+            self.since = timeutils.utcnow_ts()
+        key = self._key(s)
+        aggregate = self.aggregates.get(key)
+        if aggregate is None:
+            self.aggregates[key] = Aggregate(s)
+        else:
+            aggregate.add(s)
+
+    def handle_samples(self, context, samples):
+        for s in samples:
+            self.handle_sample(context, s)
+        return []
+
+    def _to_sample(self, aggregate):
+        s = aggregate.last
+        aggregation = (self.aggregation or
+                       DEFAULT_AGGREGATIONS.get(s.type, 'last'))
+        return sample.Sample(
+            name=s.name,
+            type=s.type,
+            unit=s.unit,
+            volume=aggregate.volume(aggregation),
+            user_id=s.user_id,
+            project_id=s.project_id,
+            resource_id=s.resource_id,
+            timestamp=s.timestamp,
+            resource_metadata=s.resource_metadata,
+            source=s.source,
+        )
+
+    def flush(self, context):
+        if not self.aggregates:
+            return []
+        if ((self.size and len(self.aggregates) >= self.size) or
+                timeutils.utcnow_ts() - self.since >= self.retention_time):
+            return self.release(context)
+        return []
+
+    def release(self, context):
+        aggregates = self.aggregates
+        self.aggregates = {}
+        self.since = None
+        LOG.debug(_('releasing %d aggregated samples'), len(aggregates))
+        return [self._to_sample(a) for a in aggregates.values()]
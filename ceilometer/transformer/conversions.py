@@ -16,14 +16,17 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import collections
+import ast
 import re
 
+import six
+
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import timeutils
 from ceilometer import sample
 from ceilometer import transformer
+from ceilometer.transformer import state
 
 LOG = log.getLogger(__name__)
 
@@ -33,22 +36,58 @@ class Namespace(object):
        configured scale factor. This allows nested dicts to be
        accessed in the attribute style, and missing attributes
        to yield false when used in a boolean expression.
+
+       Nested dicts are only wrapped when they are accessed, so that
+       evaluating an expression doesn't pay for the parts of a large
+       resource metadata dict it never looks at.
     """
     def __init__(self, seed):
-        self.__dict__ = collections.defaultdict(lambda: Namespace({}))
-        self.__dict__.update(seed)
-        for k, v in self.__dict__.iteritems():
-            if isinstance(v, dict):
-                self.__dict__[k] = Namespace(v)
+        self._seed = seed
 
     def __getattr__(self, attr):
-        return self.__dict__[attr]
+        return self[attr]
 
     def __getitem__(self, key):
-        return self.__dict__[key]
+        try:
+            value = self._seed[key]
+        except KeyError:
+            return Namespace({})
+        return Namespace(value) if isinstance(value, dict) else value
 
     def __nonzero__(self):
-        return len(self.__dict__) > 0
+        return len(self._seed) > 0
+
+    __bool__ = __nonzero__
+
+
+class ScaleExpression(object):
+    """A scale factor expression compiled once, at pipeline setup.
+
+    The expression is evaluated against only those sample fields it
+    actually names, rather than a namespace built from the entire
+    sample. As before, names which are not sample fields evaluate to
+    an empty (false) namespace.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        tree = ast.parse(expression.strip(), mode='eval')
+        self.names = sorted(set(node.id for node in ast.walk(tree)
+                                if isinstance(node, ast.Name)))
+        self.code = compile(tree, '<scale: %s>' % expression, 'eval')
+        self._globals = {}
+
+    @staticmethod
+    def _lookup(s, name):
+        if name not in sample.FIELDS:
+            return Namespace({})
+        value = getattr(s, name)
+        return Namespace(value) if isinstance(value, dict) else value
+
+    def __call__(self, s):
+        return eval(self.code, self._globals,
+                    dict((name, self._lookup(s, name))
+                         for name in self.names))
 
 
 class ScalingTransformer(transformer.TransformerBase):
@@ -72,15 +111,28 @@ class ScalingTransformer(transformer.TransformerBase):
                      'target': target})
         super(ScalingTransformer, self).__init__(**kwargs)
 
+    @property
+    def scale(self):
+        return self._scale_factor
+
+    @scale.setter
+    def scale(self, scale):
+        """Set the scaling factor, compiling it if it is an expression."""
+        self._scale_factor = scale
+        self._scale_expression = (ScaleExpression(scale)
+                                  if isinstance(scale, six.string_types)
+                                  else None)
+
     def _scale(self, s):
         """Apply the scaling factor (either a straight multiplicative
-           factor or else a string to be eval'd).
+           factor or else a compiled expression to be evaluated).
         """
-        ns = Namespace(s.as_dict())
-
-        scale = self.scale
-        return ((eval(scale, {}, ns) if isinstance(scale, basestring)
-                 else s.volume * scale) if scale else s.volume)
+        scale = self._scale_factor
+        if not scale:
+            return s.volume
+        if self._scale_expression:
+            return self._scale_expression(s)
+        return s.volume * scale
 
     def _map(self, s, attr):
         """Apply the name or unit mapping if configured.
@@ -111,14 +163,29 @@ class ScalingTransformer(transformer.TransformerBase):
             resource_metadata=s.resource_metadata
         )
 
+    def _applies_to(self, s):
+        return self.source.get('unit', s.unit) == s.unit
+
     def handle_sample(self, context, s):
         """Handle a sample, converting if necessary."""
         LOG.debug(_('handling sample %s'), (s,))
-        if (self.source.get('unit', s.unit) == s.unit):
+        if self._applies_to(s):
             s = self._convert(s)
             LOG.debug(_('converted to: %s'), (s,))
         return s
 
+    def handle_samples(self, context, samples):
+        """Handle a batch of samples, converting where necessary."""
+        converted = []
+        for s in samples:
+            try:
+                converted.append(self._convert(s) if self._applies_to(s)
+                                 else s)
+            except Exception:
+                self.errors += 1
+                LOG.exception(_('unable to convert sample %s'), (s,))
+        return converted
+
 
 class RateOfChangeTransformer(ScalingTransformer):
     """Transformer based on the rate of change of a sample volume,
@@ -127,20 +194,46 @@ class RateOfChangeTransformer(ScalingTransformer):
        proportion of some maximum used.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, max_cache_size=state.DEFAULT_MAX_SIZE,
+                 cache_ttl=None, cache_file=None, **kwargs):
         """Initialize transformer with configured parameters.
+
+        :param max_cache_size: maximum number of resources for which the
+                               previous sample is remembered
+        :param cache_ttl: seconds after which the previous sample of a
+                          resource which stopped reporting is forgotten
+        :param cache_file: optional file the previous samples are saved
+                           to, so they survive a restart
         """
         super(RateOfChangeTransformer, self).__init__(**kwargs)
-        self.cache = {}
+        if cache_file:
+            self.cache = state.FileStateStore(cache_file,
+                                              max_cache_size,
+                                              cache_ttl,
+                                              encode=self._encode_state,
+                                              decode=self._decode_state)
+        else:
+            self.cache = state.MemoryStateStore(max_cache_size, cache_ttl)
         self.scale = self.scale or '1'
 
-    def handle_sample(self, context, s):
-        """Handle a sample, converting if necessary."""
-        LOG.debug(_('handling sample %s'), (s,))
+    @staticmethod
+    def _encode_state(value):
+        volume, timestamp = value
+        return volume, timestamp.isoformat()
+
+    @staticmethod
+    def _decode_state(value):
+        volume, timestamp = value
+        return volume, timeutils.parse_isotime(timestamp)
+
+    def _rate_of_change(self, s):
+        """Derive the rate of change from the previous sample of the same
+           meter and resource, returning None if there is no predecessor.
+        """
         key = s.name + s.resource_id
         prev = self.cache.get(key)
         timestamp = timeutils.parse_isotime(s.timestamp)
-        self.cache[key] = (s.volume, timestamp)
+        self.cache.set(key, (s.volume, timestamp))
 
         if prev:
             prev_volume = prev[0]
@@ -156,10 +249,33 @@ class RateOfChangeTransformer(ScalingTransformer):
             rate_of_change = ((1.0 * volume_delta / time_delta)
                               if time_delta else 0.0)
 
-            s = self._convert(s, rate_of_change)
-            LOG.debug(_('converted to: %s'), (s,))
+            return self._convert(s, rate_of_change)
         else:
             LOG.warn(_('dropping sample with no predecessor: %s'),
                      (s,))
-            s = None
+
+    def handle_sample(self, context, s):
+        """Handle a sample, converting if necessary."""
+        LOG.debug(_('handling sample %s'), (s,))
+        s = self._rate_of_change(s)
+        if s:
+            LOG.debug(_('converted to: %s'), (s,))
         return s
+
+    def handle_samples(self, context, samples):
+        """Handle a batch of samples, converting where possible."""
+        converted = []
+        for s in samples:
+            try:
+                s = self._rate_of_change(s)
+            except Exception:
+                self.errors += 1
+                LOG.exception(_('unable to convert sample %s'), (s,))
+                continue
+            if s:
+                converted.append(s)
+        return converted
+
+    def flush(self, context):
+        self.cache.sync()
+        return []
@@ -0,0 +1,162 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Stores for the state kept by transformers between samples, such as
+the previous volume of each resource seen by the rate of change
+transformer.
+"""
+
+import abc
+import os
+
+import six
+
+from ceilometer.openstack.common.gettextutils import _  # noqa
+from ceilometer.openstack.common import jsonutils
+from ceilometer.openstack.common import log
+from ceilometer.openstack.common import timeutils
+from ceilometer import utils
+
+LOG = log.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 100000
+
+
+@six.add_metaclass(abc.ABCMeta)
+class StateStore(object):
+    """Base class for transformer state stores."""
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the state stored for key, or None."""
+
+    @abc.abstractmethod
+    def set(self, key, value):
+        """Store the state for key."""
+
+    def sync(self):
+        """Persist the state, for stores which support it."""
+
+    def stats(self):
+        """Return a dict of counters describing the store usage."""
+        return {}
+
+
+class MemoryStateStore(StateStore):
+    """In-memory state store holding at most max_size entries.
+
+    The least recently used entries are evicted to make room for new
+    ones and, when a ttl is set, entries which haven't been updated in
+    the last ttl seconds expire. With a ttl, the entries are kept in the
+    order they were last updated rather than used, so that the stale
+    ones are always the oldest, whether they are read or not.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self._entries = utils.LRUCache(max_size)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        if self.ttl:
+            entry = self._entries.peek(key)
+        else:
+            entry = self._entries.get(key)
+        if (entry is not None and self.ttl and
+                timeutils.utcnow_ts() - entry[1] > self.ttl):
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, stored_at=None):
+        now = timeutils.utcnow_ts()
+        self._entries[key] = (value, now if stored_at is None else stored_at)
+        if self.ttl:
+            self._expire(now)
+
+    def _expire(self, now):
+        oldest = self._entries.oldest()
+        while oldest and now - oldest[1][1] > self.ttl:
+            del self._entries[oldest[0]]
+            self.expirations += 1
+            oldest = self._entries.oldest()
+
+    def stats(self):
+        return {'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self._entries.evictions,
+                'expirations': self.expirations}
+
+
+class FileStateStore(MemoryStateStore):
+    """Memory state store periodically saved to a local file.
+
+    The state is reloaded from the file when the store is created, so
+    that a restarted agent doesn't lose the state of every resource.
+
+    :param path: The file to persist the state to.
+    :param sync_interval: Minimum number of seconds between two saves.
+    :param encode: Converts a value to something JSON serializable.
+    :param decode: Converts a deserialized value back.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, ttl=None,
+                 sync_interval=60, encode=None, decode=None):
+        super(FileStateStore, self).__init__(max_size, ttl)
+        self.path = path
+        self.sync_interval = sync_interval
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda value: value)
+        self._last_sync = timeutils.utcnow_ts()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = jsonutils.loads(f.read())
+            # entries are saved from least to most recently used
+            for key, value, stored_at in entries:
+                self.set(key, self.decode(value), stored_at)
+        except Exception:
+            LOG.exception(_('Unable to load transformer state from %s'),
+                          self.path)
+
+    def save(self):
+        entries = [(key, self.encode(value), stored_at)
+                   for key, (value, stored_at) in self._entries.items()]
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(jsonutils.dumps(entries))
+            os.rename(tmp_path, self.path)
+        except Exception:
+            LOG.exception(_('Unable to save transformer state to %s'),
+                          self.path)
+        self._last_sync = timeutils.utcnow_ts()
+
+    def sync(self):
+        if timeutils.utcnow_ts() - self._last_sync >= self.sync_interval:
+            self.save()
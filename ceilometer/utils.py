@@ -22,8 +22,10 @@ import calendar
 import copy
 import datetime
 import decimal
+import hashlib
 import multiprocessing
 
+from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import timeutils
 from ceilometer.openstack.common import units
 
@@ -167,3 +169,122 @@ def uniq(dupes, attrs):
             deduped.append(d)
             keys.append(key(d))
     return deduped
+
+
+def metadata_digest(metadata):
+    """Return a digest of metadata, which doesn't depend on the key order.
+
+    The digest of the resource metadata is stored along with it, so that
+    the storage drivers only write the metadata when it changes.
+    """
+    return hashlib.md5(jsonutils.dumps(metadata, sort_keys=True)).hexdigest()
+
+
+class LRUCache(object):
+    """Mapping that keeps at most max_size of its most recently used items.
+
+    Lookups and insertions are O(1); the least recently used entry is
+    evicted when inserting a new key into a full cache, and counted in
+    the evictions attribute.
+    """
+
+    _PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.evictions = 0
+        self._data = {}
+        # circular doubly linked list, the root sits between the most
+        # recently used (root[_PREV]) and least recently used (root[_NEXT])
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def _unlink(self, link):
+        link_prev, link_next = link[self._PREV], link[self._NEXT]
+        link_prev[self._NEXT] = link_next
+        link_next[self._PREV] = link_prev
+
+    def _append(self, link):
+        root = self._root
+        last = root[self._PREV]
+        link[self._PREV], link[self._NEXT] = last, root
+        last[self._NEXT] = root[self._PREV] = link
+
+    def get(self, key, default=None):
+        link = self._data.get(key)
+        if link is None:
+            return default
+        self._unlink(link)
+        self._append(link)
+        return link[self._VALUE]
+
+    def peek(self, key, default=None):
+        """Return the value of key, or default.
+
+        Unlike get(), this doesn't count as a use of the entry.
+        """
+        link = self._data.get(key)
+        if link is None:
+            return default
+        return link[self._VALUE]
+
+    def __getitem__(self, key):
+        link = self._data[key]
+        self._unlink(link)
+        self._append(link)
+        return link[self._VALUE]
+
+    def __setitem__(self, key, value):
+        link = self._data.get(key)
+        if link is not None:
+            link[self._VALUE] = value
+            self._unlink(link)
+            self._append(link)
+            return
+        if self.max_size > 0 and len(self._data) >= self.max_size:
+            oldest = self._root[self._NEXT]
+            self._unlink(oldest)
+            del self._data[oldest[self._KEY]]
+            self.evictions += 1
+        link = [None, None, key, value]
+        self._append(link)
+        self._data[key] = link
+
+    def __delitem__(self, key):
+        self._unlink(self._data.pop(key))
+
+    def pop(self, key, default=None):
+        link = self._data.pop(key, None)
+        if link is None:
+            return default
+        self._unlink(link)
+        return link[self._VALUE]
+
+    def oldest(self):
+        """Return the least recently used (key, value) pair, or None.
+
+        Unlike get(), this doesn't count as a use of the entry.
+        """
+        link = self._root[self._NEXT]
+        if link is self._root:
+            return None
+        return link[self._KEY], link[self._VALUE]
+
+    def clear(self):
+        self._data.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def items(self):
+        """Return (key, value) pairs from least to most recently used."""
+        items = []
+        link = self._root[self._NEXT]
+        while link is not self._root:
+            items.append((link[self._KEY], link[self._VALUE]))
+            link = link[self._NEXT]
+        return items
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Micro-benchmark for pipeline source meter matching.
+
+Compares the per-sample cost of the fnmatch based matching previously
+used by Source.support_meter with the precompiled matcher.
+"""
+from __future__ import print_function
+
+import argparse
+import fnmatch
+import random
+import timeit
+
+from ceilometer import pipeline
+
+METERS = [
+    'cpu', 'cpu_util', 'memory', 'memory.usage', 'vcpus', 'instance',
+    'instance:m1.tiny', 'instance:m1.large', 'disk.read.bytes',
+    'disk.write.bytes', 'disk.read.requests', 'disk.write.requests',
+    'disk.read.bytes.rate', 'network.incoming.bytes',
+    'network.outgoing.bytes', 'network.incoming.packets',
+    'network.outgoing.packets', 'storage.objects', 'storage.objects.size',
+    'storage.api.request', 'image.size', 'volume.size', 'ip.floating',
+    'hardware.cpu.util.1min', 'switch.port.receive.bytes',
+]
+
+SOURCES = [
+    ['*'],
+    ['*', '!disk.*', '!network.*'],
+    ['cpu', 'cpu_util', 'memory.*', 'instance:*'],
+    ['disk.read.bytes', 'disk.read.requests', 'disk.write.bytes',
+     'disk.write.requests'],
+    ['network.incoming.*', 'network.outgoing.*'],
+    ['!storage.*', '!image.*', '!hardware.*'],
+    ['switch.*', 'hardware.*', 'ip.*'],
+]
+
+
+def legacy_support_meter(meters, meter_name):
+    """The uncompiled matching, kept as a reference point."""
+    meter_name = pipeline.Source._variable_meter_name(meter_name)
+    default = all(meter.startswith('!') for meter in meters)
+    if any(fnmatch.fnmatch(meter_name, meter[1:])
+           for meter in meters
+           if meter[0] == '!'):
+        return False
+    if any(fnmatch.fnmatch(meter_name, meter)
+           for meter in meters
+           if meter[0] != '!'):
+        return True
+    return default
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark pipeline meter matching',
+    )
+    parser.add_argument(
+        '--samples',
+        default=10000,
+        type=int,
+        help='The number of sample names matched per run.',
+    )
+    parser.add_argument(
+        '--sources',
+        default=40,
+        type=int,
+        help='The number of pipeline sources to match against.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=5,
+        type=int,
+        help='The number of runs, the best one is reported.',
+    )
+    args = parser.parse_args()
+
+    meter_cfgs = [SOURCES[i % len(SOURCES)] for i in range(args.sources)]
+    sources = [pipeline.Source({'name': 'source_%d' % i,
+                                'interval': 600,
+                                'meters': meters,
+                                'sinks': ['sink']})
+               for i, meters in enumerate(meter_cfgs)]
+    names = [random.choice(METERS) for _ in range(args.samples)]
+
+    for (legacy, compiled) in zip(meter_cfgs, sources):
+        for name in METERS:
+            assert (legacy_support_meter(legacy, name) ==
+                    compiled.support_meter(name)), (legacy, name)
+
+    def run_legacy():
+        for name in names:
+            for meters in meter_cfgs:
+                legacy_support_meter(meters, name)
+
+    def run_compiled():
+        for name in names:
+            for source in sources:
+                source.support_meter(name)
+
+    checks = float(args.samples * args.sources)
+    for label, func in (('fnmatch', run_legacy), ('compiled', run_compiled)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('%-10s %8.3f us/sample/source %10.0f checks/s'
+              % (label, best / checks * 1e6, checks / best))
+
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark for the sample pipelines.
+
+Drives a PipelineManager with a synthetic stream of samples, using a
+pipeline.yaml definition whose publishers are replaced by the in-memory
+test publisher, so that no message bus is needed. Reports the samples
+throughput, the p50 and p99 latency of publishing a batch and the peak
+RSS of the process.
+"""
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import os
+import random
+import resource
+import time
+
+from oslo.config import cfg
+import yaml
+
+from ceilometer import pipeline
+from ceilometer import sample
+from ceilometer import transformer
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(__file__), '..', 'etc',
+                              'ceilometer', 'pipeline.yaml')
+
+# name, type, unit and volume increment per polling cycle
+METERS = [
+    ('cpu', sample.TYPE_CUMULATIVE, 'ns', 10 ** 9),
+    ('cpu_util', sample.TYPE_GAUGE, '%', 0),
+    ('memory', sample.TYPE_GAUGE, 'MB', 0),
+    ('vcpus', sample.TYPE_GAUGE, 'vcpu', 0),
+    ('instance', sample.TYPE_GAUGE, 'instance', 0),
+    ('instance:m1.tiny', sample.TYPE_GAUGE, 'instance', 0),
+    ('disk.read.bytes', sample.TYPE_CUMULATIVE, 'B', 4096),
+    ('disk.write.bytes', sample.TYPE_CUMULATIVE, 'B', 8192),
+    ('disk.read.requests', sample.TYPE_CUMULATIVE, 'request', 8),
+    ('disk.write.requests', sample.TYPE_CUMULATIVE, 'request', 16),
+    ('network.incoming.bytes', sample.TYPE_CUMULATIVE, 'B', 65536),
+    ('network.outgoing.bytes', sample.TYPE_CUMULATIVE, 'B', 32768),
+    ('network.incoming.packets', sample.TYPE_CUMULATIVE, 'packet', 64),
+    ('network.outgoing.packets', sample.TYPE_CUMULATIVE, 'packet', 32),
+    ('storage.objects', sample.TYPE_GAUGE, 'object', 0),
+    ('image.size', sample.TYPE_GAUGE, 'B', 0),
+]
+
+# Meter definitions of the extra sources, mixing wildcards, exclusions
+# and plain names
+EXTRA_SOURCE_METERS = [
+    ['*', '!disk.*', '!network.*'],
+    ['cpu', 'cpu_util', 'memory', 'instance:*'],
+    ['disk.read.*', 'disk.write.*'],
+    ['network.incoming.*', 'network.outgoing.*'],
+    ['!storage.*', '!image.*'],
+]
+
+
+def load_pipeline_cfg(path, extra_sources):
+    with open(path) as f:
+        pipeline_cfg = yaml.safe_load(f)
+
+    if isinstance(pipeline_cfg, list):
+        sinks = pipeline_cfg
+    else:
+        sinks = pipeline_cfg['sinks']
+    for sink in sinks:
+        sink['publishers'] = ['test://']
+
+    for i in range(extra_sources):
+        meters = EXTRA_SOURCE_METERS[i % len(EXTRA_SOURCE_METERS)]
+        name = 'bench_%d' % i
+        if isinstance(pipeline_cfg, list):
+            pipeline_cfg.append({'name': name, 'interval': 600,
+                                 'meters': meters, 'transformers': None,
+                                 'publishers': ['test://']})
+        else:
+            pipeline_cfg['sources'].append({'name': name, 'interval': 600,
+                                            'meters': meters,
+                                            'sinks': ['bench_sink']})
+    if extra_sources and not isinstance(pipeline_cfg, list):
+        pipeline_cfg['sinks'].append({'name': 'bench_sink',
+                                      'transformers': None,
+                                      'publishers': ['test://']})
+    return pipeline_cfg
+
+
+def make_batches(args):
+    """Generate the samples of each polling cycle, in batches."""
+    rand = random.Random(args.seed)
+    resources = ['resource-%d' % i for i in range(args.resources)]
+    volumes = {}
+    start = datetime.datetime(2014, 1, 1)
+    batch = []
+    for cycle in range(args.cycles):
+        timestamp = (start +
+                     datetime.timedelta(seconds=600 * cycle)).isoformat()
+        for resource_id in resources:
+            for name, type, unit, increment in METERS:
+                key = (name, resource_id)
+                if increment:
+                    volume = volumes.get(key, 0) + rand.randint(0, increment)
+                    volumes[key] = volume
+                else:
+                    volume = rand.randint(1, 100)
+                batch.append(sample.Sample(
+                    name=name,
+                    type=type,
+                    unit=unit,
+                    volume=volume,
+                    user_id='user',
+                    project_id='project',
+                    resource_id=resource_id,
+                    timestamp=timestamp,
+                    resource_metadata={'cpu_number': 2,
+                                       'flavor': {'name': 'm1.tiny'}},
+                    source='bench',
+                ))
+                if len(batch) == args.batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def percentile(values, percent):
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def main():
+    cfg.CONF([], project='ceilometer')
+
+    parser = argparse.ArgumentParser(
+        description='benchmark the sample pipelines',
+    )
+    parser.add_argument(
+        '--config',
+        default=DEFAULT_CONFIG,
+        help='The pipeline definition, its publishers are ignored.',
+    )
+    parser.add_argument(
+        '--extra-sources',
+        default=20,
+        type=int,
+        help='The number of wildcard sources added to the definition.',
+    )
+    parser.add_argument(
+        '--resources',
+        default=500,
+        type=int,
+        help='The number of resources polled at each cycle.',
+    )
+    parser.add_argument(
+        '--cycles',
+        default=10,
+        type=int,
+        help='The number of polling cycles.',
+    )
+    parser.add_argument(
+        '--batch-size',
+        default=100,
+        type=int,
+        help='The number of samples published at once.',
+    )
+    parser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='The seed of the synthetic volumes.',
+    )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Also print the statistics of the pipelines.',
+    )
+    args = parser.parse_args()
+
+    pipeline_manager = pipeline.PipelineManager(
+        load_pipeline_cfg(args.config, args.extra_sources),
+        transformer.TransformerExtensionManager('ceilometer.transformer'),
+    )
+    publishers = set(p for pipe in pipeline_manager.pipelines
+                     for p in pipe.publishers)
+
+    count = 0
+    published = 0
+    latencies = []
+    for batch in make_batches(args):
+        started = time.time()
+        with pipeline_manager.publisher(None) as p:
+            p(batch)
+        latencies.append(time.time() - started)
+        count += len(batch)
+        for publisher in publishers:
+            published += len(publisher.samples)
+            publisher.samples = []
+
+    latencies.sort()
+    elapsed = sum(latencies)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print('pipelines         %10d' % len(pipeline_manager.pipelines))
+    print('samples           %10d' % count)
+    print('published         %10d' % published)
+    print('samples/s         %10.0f' % (count / elapsed))
+    print('batch p50 (ms)    %10.3f' % (percentile(latencies, 50) * 1000))
+    print('batch p99 (ms)    %10.3f' % (percentile(latencies, 99) * 1000))
+    print('peak RSS (MB)     %10.1f' % peak_rss)
+    if args.stats:
+        print(json.dumps(pipeline_manager.stats(), indent=2, sort_keys=True))
+
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Micro-benchmark for the Sample class.
+
+Compares the memory footprint and the cost of creating and converting
+samples between the slotted Sample class and the previous __dict__
+based one, as seen in the polling path: most samples are created and
+converted to a dict, without ever being copied.
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import gc
+import sys
+import timeit
+import uuid
+
+from ceilometer import sample
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class LegacySample(object):
+    """The __dict__ based Sample, kept as a reference point."""
+
+    def __init__(self, name, type, unit, volume, user_id, project_id,
+                 resource_id, timestamp, resource_metadata, source=None):
+        self.name = name
+        self.type = type
+        self.unit = unit
+        self.volume = volume
+        self.user_id = user_id
+        self.project_id = project_id
+        self.resource_id = resource_id
+        self.timestamp = timestamp
+        self.resource_metadata = resource_metadata
+        self.source = source or 'openstack'
+        self.id = str(uuid.uuid1())
+
+    def as_dict(self):
+        return copy.copy(self.__dict__)
+
+
+def make_samples(cls, count):
+    metadata = {'host': 'compute-1'}
+    return [cls('cpu', sample.TYPE_CUMULATIVE, 'ns', i, 'user', 'project',
+                'resource-%d' % (i % 100), '2014-01-01T00:00:00', metadata,
+                'openstack')
+            for i in range(count)]
+
+
+def footprint(s):
+    """Return the bytes held by a sample, besides its shared values."""
+    size = sys.getsizeof(s)
+    if hasattr(s, '__dict__'):
+        size += sys.getsizeof(s.__dict__)
+    if s.__class__ is LegacySample or s._id is not None:
+        size += sys.getsizeof(s.id)
+    return size
+
+
+def allocations(cls, count):
+    """Return the number of memory blocks allocated per sample."""
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    samples = make_samples(cls, count)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff
+                 for stat in after.compare_to(before, 'filename'))
+    del samples
+    return float(blocks) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the Sample class',
+    )
+    parser.add_argument(
+        '--samples',
+        default=100000,
+        type=int,
+        help='The number of samples created per run.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=5,
+        type=int,
+        help='The number of runs, the best one is reported.',
+    )
+    args = parser.parse_args()
+
+    for label, cls in (('dict', LegacySample), ('slots', sample.Sample)):
+        samples = make_samples(cls, 1)
+
+        def create():
+            make_samples(cls, args.samples)
+
+        def convert():
+            for s in make_samples(cls, args.samples):
+                s.as_dict()
+
+        best_create = min(timeit.repeat(create, number=1,
+                                        repeat=args.repeat))
+        best_convert = min(timeit.repeat(convert, number=1,
+                                         repeat=args.repeat))
+        blocks = allocations(cls, args.samples)
+        print('%-6s %6d bytes/sample %8.3f us/create %8.3f us/create+dict'
+              % (label, footprint(samples[0]),
+                 best_create / args.samples * 1e6,
+                 best_convert / args.samples * 1e6), end='')
+        if blocks is not None:
+            print(' %6.1f blocks/sample' % blocks, end='')
+        print()
+
+    return 0
+
+if __name__ == '__main__':
+    main()
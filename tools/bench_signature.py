@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Micro-benchmark for the metering message signature schemes.
+
+Reports the number of messages signed and verified per second with each
+signature scheme version, one at a time and in batches, for messages
+shaped like the ones emitted by the compute agent.
+"""
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from ceilometer.publisher import utils
+from ceilometer import sample
+
+SECRET = 'change this or be hacked'
+
+
+def make_messages(count, version):
+    metadata = {
+        'display_name': 'server-1',
+        'host': 'compute-1',
+        'instance_type': 'm1.small',
+        'image_ref': 'b6d9ed10-5fa3-4b4e-9cc1-5d5f4a8d3e45',
+        'memory_mb': 2048,
+        'vcpus': 1,
+        'root_gb': 20,
+        'ephemeral_gb': 0,
+        'flavor': {'name': 'm1.small', 'ram': 2048, 'vcpus': 1,
+                   'disk': 20, 'ephemeral': 0},
+        'status': 'active',
+        'state': 'running',
+    }
+    messages = []
+    for i in range(count):
+        s = sample.Sample('cpu', sample.TYPE_CUMULATIVE, 'ns', i * 10 ** 9,
+                          'user', 'project', 'resource-%d' % i,
+                          '2014-01-01T00:00:00', metadata, 'openstack')
+        msg = utils.meter_message_from_counter(s, SECRET)
+        msg['message_signature'] = utils.compute_signature(msg, SECRET,
+                                                           version)
+        messages.append(msg)
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the metering message signatures',
+    )
+    parser.add_argument(
+        '--messages',
+        default=10000,
+        type=int,
+        help='The number of messages signed and verified per run.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=5,
+        type=int,
+        help='The number of runs, the best one is reported.',
+    )
+    args = parser.parse_args()
+
+    for version in sorted(utils._SIGNATURE_SCHEMES):
+        messages = make_messages(args.messages, version)
+
+        def sign():
+            for msg in messages:
+                utils.compute_signature(msg, SECRET, version)
+
+        def verify():
+            for msg in messages:
+                assert utils.verify_signature(msg, SECRET)
+
+        def verify_batch():
+            assert all(utils.verify_signatures(messages, SECRET))
+
+        best_sign = min(timeit.repeat(sign, number=1, repeat=args.repeat))
+        best_verify = min(timeit.repeat(verify, number=1,
+                                        repeat=args.repeat))
+        best_batch = min(timeit.repeat(verify_batch, number=1,
+                                       repeat=args.repeat))
+        print('v%d %10.0f signed/s %10.0f verified/s %10.0f batch verified/s'
+              % (version, args.messages / best_sign,
+                 args.messages / best_verify,
+                 args.messages / best_batch))
+
+    return 0
+
+if __name__ == '__main__':
+    main()